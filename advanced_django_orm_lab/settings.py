@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'silk.middleware.SilkyMiddleware',       
+    'api.middleware.QueryTelemetryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +59,9 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+# silk's middleware is sync only: under ASGI it puts every request on a thread
+if os.environ.get('DJANGO_SILK', '1') == '0':
+    MIDDLEWARE = [m for m in MIDDLEWARE if not m.startswith('silk.')]
 
 ROOT_URLCONF = 'advanced_django_orm_lab.urls'
 
@@ -87,6 +91,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # persistent connections: the async views query from a pool of threads
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -133,8 +140,12 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-CELERY_RESULT_BACKEND = "django-db"
-CELERY_RESULT_EXTENDED = True
+# results: ignored unless a task opts in (ignore_result=False), and then kept
+# in Redis for an hour instead of an extended django-db TaskResult row each
+CELERY_RESULT_BACKEND = "redis://redis:6379/2"
+CELERY_RESULT_EXTENDED = False
+CELERY_RESULT_EXPIRES = 60 * 60
+CELERY_TASK_IGNORE_RESULT = True
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 
 CELERY_BROKER_URL="redis://redis:6379"
@@ -142,11 +153,66 @@ CELERY_BROKER_URL="redis://redis:6379"
 
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        # django_redis with a per-process LRU in front (api/tiered_cache.py)
+        "BACKEND": "api.tiered_cache.TieredRedisCache",
         "LOCATION": "redis://redis:6379/1",
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
-            "SERIALIZER": "django_redis.serializers.json.JSONSerializer",
+            # JSON through orjson; bytes (cached response bodies) stored as they are
+            "SERIALIZER": "api.cache_serializers.OrjsonSerializer",
+            "LOCAL_MAX_ENTRIES": 500,   # per process
+            "LOCAL_TIMEOUT": 30,        # seconds; bounds staleness if an invalidation is lost
         }
     }
 }
+
+# JSON in and out through orjson (api/renderers.py, api/parsers.py); stdlib without it
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "api.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+}
+
+
+# api
+CURRICULUM_REBUILD_DELAY = 5          # seconds of edits collapsed into one curriculum rebuild
+LESSON_NAVIGATION_INDEX = False       # serve prev/next from a cached per-course index
+ORDER_BATCH_LIMIT = 5000              # items accepted by POST /api/orders/bulk/
+ASYNC_QUERY_THREADS = 32              # worker threads (and DB connections) for the async views' queries
+
+# payments (api/payments.py)
+PAYMENT_BATCHING = False              # charge reserved orders in batches instead of one task per order
+PAYMENT_GATEWAY = 'api.payments.FakeGateway'
+PAYMENT_GATEWAY_OPTIONS = {'latency': 0.2, 'failure_rate': 0.3}
+PAYMENT_BATCH_SIZE = 200
+PAYMENT_CONCURRENCY = 16              # gateway calls in flight per batch
+PAYMENT_RATE_LIMIT = 0                # charges per second per worker, 0 = unlimited
+PAYMENT_MAX_ATTEMPTS = 5
+PAYMENT_RETRY_DELAY = 10              # seconds before a timed out charge is tried again
+PAYMENT_CLAIM_TIMEOUT = 300           # orders stuck in "charging" this long are requeued
+
+OUTBOX_BATCH_SIZE = 500               # messages published per relay transaction
+ORDER_EVENT_BATCH_SIZE = 200          # buffered order events per INSERT (api/events.py)
+ORDER_EVENT_FLUSH_INTERVAL = 1.0      # seconds a buffered event may wait before it is written
+
+# enrollment progress write-behind (api/progress.py)
+PROGRESS_FLUSH_INTERVAL = 5.0         # max seconds Enrollment.progress in the DB lags the last report
+PROGRESS_FLUSH_BATCH_SIZE = 500       # enrollments per SELECT and bulk_update (under 1000 on SQLite)
+
+# trending courses (api/trending.py)
+TRENDING_WEIGHTS = {'enrollment': 5, 'view': 1}   # score per event
+TRENDING_REFRESH = 10                 # seconds a merged window is reused before it is recomputed
+TRENDING_MAX_LIMIT = 50               # largest ?limit= on /api/courses/trending/
+
+CELERY_BEAT_SCHEDULE = {
+    'charge-reserved-orders': {'task': 'api.tasks.charge_reserved_orders', 'schedule': 2.0},
+    'relay-outbox': {'task': 'api.tasks.relay_outbox', 'schedule': 1.0},
+    'flush-progress-buffer': {'task': 'api.tasks.flush_progress_buffer', 'schedule': PROGRESS_FLUSH_INTERVAL},
+    'reconcile-trending': {'task': 'api.tasks.reconcile_trending', 'schedule': 60 * 60},
+}
@@ -0,0 +1,240 @@
+"""
+Async (ASGI) versions of the catalog read endpoints, under /api/async/.
+
+Same URLs, JSON and headers as their views in `api/views.py`, but a request
+waits on the network without holding a thread, and queries that don't depend
+on each other run at the same time:
+
+* AsyncLessonDetails - the lesson and its prev/next (LAG/LEAD) scan;
+* AsyncCourseCurriculum - the course row and its module/lesson tree, and the
+  trending view counter next to both;
+* AsyncCoursesDetails - the course and its trending view counter.
+
+Django 4.2's async ORM (`aget`, `async for`) runs each query through
+`sync_to_async` on the request's one thread-sensitive thread, so a request's
+queries still run one after the other. Queries here go through `in_thread()`
+instead: a pool of ASYNC_QUERY_THREADS workers, each with its own database
+connection (keep CONN_MAX_AGE on, or every call connects). Cache reads take
+the cache's async API, which `TieredRedisCache` answers from process memory or
+`redis.asyncio` without a thread (`api/tiered_cache.py`).
+
+The version stamp is still read before anything it versions (see
+`api/conditional.py`), so only what comes after it runs concurrently.
+
+DRF's APIView has no async handlers: these are plain Django views that answer
+JSON only. Paginated and streamed course lists go to the sync view in a thread.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.views import View
+from rest_framework.exceptions import ValidationError
+
+from . import trending
+from .budgets import query_budget
+from .caching import CATALOG, aget_or_build, course_scope
+from .conditional import course_stamp, curriculum_stamp, curriculum_stamps, etag, not_modified, stamped
+from .curriculum import modules_queryset, schedule_curriculum_rebuild
+from .models import Course, Lesson
+from .navigation import get_navigation_index, lesson_neighbours, navigation_index_enabled, neighbours
+from .projections import CourseProjection
+from .renderers import ORJSONRenderer, dumps
+from .response_cache import acached_response
+from .serializers import CourseSerializer, LessonSerializer, ModuleCurriculumSerializer
+from .streaming import requested_stream_format
+from .views import ListCourses, fields_cache_key, requested_fields
+
+_executor = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'ASYNC_QUERY_THREADS', 32), thread_name_prefix='async-query',
+        )
+    return _executor
+
+
+def _run(func, *args, **kwargs):
+    # what request_started/request_finished do for a sync request
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def in_thread(func):
+    """`func` as a coroutine function, run on a query worker thread."""
+    return sync_to_async(functools.partial(_run, func), thread_sensitive=False, executor=_pool())
+
+
+async def concurrently(*funcs):
+    """Run the sync callables on worker threads at once; their results in order."""
+    return await asyncio.gather(*(in_thread(func)() for func in funcs))
+
+
+class AsyncAPIView(View):
+    """JSON in the shape DRF gives, errors included."""
+    renderer = ORJSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        # requested_fields() and the paginators read DRF's name for GET
+        request.query_params = request.GET
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except ValidationError as exc:
+            return self.json(exc.detail, status=400)
+        except Http404 as exc:
+            # as DRF's exception handler words it
+            return self.json({'detail': exc.args[0] if exc.args else 'Not found.'}, status=404)
+
+    def json(self, data, status=200):
+        return HttpResponse(dumps(data), content_type=self.renderer.media_type, status=status)
+
+
+@query_budget(ListCourses.query_budget)
+class AsyncListCourses(AsyncAPIView):
+
+    async def get(self, request):
+        if ListCourses.pagination_class().is_requested(request) or requested_stream_format(request):
+            # one query either way, nothing to overlap; Django renders the
+            # page and reads a streamed body in a thread
+            return await in_thread(ListCourses.as_view())(request)
+
+        fields = requested_fields(request, CourseSerializer.Meta.fields)
+        key = fields_cache_key("courses:list:v2", fields, CourseSerializer.Meta.fields)
+
+        def build():
+            # only on a miss: a hit shouldn't pay for setting up the query
+            projection = CourseProjection(fields)
+            return projection.many(
+                projection.queryset(Course.objects.all(), extra_lookups=ListCourses.pagination_class.ordering)
+            )
+
+        return await acached_response(
+            request, key, build, self.renderer, timeout=60 * 10, scopes=[CATALOG], thread=in_thread,
+        )
+
+
+# version stamp, then the build next to the view counter
+@query_budget(2)
+class AsyncCoursesDetails(AsyncAPIView):
+
+    async def get(self, request, slug):
+        fields = requested_fields(request, CourseSerializer.Meta.fields)
+        key = fields_cache_key(f"courses:details:{slug}", fields, CourseSerializer.Meta.fields)
+        stamp = await in_thread(course_stamp)(slug)
+        if stamp is not None:
+            tag = etag(stamp, fields)
+            response = not_modified(request, stamp, tag)
+            if response is not None:
+                await in_thread(trending.record_view)(slug)
+                return response
+            key = f"{key}:v{stamp.version}"
+
+        async def build():
+            queryset = CourseSerializer.optimize_queryset(Course.objects.filter(id=slug), fields)
+            return await in_thread(lambda: CourseSerializer(queryset, many=True, fields=fields).data)()
+
+        if stamp is not None:
+            # the stamp says the course exists: count the view while the body loads
+            data, _ = await asyncio.gather(
+                aget_or_build(key, build, scopes=[course_scope(slug)]),
+                in_thread(trending.record_view)(slug),
+            )
+        else:
+            data = await aget_or_build(key, build, scopes=[course_scope(slug)])
+            if data:
+                await in_thread(trending.record_view)(slug)
+        response = self.json(data)
+        return stamped(response, stamp, tag) if stamp is not None else response
+
+
+# version stamp + 1 for the lesson, next to 1 for its neighbours
+@query_budget(3)
+class AsyncLessonDetails(AsyncAPIView):
+
+    async def get(self, request, id):
+        fields = requested_fields(request, LessonSerializer.Meta.fields)
+        stamp = await in_thread(curriculum_stamp)(course__modules__lessons=id)
+        if stamp is None:
+            raise Http404
+        tag = etag(stamp, fields)
+        response = not_modified(request, stamp, tag)
+        if response is not None:
+            return response
+
+        queryset = LessonSerializer.optimize_queryset(Lesson.objects.all(), fields)
+        navigation = {'previous_lesson', 'next_lesson'} & set(fields)
+
+        def lesson():
+            return queryset.filter(id=id).first()
+
+        def adjacent():
+            if not navigation:
+                return None, None
+            if navigation_index_enabled():
+                # cached per course: the stamp already named the course
+                return neighbours(get_navigation_index(stamp.course_id), id)
+            return lesson_neighbours(id)
+
+        lesson, (previous_lesson, next_lesson) = await concurrently(lesson, adjacent)
+        if lesson is None:
+            raise Http404
+        serializer = LessonSerializer(
+            lesson, fields=fields, context={'previous_lesson': previous_lesson, 'next_lesson': next_lesson},
+        )
+        return stamped(self.json(serializer.data), stamp, tag)
+
+
+# 1 when the document exists or the client's copy is current; + course and tree otherwise
+@query_budget(5)
+class AsyncCourseCurriculum(AsyncAPIView):
+
+    async def get(self, request, slug):
+        tree, document, body = await in_thread(curriculum_stamps)(slug)
+        if tree is None:
+            course_id = await in_thread(get_object_or_404)(Course.objects.values_list('id', flat=True), slug=slug)
+        else:
+            course_id = tree.course_id
+
+        stamp = document or tree
+        if stamp is not None:
+            tag = etag(stamp)
+            response = not_modified(request, stamp, tag)
+            if response is not None:
+                await in_thread(trending.record_view)(course_id)
+                return response
+
+        if document is not None:
+            await in_thread(trending.record_view)(course_id)
+            return stamped(HttpResponse(body, content_type='application/json'), stamp, tag)
+
+        async def build():
+            # the course row and its modules/lessons don't wait on each other
+            course, modules = await concurrently(
+                lambda: Course.objects.filter(pk=course_id).values('id', 'title').first(),
+                lambda: ModuleCurriculumSerializer(modules_queryset().filter(course_id=course_id), many=True).data,
+            )
+            if course is None:
+                raise Http404
+            return {**course, 'modules': modules}
+
+        key = f"courses:curriculum:{slug}"
+        data, _ = await asyncio.gather(
+            aget_or_build(
+                f"{key}:v{stamp.version}" if stamp is not None else key, build, scopes=[course_scope(course_id)],
+            ),
+            # no document yet: have one built for next time
+            in_thread(lambda: (trending.record_view(course_id), schedule_curriculum_rebuild(course_id)))(),
+        )
+        response = self.json(data)
+        return stamped(response, stamp, tag) if stamp is not None else response
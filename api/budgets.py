@@ -0,0 +1,21 @@
+"""
+Per-endpoint query budgets.
+
+    @query_budget(1)
+    class ListCourses(APIView): ...
+
+The budget is the most queries one request may run, whatever the data size.
+`api/tests.py` checks every budgeted view against datasets of growing size,
+and `QueryTelemetryMiddleware` logs requests that go over it in production.
+"""
+
+
+def query_budget(max_queries):
+    def decorator(view_class):
+        view_class.query_budget = max_queries
+        return view_class
+    return decorator
+
+
+def get_query_budget(view_class):
+    return getattr(view_class, 'query_budget', None)
@@ -0,0 +1,59 @@
+"""
+django_redis serializers for the cache values that aren't response bodies.
+
+    'OPTIONS': {'SERIALIZER': 'api.cache_serializers.OrjsonSerializer'}
+
+* `OrjsonSerializer` - the same JSON as django_redis's `JSONSerializer`
+  (Decimal, datetime and lazy strings go through `DjangoJSONEncoder`), encoded
+  and decoded by orjson. Non-string dict keys become strings, as with `json`.
+* `MsgpackSerializer` - smaller payloads and native bytes; needs `msgpack`.
+  Unlike JSON it keeps int dict keys and tuples come back as lists.
+
+Both store `bytes` values as they are, behind a one-byte marker, so
+pre-rendered response bodies (`api/response_cache.py`) are read back without
+any decoding.
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+from django_redis.serializers.base import BaseSerializer
+
+try:
+    import orjson
+except ImportError:  # OrjsonSerializer is unavailable without it
+    orjson = None
+
+# never the first byte of JSON, nor of msgpack for anything but the int 0 -
+# and django_redis stores ints without a serializer
+RAW = b'\x00'
+
+_encoder = DjangoJSONEncoder()
+
+
+class OrjsonSerializer(BaseSerializer):
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def dumps(self, value):
+        if isinstance(value, bytes):
+            return RAW + value
+        return orjson.dumps(value, default=_encoder.default, option=self.options)
+
+    def loads(self, value):
+        if value[:1] == RAW:
+            return value[1:]
+        return orjson.loads(value)
+
+
+class MsgpackSerializer(BaseSerializer):
+
+    def __init__(self, options):
+        import msgpack
+        self.msgpack = msgpack
+
+    def dumps(self, value):
+        if isinstance(value, bytes):
+            return RAW + value
+        return self.msgpack.packb(value, default=_encoder.default, use_bin_type=True)
+
+    def loads(self, value):
+        if value[:1] == RAW:
+            return value[1:]
+        return self.msgpack.unpackb(value, raw=False, strict_map_key=False)
@@ -0,0 +1,202 @@
+"""
+Generation-keyed cache with stampede protection.
+
+Every cached value is stored under `<key>:<generation>` where the generation
+comes from one or more *scopes* (`catalog`, `course:<id>`). Writes bump the
+scope generation (see `api/signals.py`), so new reads miss and old entries
+simply age out - nothing has to find and delete them.
+
+On a miss only the worker holding `lock:<key>` recomputes; the others keep
+serving the last value written for the key (`<key>:stale`) until the new one
+lands. The lock holds a token unique to its holder, and only the holder
+deletes it: a build that outlives LOCK_TIMEOUT doesn't release the lock of
+the worker that took it over. Entries close to expiry are refreshed early with probability that grows
+as expiry approaches (XFetch), so hot keys rarely expire at all.
+
+`aget_or_build` is the same for `api/async_views.py`, with an async builder
+and the cache's async API.
+"""
+import asyncio
+import math
+import random
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+CATALOG = 'catalog'
+
+DEFAULT_TIMEOUT = 60 * 10
+LOCK_TIMEOUT = 30
+STALE_FACTOR = 6
+WAIT_STEP = 0.05
+WAIT_ATTEMPTS = 20
+
+
+def course_scope(course_id):
+    return f'course:{course_id}'
+
+
+def _generation_key(scope):
+    return f'gen:{scope}'
+
+
+def get_generation(*scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    generations = []
+    for key in keys:
+        value = found.get(key)
+        if value is None:
+            # Start from the clock rather than 1: if the generation key is ever
+            # evicted, the new one can't collide with entries written under
+            # the old numbering.
+            value = int(time.time() * 1000)
+            if not cache.add(key, value, timeout=None):
+                value = cache.get(key, value)
+        generations.append(str(value))
+    return '.'.join(generations)
+
+
+async def aget_generation(*scopes):
+    """The generation, or None if a scope has none yet (`get_generation` starts it)."""
+    keys = [_generation_key(scope) for scope in scopes]
+    found = await cache.aget_many(keys)
+    if len(found) != len(keys):
+        return None
+    return '.'.join(str(found[key]) for key in keys)
+
+
+def bump_generation(*scopes):
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(time.time() * 1000), timeout=None)
+
+
+def reset_generation(*scopes):
+    """Forget the generations in one round trip; the next read restarts them from the clock."""
+    cache.delete_many([_generation_key(scope) for scope in scopes])
+
+
+def invalidate_on_commit(*scopes):
+    """Bump after the surrounding transaction commits, never before.
+
+    Bumping inside the transaction would let a concurrent reader rebuild from
+    the old rows and store them under the new generation.
+    """
+    scopes = tuple(scope for scope in scopes if scope)
+    if scopes:
+        transaction.on_commit(lambda: bump_generation(*scopes))
+
+
+def _should_refresh_early(entry, beta):
+    # XFetch: now - delta * beta * ln(rand) >= expiry
+    delta = entry.get('d', 0)
+    if delta <= 0 or beta <= 0:
+        return False
+    return time.time() - delta * beta * math.log(random.random() or 1e-12) >= entry['x']
+
+
+def acquire_lock(lock_key, timeout=LOCK_TIMEOUT):
+    """A token if the lock was free (pass it to `release_lock`), else None."""
+    token = uuid.uuid4().hex
+    return token if cache.add(lock_key, token, timeout) else None
+
+
+def release_lock(lock_key, token):
+    # after LOCK_TIMEOUT the lock may belong to another worker: leave it alone
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+async def aacquire_lock(lock_key):
+    token = uuid.uuid4().hex
+    return token if await cache.aadd(lock_key, token, LOCK_TIMEOUT) else None
+
+
+async def arelease_lock(lock_key, token):
+    if await cache.aget(lock_key) == token:
+        await cache.adelete(lock_key)
+
+
+def get_or_build(key, builder, timeout=DEFAULT_TIMEOUT, scopes=(CATALOG,), beta=1.0):
+    """Return the cached value for `key`, building it with `builder()` at most once per miss."""
+    versioned_key = f'{key}:{get_generation(*scopes)}'
+    entry = cache.get(versioned_key)
+    if entry is not None and not _should_refresh_early(entry, beta):
+        return entry['v']
+
+    lock_key = f'lock:{key}'
+    token = acquire_lock(lock_key)
+    if token:
+        try:
+            return _build(key, versioned_key, builder, timeout)
+        finally:
+            release_lock(lock_key, token)
+
+    # Another worker is rebuilding: serve what we have.
+    if entry is not None:
+        return entry['v']
+    stale = cache.get(f'{key}:stale')
+    if stale is not None:
+        return stale['v']
+
+    # Cold start, nothing to fall back to - wait briefly for the winner.
+    for _ in range(WAIT_ATTEMPTS):
+        time.sleep(WAIT_STEP)
+        entry = cache.get(versioned_key)
+        if entry is not None:
+            return entry['v']
+    return builder()
+
+
+async def aget_or_build(key, builder, timeout=DEFAULT_TIMEOUT, scopes=(CATALOG,), beta=1.0):
+    """`get_or_build` for async code: `builder` is a coroutine function."""
+    generation = await aget_generation(*scopes)
+    if generation is None:
+        generation = await sync_to_async(get_generation)(*scopes)
+    versioned_key = f'{key}:{generation}'
+    entry = await cache.aget(versioned_key)
+    if entry is not None and not _should_refresh_early(entry, beta):
+        return entry['v']
+
+    lock_key = f'lock:{key}'
+    token = await aacquire_lock(lock_key)
+    if token:
+        try:
+            started = time.time()
+            value = await builder()
+            finished = time.time()
+            entry = {'v': value, 'x': finished + timeout, 'd': finished - started}
+            await cache.aset(versioned_key, entry, timeout=timeout)
+            await cache.aset(f'{key}:stale', entry, timeout=timeout * STALE_FACTOR)
+            return value
+        finally:
+            await arelease_lock(lock_key, token)
+
+    if entry is not None:
+        return entry['v']
+    stale = await cache.aget(f'{key}:stale')
+    if stale is not None:
+        return stale['v']
+    for _ in range(WAIT_ATTEMPTS):
+        await asyncio.sleep(WAIT_STEP)
+        entry = await cache.aget(versioned_key)
+        if entry is not None:
+            return entry['v']
+    return await builder()
+
+
+def _build(key, versioned_key, builder, timeout):
+    started = time.time()
+    value = builder()
+    finished = time.time()
+    entry = {'v': value, 'x': finished + timeout, 'd': finished - started}
+    cache.set(versioned_key, entry, timeout=timeout)
+    cache.set(f'{key}:stale', entry, timeout=timeout * STALE_FACTOR)
+    return value
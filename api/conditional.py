@@ -0,0 +1,91 @@
+"""
+Conditional GET (ETag / Last-Modified) for the course endpoints.
+
+Every course carries version stamps on its `CourseStats` row, bumped in the
+same transaction as the write (see `touch_courses` in `api/stats.py`):
+
+* `version` / `updated_at` - anything `CoursesDetails` shows, counters included;
+* `curriculum_version` / `curriculum_updated_at` - the module/lesson/resource
+  tree, which is all `CourseCurriculum` and `LessonDetails` show.
+
+A stored curriculum document carries the `curriculum_version` it was built
+from, since it can lag the tree by the rebuild delay.
+
+A view reads the stamp first - one lookup by primary or unique key - and
+answers a matching `If-None-Match` / `If-Modified-Since` with a 304 before any
+prefetch or serialization. Otherwise it builds the body as usual and sends the
+stamp with it. Reading the stamp before the data means a body can only be
+newer than its ETag, never older: a racing write costs one extra download,
+not a stale copy kept forever.
+
+ETags are weak (the same data may be rendered with different whitespace) and
+carry the course id, the version and the `?fields=` selection. Last-Modified
+has HTTP's one-second resolution, so clients should prefer the ETag.
+"""
+import zlib
+from collections import namedtuple
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import CourseStats
+
+Stamp = namedtuple('Stamp', ['course_id', 'version', 'modified'])
+
+
+def _stamp(row):
+    return Stamp(*row) if row is not None else None
+
+
+def course_stamp(course_id):
+    return _stamp(
+        CourseStats.objects.filter(course_id=course_id).values_list('course_id', 'version', 'updated_at').first()
+    )
+
+
+def curriculum_stamp(**lookup):
+    """By `course_id=` or `course__modules__lessons=` (a lesson id)."""
+    return _stamp(
+        CourseStats.objects.filter(**lookup)
+        .values_list('course_id', 'curriculum_version', 'curriculum_updated_at').first()
+    )
+
+
+def curriculum_stamps(slug):
+    """
+    (tree stamp, document stamp, document body) of the course at `slug`, in
+    one query. The stored body rides along so that serving it stays a single
+    query; the document stamp and body are None until it is built, and all
+    three for an unknown slug.
+    """
+    row = CourseStats.objects.filter(course__slug=slug).values_list(
+        'course_id', 'curriculum_version', 'curriculum_updated_at',
+        'course__curriculum_document__version', 'course__curriculum_document__built_at',
+        'course__curriculum_document__body',
+    ).first()
+    if row is None:
+        return None, None, None
+    course_id, version, modified, document_version, built_at, body = row
+    tree = Stamp(course_id, version, modified)
+    if document_version is None:
+        return tree, None, None
+    return tree, Stamp(course_id, document_version, built_at), bytes(body)
+
+
+def etag(stamp, fields=None):
+    tag = f'{stamp.course_id}-{stamp.version}'
+    if fields is not None:
+        tag += f"-{zlib.crc32(','.join(fields).encode()):08x}"
+    return f'W/"{tag}"'
+
+
+def not_modified(request, stamp, tag):
+    """The 304 for `request` if the client's copy is current, else None."""
+    response = get_conditional_response(request, etag=tag, last_modified=int(stamp.modified.timestamp()))
+    return stamped(response, stamp, tag) if response is not None else None
+
+
+def stamped(response, stamp, tag):
+    response['ETag'] = tag
+    response['Last-Modified'] = http_date(stamp.modified.timestamp())
+    return response
@@ -0,0 +1,76 @@
+"""
+Materialized curriculum documents.
+
+The nested Course -> Modules -> Lessons tree changes rarely and is read
+constantly, so it is rendered once to JSON bytes and stored in
+`CurriculumDocument`. `CourseCurriculum` serves those bytes as-is; writes to a
+Module/Lesson/Resource schedule a debounced rebuild through Celery.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Prefetch
+
+from .models import Course, CourseStats, CurriculumDocument, Lesson, Module
+from .renderers import dumps
+from .serializers import CourseCurriculumSerializer
+
+
+def rebuild_delay():
+    # seconds a burst of edits is collapsed into one rebuild
+    return getattr(settings, 'CURRICULUM_REBUILD_DELAY', 5)
+
+
+def modules_queryset():
+    """Modules with their lessons (and resource counts), as the curriculum shows them."""
+    lessons_qs = Lesson.objects.annotate(
+        resources_count=Count('resources', distinct=True)
+    )
+
+    return Module.objects.prefetch_related(
+        Prefetch('lessons', queryset=lessons_qs)
+    )
+
+
+def curriculum_queryset():
+    return Course.objects.prefetch_related(
+        Prefetch('modules', queryset=modules_queryset())
+    )
+
+
+def render_curriculum(course):
+    return dumps(CourseCurriculumSerializer(course).data)
+
+
+def build_curriculum_document(course_id):
+    # the stamp is read before the tree: an edit landing in between gives a
+    # document newer than its version (refetched once), never the reverse
+    version = CourseStats.objects.filter(course_id=course_id).values_list('curriculum_version', flat=True).first()
+    course = curriculum_queryset().filter(pk=course_id).first()
+    if course is None:
+        return None
+
+    # a renamed course may have handed its old slug to another course
+    CurriculumDocument.objects.filter(slug=course.slug).exclude(course_id=course.pk).delete()
+    document = CurriculumDocument(
+        course_id=course.pk, slug=course.slug, body=render_curriculum(course), version=version or 0,
+    )
+    CurriculumDocument.objects.bulk_create(
+        [document], update_conflicts=True,
+        unique_fields=['course'], update_fields=['slug', 'body', 'built_at', 'version'],
+    )
+    return document
+
+
+def pending_key(course_id):
+    return f'curriculum:pending:{course_id}'
+
+
+def schedule_curriculum_rebuild(course_id):
+    """Queue a rebuild unless one is already waiting for this course."""
+    from .tasks import build_curriculum
+
+    delay = rebuild_delay()
+    # The task clears the flag before it reads, so edits that land while it
+    # runs queue a fresh build instead of being lost.
+    if cache.add(pending_key(course_id), 1, timeout=delay * 10):
+        build_curriculum.apply_async((course_id,), countdown=delay)
@@ -0,0 +1,80 @@
+"""
+Append-only order event log.
+
+The audit trail of the order workflow, in place of one extended TaskResult
+row per task. Two ways in:
+
+* `record(pairs)` / `record_many(order_ids, kind)` - one INSERT inside the caller's transaction,
+  for the batch paths (bulk intake, batch charging, bulk shipping).
+* `emit(order_id, kind)` - per-order steps. Events are buffered in the worker
+  process after their transaction commits and written with a single
+  bulk_create once ORDER_EVENT_BATCH_SIZE are waiting, or
+  ORDER_EVENT_FLUSH_INTERVAL seconds after the first one, whichever comes
+  first. `flush()` runs on worker shutdown; a hard kill can lose at most one
+  interval of buffered events.
+"""
+import threading
+
+from celery.signals import worker_process_shutdown, worker_shutdown
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import OrderEvent
+
+_lock = threading.Lock()
+_buffer = []
+_timer = None
+
+
+def record(pairs):
+    """One INSERT for every (order_id, kind) pair."""
+    OrderEvent.objects.bulk_create([OrderEvent(order_id=order_id, kind=kind) for order_id, kind in pairs])
+
+
+def record_many(order_ids, kind):
+    record((order_id, kind) for order_id in order_ids)
+
+
+def emit(order_id, kind):
+    transaction.on_commit(lambda: _append(order_id, kind))
+
+
+def _append(order_id, kind):
+    global _timer
+    with _lock:
+        _buffer.append(OrderEvent(order_id=order_id, kind=kind))
+        full = len(_buffer) >= settings.ORDER_EVENT_BATCH_SIZE
+        if not full and _timer is None and settings.ORDER_EVENT_FLUSH_INTERVAL:
+            _timer = threading.Timer(settings.ORDER_EVENT_FLUSH_INTERVAL, _flush_from_timer)
+            _timer.daemon = True
+            _timer.start()
+    if full:
+        flush()
+
+
+def flush():
+    """Write whatever is buffered; returns the number of events written."""
+    global _timer
+    with _lock:
+        pending = _buffer[:]
+        _buffer.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if pending:
+        OrderEvent.objects.bulk_create(pending)
+    return len(pending)
+
+
+def _flush_from_timer():
+    try:
+        flush()
+    finally:
+        # the timer thread's own connection
+        connection.close()
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def _flush_on_shutdown(**kwargs):
+    flush()
@@ -0,0 +1,175 @@
+"""
+Stock reservation without row locks.
+
+A reservation is one guarded UPDATE:
+
+    UPDATE api_product SET stock = stock - q WHERE id = ? AND stock >= q
+
+The database applies it atomically, so two buyers can never both take the
+last unit, and nobody waits on a `select_for_update()` held across the rest
+of a transaction. The only serialization left is the row write itself.
+
+For products hot enough that even that becomes the bottleneck (flash sales),
+`set_stock_shards(product_id, n)` moves the stock into n ProductStockShard
+rows. Reservations start at a random shard and try the next one when it is
+short, so concurrent buyers mostly write different rows.
+"""
+import random
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+
+from .models import Product, ProductStockShard
+
+
+# products per multi-row reservation statement (two parameters each)
+RESERVE_CHUNK = 400
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def reserve(product_id, quantity):
+    """Take `quantity` units; False (and nothing taken) when there isn't enough."""
+    taken = Product.objects.filter(id=product_id, stock_shards=0, stock__gte=quantity).update(
+        stock=F('stock') - quantity,
+    )
+    if taken:
+        return True
+    shards = Product.objects.filter(id=product_id).values_list('stock_shards', flat=True).first()
+    if not shards:
+        return False
+    return _reserve_from_shards(product_id, quantity, shards)
+
+
+def _reserve_from_shards(product_id, quantity, shards):
+    start = random.randrange(shards)
+    for step in range(shards):
+        taken = ProductStockShard.objects.filter(
+            product_id=product_id, shard=(start + step) % shards, stock__gte=quantity,
+        ).update(stock=F('stock') - quantity)
+        if taken:
+            return True
+
+    # no single shard has enough, but together they might: near sell-out
+    # only, so locking all of them here is fine
+    with transaction.atomic():
+        rows = list(
+            ProductStockShard.objects.select_for_update()
+            .filter(product_id=product_id, stock__gt=0).order_by('shard')
+        )
+        if sum(row.stock for row in rows) < quantity:
+            return False
+        remaining = quantity
+        for row in rows:
+            take = min(row.stock, remaining)
+            row.stock -= take
+            remaining -= take
+            if not remaining:
+                break
+        ProductStockShard.objects.bulk_update(rows, ['stock'])
+    return True
+
+
+def reserve_many(quantities):
+    """
+    {product_id: quantity} -> set of product ids whose whole quantity was
+    taken. Products are independent: one being short doesn't stop the others.
+
+    Where the database has UPDATE ... RETURNING (Postgres, SQLite 3.35+) every
+    unsharded product is reserved by one statement per RESERVE_CHUNK products.
+    """
+    if not _can_update_returning():
+        return {product_id for product_id, quantity in quantities.items() if reserve(product_id, quantity)}
+
+    reserved = set()
+    items = list(quantities.items())
+    for start in range(0, len(items), RESERVE_CHUNK):
+        reserved.update(_reserve_returning(items[start:start + RESERVE_CHUNK]))
+
+    missed = [product_id for product_id in quantities if product_id not in reserved]
+    if missed:
+        sharded = Product.objects.filter(id__in=missed, stock_shards__gt=0).values_list('id', 'stock_shards')
+        for product_id, shards in sharded:
+            if _reserve_from_shards(product_id, quantities[product_id], shards):
+                reserved.add(product_id)
+    return reserved
+
+
+def _can_update_returning():
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def _reserve_returning(items):
+    quote = connection.ops.quote_name
+    table = quote(Product._meta.db_table)
+    values = ', '.join(['(%s, %s)'] * len(items))
+    # VALUES columns are column1, column2... on both Postgres and SQLite
+    sql = (
+        f'UPDATE {table} SET {quote("stock")} = {table}.{quote("stock")} - v.qty '
+        f'FROM (SELECT column1 AS id, column2 AS qty FROM (VALUES {values}) AS t) AS v '
+        f'WHERE {table}.{quote("id")} = v.id AND {table}.{quote("stock_shards")} = 0 '
+        f'AND {table}.{quote("stock")} >= v.qty '
+        f'RETURNING {table}.{quote("id")}'
+    )
+    params = [value for item in items for value in item]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def release(product_id, quantity):
+    """Give back units taken by `reserve` (cancelled or failed orders)."""
+    shards = Product.objects.filter(id=product_id).values_list('stock_shards', flat=True).first()
+    if shards:
+        ProductStockShard.objects.filter(product_id=product_id, shard=random.randrange(shards)).update(
+            stock=F('stock') + quantity,
+        )
+    else:
+        Product.objects.filter(id=product_id).update(stock=F('stock') + quantity)
+
+
+def available_stock(product_id):
+    product = Product.objects.only('stock', 'stock_shards').get(id=product_id)
+    if not product.stock_shards:
+        return product.stock
+    return ProductStockShard.objects.filter(product_id=product_id).aggregate(total=Sum('stock'))['total'] or 0
+
+
+def stock_levels(product_ids):
+    """{product_id: units available}; unknown products are left out."""
+    levels, sharded = {}, []
+    for product_id, stock, shards in Product.objects.filter(id__in=product_ids).values_list('id', 'stock', 'stock_shards'):
+        levels[product_id] = stock
+        if shards:
+            sharded.append(product_id)
+    if sharded:
+        totals = (
+            ProductStockShard.objects.filter(product_id__in=sharded)
+            .values_list('product_id').annotate(total=Sum('stock')).order_by()
+        )
+        levels.update(totals)
+    return levels
+
+
+def set_stock_shards(product_id, shards):
+    """
+    Spread the product's stock over `shards` rows (0 puts it back in
+    Product.stock). Takes the product row lock: an admin operation, not
+    something to run in the middle of a sale.
+    """
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(id=product_id)
+        rows = ProductStockShard.objects.filter(product_id=product_id)
+        total = product.stock + (rows.aggregate(total=Sum('stock'))['total'] or 0)
+        rows.delete()
+
+        if shards:
+            per_shard, extra = divmod(total, shards)
+            ProductStockShard.objects.bulk_create([
+                ProductStockShard(product_id=product_id, shard=n, stock=per_shard + (n < extra))
+                for n in range(shards)
+            ])
+            total = 0
+        Product.objects.filter(id=product_id).update(stock=total, stock_shards=shards)
@@ -0,0 +1,146 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Course, Lesson
+
+# endpoint -> path below a target's prefix, for one sample course
+ENDPOINTS = {
+    'courses': lambda course, lesson: 'courses/',
+    'course details': lambda course, lesson: f'courses/{course.pk}/curriculum/',
+    'curriculum': lambda course, lesson: f'courses/{course.slug}/',
+    'lesson': lambda course, lesson: f'lessons/{lesson}/',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test running servers over HTTP/1.1 keep-alive: requests per second and latency percentiles, '
+        'e.g. --target wsgi=http://127.0.0.1:8000/api/ --target asgi=http://127.0.0.1:8001/api/async/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                            help='a server and the prefix of its catalog endpoints; repeat to compare')
+        parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS), help='default: all')
+        parser.add_argument('--concurrency', type=int, default=100, help='connections kept open at once')
+        parser.add_argument('--requests', type=int, default=5000, help='per endpoint and target')
+        parser.add_argument('--warmup', type=int, default=500, help='requests sent first and not measured')
+        parser.add_argument('--spread', type=int, default=50, help='courses the requests are spread over')
+
+    def handle(self, *args, **options):
+        targets = []
+        for value in options['target']:
+            name, _, url = value.partition('=')
+            if not url:
+                raise CommandError(f'--target {value}: expected NAME=URL')
+            targets.append((name, url if url.endswith('/') else url + '/'))
+        samples = self.samples(options['spread'])
+
+        self.stdout.write(
+            f"{'endpoint':<16}{'target':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+            f"{'max ms':>10}{'errors':>8}"
+        )
+        for endpoint in options['endpoint'] or list(ENDPOINTS):
+            paths = [ENDPOINTS[endpoint](course, lesson) for course, lesson in samples]
+            for name, prefix in targets:
+                urls = [prefix + path for path in paths]
+                asyncio.run(load(urls, options['warmup'], options['concurrency']))
+                result = asyncio.run(load(urls, options['requests'], options['concurrency']))
+                self.report(endpoint, name, result)
+
+    def samples(self, spread):
+        courses = list(Course.objects.filter(modules__lessons__isnull=False).distinct().order_by('pk')[:spread])
+        if not courses:
+            raise CommandError('No courses with lessons, run seed_data first')
+        lessons = dict(
+            Lesson.objects.filter(module__course__in=courses).order_by('module__course_id', '-id')
+            .values_list('module__course_id', 'id')
+        )
+        return [(course, lessons[course.pk]) for course in courses]
+
+    def report(self, endpoint, name, result):
+        latencies, errors, elapsed = result
+        if len(latencies) < 2:
+            self.stdout.write(f'{endpoint:<16}{name:<10}  (no successful requests, {errors} errors)')
+            return
+        cuts = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{endpoint:<16}{name:<10}{len(latencies) / elapsed:>10.0f}'
+            f'{cuts[49] * 1000:>10.1f}{cuts[94] * 1000:>10.1f}{cuts[98] * 1000:>10.1f}'
+            f'{max(latencies) * 1000:>10.1f}{errors:>8}'
+        )
+
+
+async def load(urls, total, concurrency):
+    """(latencies of the 2xx responses, failed requests, seconds) for `total` GETs over `urls`."""
+    latencies, failures = [], [0]
+    issued = iter(range(total))
+
+    async def connection():
+        reader = writer = None
+        for number in issued:
+            url = urlsplit(urls[number % len(urls)])
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+                started = time.perf_counter()
+                status, close = await fetch(reader, writer, url.netloc, url.path + (f'?{url.query}' if url.query else ''))
+                elapsed = time.perf_counter() - started
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                failures[0] += 1
+                status, close = None, True
+            else:
+                if 200 <= status < 300:
+                    latencies.append(elapsed)
+                else:
+                    failures[0] += 1
+            if close and writer is not None:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(connection() for _ in range(concurrency)))
+    return latencies, failures[0], time.perf_counter() - started
+
+
+async def fetch(reader, writer, host, path):
+    """One GET on an open connection; (status, whether the server closes it)."""
+    writer.write(
+        f'GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: application/json\r\nAccept-Encoding: identity\r\n\r\n'
+        .encode()
+    )
+    status = int((await reader.readline()).split()[1])
+    length, chunked, close = None, False, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = 'chunked' in value
+        elif name == 'connection':
+            close = value == 'close'
+
+    if status in (204, 304):
+        return status, close
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)  # the chunk and its CRLF
+            if not size:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()  # the body runs to the end of the connection
+        close = True
+    return status, close
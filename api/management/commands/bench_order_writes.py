@@ -0,0 +1,93 @@
+import re
+from collections import Counter
+from unittest.mock import patch
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+
+from advanced_django_orm_lab.celery import app as celery_app
+from api import events
+from api.models import Order, Product
+from api.tasks import start_order_workflow
+
+# idempotency markers live in the cache; keep them off the (maybe unreachable) Redis
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+WRITE = re.compile(r'^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+["`]?(\w+)', re.IGNORECASE)
+
+
+class WriteCounter:
+    """connection.execute_wrapper hook: write statements per table."""
+
+    def __init__(self):
+        self.tables = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        match = WRITE.match(sql)
+        if match:
+            self.tables[match.group(1)] += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "DB writes per order for the Celery workflow: django-db extended results vs. result policies + event log"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200)
+
+    def handle(self, *args, **options):
+        # throwaway database: never touches the configured one
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        conf = celery_app.conf
+        saved = {key: conf[key] for key in ('task_always_eager', 'result_backend', 'result_extended')}
+
+        def setting(key, value):
+            # settings come from the CELERY_ namespace, which wins over the plain key
+            conf[f'CELERY_{key.upper()}'] = value
+
+        tasks = [task for name, task in celery_app.tasks.items() if name.startswith('api.')]
+        policies = {task: (task.ignore_result, task.store_eager_result) for task in tasks}
+        try:
+            setting('task_always_eager', True)
+            results = {}
+            for mode in ('before', 'after'):
+                if mode == 'before':
+                    # the old settings: every task stores an extended TaskResult row
+                    setting('result_backend', 'django-db')
+                    setting('result_extended', True)
+                    for task in tasks:
+                        task.ignore_result, task.store_eager_result = False, True
+                else:
+                    # in-memory stand-in for Redis: whatever it stores isn't a DB write
+                    setting('result_backend', 'cache+memory://')
+                    setting('result_extended', False)
+                    for task, (ignore_result, _) in policies.items():
+                        task.ignore_result, task.store_eager_result = ignore_result, True
+                celery_app._backend = celery_app._get_backend()
+                results[mode] = self.run_workflows(options['orders'])
+
+            for mode, tables in results.items():
+                per_order = sum(tables.values()) / options['orders']
+                breakdown = ', '.join(f'{table}={count / options["orders"]:.2f}' for table, count in tables.most_common())
+                self.stdout.write(f'{mode:>6}: {per_order:.2f} writes/order ({breakdown})')
+        finally:
+            for key, value in saved.items():
+                setting(key, value)
+            for task, (ignore_result, store_eager_result) in policies.items():
+                task.ignore_result, task.store_eager_result = ignore_result, store_eager_result
+            celery_app._backend = celery_app._get_backend()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=False)
+
+    def run_workflows(self, count):
+        product = Product.objects.create(name='bench', price=10, stock=count)
+        orders = Order.objects.bulk_create([Order(product=product, quantity=1) for _ in range(count)])
+        counter = WriteCounter()
+        # no simulated gateway timeouts: both runs do exactly the same steps
+        with override_settings(PAYMENT_BATCHING=False, ORDER_EVENT_FLUSH_INTERVAL=None, CACHES=LOCAL_CACHE), \
+                patch('api.tasks.random.random', return_value=1.0), \
+                connection.execute_wrapper(counter):
+            for order in orders:
+                start_order_workflow.delay(order.id, product.id, 1)
+            events.flush()
+        return counter.tables
@@ -0,0 +1,98 @@
+import queue
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+
+from api import payments, workflow
+from api.models import Order, Product
+
+
+class Command(BaseCommand):
+    help = "Charges reserved orders through the fake gateway: one per task vs. batched"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--latency', type=float, default=0.05, help='Gateway latency per charge (s)')
+        parser.add_argument('--failure-rate', type=float, default=0.3)
+        parser.add_argument('--decline-rate', type=float, default=0.02)
+        parser.add_argument('--slots', type=int, default=8, help='Worker slots for the one-per-task mode')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--rate-limit', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # throwaway database: never touches the configured one
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        try:
+            overrides = {
+                'PAYMENT_CONCURRENCY': options['concurrency'],
+                'PAYMENT_RATE_LIMIT': options['rate_limit'],
+                'PAYMENT_RETRY_DELAY': 0,
+            }
+            with override_settings(**overrides):
+                for mode in ('per-order', 'batched'):
+                    self.create_orders(options['orders'])
+                    gateway = payments.FakeGateway(
+                        latency=options['latency'], failure_rate=options['failure_rate'],
+                        decline_rate=options['decline_rate'], seed=0,
+                    )
+                    started = time.perf_counter()
+                    if mode == 'batched':
+                        self.run_batched(gateway, options['batch_size'])
+                    else:
+                        self.run_per_order(gateway, options['slots'])
+                    elapsed = time.perf_counter() - started
+                    done = Order.objects.filter(status__in=[Order.Status.PAID, Order.Status.FAILED]).count()
+                    self.stdout.write(
+                        f'{mode:>9}: {done} orders in {elapsed:.2f}s = {done / elapsed:.0f} orders/s, '
+                        f'{gateway.calls} gateway calls'
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=False)
+
+    def create_orders(self, count):
+        Order.objects.all().delete()
+        product = Product.objects.create(name='bench', price=10, stock=0)
+        Order.objects.bulk_create(
+            [Order(product=product, quantity=1, status=Order.Status.STOCK_RESERVED) for _ in range(count)],
+            batch_size=1000,
+        )
+
+    def run_batched(self, gateway, batch_size):
+        while payments.charge_reserved_orders(gateway=gateway, batch_size=batch_size, max_batches=1000)['retry']:
+            pass
+
+    def run_per_order(self, gateway, slots):
+        # what charge_payment does: one charge per task, a retry goes back in the queue
+        pending = queue.Queue()
+        for order_id in Order.objects.values_list('id', flat=True):
+            pending.put((order_id, 0))
+        lock = threading.Lock()
+
+        def slot():
+            try:
+                while True:
+                    try:
+                        order_id, attempts = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    result = gateway.charge(payments.Charge(order_id, 10, f'order-{order_id}'))
+                    with lock:
+                        if result.ok:
+                            workflow.transition(order_id, Order.Status.STOCK_RESERVED, Order.Status.PAID)
+                        elif result.retryable and attempts + 1 < 5:
+                            pending.put((order_id, attempts + 1))
+                        else:
+                            workflow.transition(order_id, Order.Status.STOCK_RESERVED, Order.Status.FAILED)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=slot) for _ in range(slots)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
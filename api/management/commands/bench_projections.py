@@ -0,0 +1,70 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Course, Lesson
+from api.projections import CourseProjection, LessonProjection
+from api.serializers import CourseSerializer, LessonSerializer
+
+LESSON_FIELDS = ['id', 'title', 'video_url', 'course_title', 'module_name', 'duration_seconds']
+
+
+class Command(BaseCommand):
+    help = "Compares per-row CPU of DRF serializers and values() projections on the current data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--limit', type=int, default=None, help='Rows per endpoint (default: all)')
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        cases = [
+            (
+                'courses',
+                lambda: CourseSerializer(
+                    Course.objects.select_related('category', 'instructor', 'instructor__user', 'stats')[:limit],
+                    many=True,
+                ).data,
+                lambda: CourseProjection().many(CourseProjection().queryset(Course.objects.all())[:limit]),
+            ),
+            (
+                'lessons',
+                lambda: LessonSerializer(
+                    Lesson.objects.select_related('module', 'module__course')[:limit],
+                    many=True, fields=LESSON_FIELDS,
+                ).data,
+                lambda: LessonProjection(LESSON_FIELDS).many(
+                    LessonProjection(LESSON_FIELDS).queryset(Lesson.objects.all())[:limit]
+                ),
+            ),
+        ]
+
+        self.stdout.write(f"{'endpoint':<10}{'rows':>8}{'drf us/row':>14}{'values us/row':>16}{'speedup':>10}")
+        for name, serializer_path, projection_path in cases:
+            expected = serializer_path()
+            # same ordering on both sides: compare as sorted JSON documents
+            if _canonical(expected) != _canonical(projection_path()):
+                raise CommandError(f'{name}: projection output differs from the serializer')
+            rows = len(expected)
+            if not rows:
+                self.stdout.write(f'{name:<10}{0:>8}  (no data, run seed_data first)')
+                continue
+
+            drf = _best_cpu(serializer_path, options['repeat']) / rows * 1e6
+            fast = _best_cpu(projection_path, options['repeat']) / rows * 1e6
+            self.stdout.write(f'{name:<10}{rows:>8}{drf:>14.1f}{fast:>16.1f}{drf / fast:>9.1f}x')
+
+
+def _canonical(data):
+    return sorted(json.dumps(row, sort_keys=True) for row in data)
+
+
+def _best_cpu(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.process_time()
+        func()
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
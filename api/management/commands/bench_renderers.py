@@ -0,0 +1,79 @@
+import time
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.renderers import JSONRenderer
+
+from advanced_django_orm_lab.celery import app as celery_app
+from api import renderers
+from api.management.commands.benchmark_api import REQUESTS, cache_settings
+from api.models import Course
+
+
+class Command(BaseCommand):
+    help = "Compares stdlib and orjson encoding of every endpoint's payload on the current data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        count = Course.objects.count()
+        if not count:
+            raise CommandError('No courses, run seed_data first')
+        course = Course.objects.order_by('pk')[count // 2]
+        payloads = self.capture(course)
+
+        stdlib, fast = JSONRenderer(), renderers.ORJSONRenderer()
+        self.stdout.write(f"{'endpoint':<32}{'bytes':>12}{'stdlib ms':>12}{'orjson ms':>12}{'speedup':>10}")
+        for name, data in payloads:
+            if data is None:
+                self.stdout.write(f'{name:<32}  (served as stored bytes, nothing to encode)')
+                continue
+            expected = stdlib.render(data)
+            if fast.render(data) != expected:
+                raise CommandError(f'{name}: orjson output differs from the stdlib renderer')
+            slow_ms = _best_cpu(lambda: stdlib.render(data), options['repeat']) * 1000
+            fast_ms = _best_cpu(lambda: fast.render(data), options['repeat']) * 1000
+            speedup = f'{slow_ms / fast_ms:>9.1f}x' if fast_ms else f"{'-':>10}"
+            self.stdout.write(f'{name:<32}{len(expected):>12}{slow_ms:>12.2f}{fast_ms:>12.2f}{speedup}')
+
+    def capture(self, course):
+        """(view request name, data handed to the renderer) for every sample request."""
+        middleware = [m for m in settings.MIDDLEWARE if not m.startswith('silk.')]
+        celery_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        setup_test_environment()
+        payloads = []
+        encode = renderers.dumps
+        try:
+            with override_settings(CACHES=cache_settings('locmem'), MIDDLEWARE=middleware):
+                client = Client(HTTP_ACCEPT='application/json')
+                for view_name, build in REQUESTS.items():
+                    for state, url in build(course).items():
+                        if state == 'stream':
+                            continue  # encoded row by row, same encoder
+                        seen = []
+                        cache.clear()  # a miss renders; a hit would be stored bytes
+                        with patch.object(renderers, 'dumps', lambda data: seen.append(data) or encode(data)):
+                            response = client.get(url)
+                        if response.status_code != 200:
+                            raise CommandError(f'{url} returned {response.status_code}')
+                        payloads.append((f'{view_name} {state}', seen[-1] if seen else None))
+        finally:
+            teardown_test_environment()
+            celery_app.conf.task_always_eager = celery_eager
+        return payloads
+
+
+def _best_cpu(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.process_time()
+        func()
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
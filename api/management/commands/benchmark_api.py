@@ -0,0 +1,387 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+from typing import NamedTuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, get_resolver
+from rest_framework import serializers as drf_serializers
+
+from advanced_django_orm_lab.celery import app as celery_app
+from api import projections
+from api.middleware import _counter as query_counter, _QueryCounter, install as count_queries
+from api.models import Course, Enrollment, Lesson, Product
+from api.seeding import CatalogSeeder, CatalogSize
+
+User = get_user_model()
+
+SCALES = {'1k': 1_000, '10k': 10_000, '100k': 100_000, '1M': 1_000_000}
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+DEFAULT_OUTPUT = Path(settings.BASE_DIR) / 'benchmarks' / 'results.json'
+
+
+class Sample(NamedTuple):
+    url: str
+    data: dict = None  # POSTed as JSON when given, else a GET
+    user: object = None  # logged in for the request
+    eager: bool = True  # False: Celery tasks are only queued (in memory), not run
+
+
+def _sample_lesson(course):
+    return Lesson.objects.filter(module__course=course).order_by('module__order', 'order').values_list('pk', flat=True)[1]
+
+
+def _sample_product():
+    # the seeder has no products; enough stock that every measured batch is accepted
+    product, _ = Product.objects.get_or_create(name='benchmark', defaults={'price': 10, 'stock': 10 ** 9})
+    return product.pk
+
+
+def _admin():
+    user, _ = User.objects.get_or_create(username='benchmark-admin', defaults={'is_staff': True, 'is_superuser': True})
+    return user
+
+
+def _student(course):
+    user, _ = User.objects.get_or_create(username='benchmark-student')
+    Enrollment.objects.get_or_create(user=user, course=course)
+    return user
+
+
+# view name -> sample requests (a URL, or a Sample for POSTs and logins);
+# a route whose view isn't listed is reported as skipped
+REQUESTS = {
+    # queues the demo `send` task, which sleeps for 10 s when run
+    'page': lambda course: {'index': Sample('/api/', eager=False)},
+    'ListCourses': lambda course: {
+        'list': '/api/courses/',
+        'page': '/api/courses/?page_size=50',
+        'stream': '/api/courses/?stream=ndjson',
+    },
+    'CoursesDetails': lambda course: {'details': f'/api/courses/{course.pk}/curriculum/'},
+    'CourseCurriculum': lambda course: {'curriculum': f'/api/courses/{course.slug}/'},
+    'ListLesson': lambda course: {
+        'list': '/api/lessons/',
+        'page': '/api/lessons/?page_size=100',
+        'stream': '/api/lessons/?stream=ndjson',
+    },
+    'LessonDetails': lambda course: {'details': f'/api/lessons/{_sample_lesson(course)}/'},
+    'TrendingCourses': lambda course: {'24h': '/api/courses/trending/'},
+    'QueryMetrics': lambda course: {'admin': Sample('/api/metrics/queries/', user=_admin())},
+    'CacheMetrics': lambda course: {'admin': Sample('/api/metrics/cache/', user=_admin())},
+    'BulkCreateOrders': lambda course: {
+        'batch': Sample('/api/orders/bulk/', {'items': [{'product_id': _sample_product(), 'quantity': 1}] * 20}),
+    },
+    'EnrollmentProgress': lambda course: {
+        'read': Sample('/api/progress/', user=_student(course)),
+        'report': Sample('/api/progress/', {'course_id': course.pk, 'progress': 41.666}, user=_student(course)),
+    },
+    # seeded titles draw from ~30 words: every word matches a large share of the catalog
+    'Search': lambda course: {
+        'word': '/api/search/?q=python',
+        'prefix': '/api/search/?q=pyth',
+        'words': '/api/search/?q=masterclass+guide+redis',
+    },
+    'AsyncListCourses': lambda course: {
+        'list': '/api/async/courses/',
+        'page': '/api/async/courses/?page_size=50',
+        'stream': '/api/async/courses/?stream=ndjson',
+    },
+    'AsyncCoursesDetails': lambda course: {'details': f'/api/async/courses/{course.pk}/curriculum/'},
+    'AsyncCourseCurriculum': lambda course: {'curriculum': f'/api/async/courses/{course.slug}/'},
+    'AsyncLessonDetails': lambda course: {'details': f'/api/async/lessons/{_sample_lesson(course)}/'},
+}
+
+# the progress buffer talks to Redis directly (api/progress.py)
+NEEDS_REDIS = {'EnrollmentProgress'}
+
+
+def cache_settings(kind):
+    if kind == 'fakeredis':
+        # django_redis on an in-process fake Redis: same client code, no server
+        import fakeredis
+
+        return {'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': 'redis://benchmark:6379/1',
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'SERIALIZER': 'api.cache_serializers.OrjsonSerializer',
+                'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection},
+            },
+        }}
+    return {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class SerializerTimer:
+    """Wall time spent in serializers/projections (outermost call only)."""
+
+    targets = [
+        (drf_serializers.Serializer, 'to_representation'),
+        (drf_serializers.ListSerializer, 'to_representation'),
+        (projections.Projection, 'to_representation'),
+        (projections.Projection, 'many'),
+    ]
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.depth = 0
+        self.originals = []
+
+    def wrap(self, original):
+        timer = self
+
+        def timed(*args, **kwargs):
+            timer.depth += 1
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timer.depth -= 1
+                if timer.depth == 0:
+                    timer.elapsed += time.perf_counter() - started
+        return timed
+
+    def __enter__(self):
+        for owner, name in self.targets:
+            original = owner.__dict__[name]
+            self.originals.append((owner, name, original))
+            setattr(owner, name, self.wrap(original))
+        return self
+
+    def __exit__(self, *exc):
+        for owner, name, original in reversed(self.originals):
+            setattr(owner, name, original)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Seeds deterministic catalogs at several scales and benchmarks every API route"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1k',
+                            help=f'Comma separated, any of {", ".join(SCALES)} or a lesson count')
+        parser.add_argument('--requests', type=int, default=10, help='Measured requests per route and cache state')
+        parser.add_argument('--cache', choices=['locmem', 'fakeredis'], default='locmem')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=str(DEFAULT_OUTPUT))
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed relative p50 latency growth before a run counts as a regression')
+
+    def handle(self, *args, **options):
+        scales = [self.parse_scale(name) for name in options['scales'].split(',') if name]
+        report = {
+            'meta': {
+                'database': connection.vendor,
+                'cache': options['cache'],
+                'requests': options['requests'],
+                'seed': options['seed'],
+                'python': platform.python_version(),
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            },
+            'results': {},
+        }
+
+        # the query telemetry would hide the request's queries from the counter set in measure()
+        middleware = [
+            m for m in settings.MIDDLEWARE
+            if not m.startswith('silk.') and m != 'api.middleware.QueryTelemetryMiddleware'
+        ]
+        celery_eager, celery_broker = celery_app.conf.task_always_eager, celery_app.conf.broker_write_url
+        celery_app.conf.task_always_eager = True
+        # tasks that are only queued go to an in-memory broker
+        celery_app.conf.broker_write_url = 'memory://'
+        setup_test_environment()
+        try:
+            with override_settings(CACHES=cache_settings(options['cache']), MIDDLEWARE=middleware):
+                for label, lessons in scales:
+                    report['results'][label] = self.run_scale(label, lessons, options)
+        finally:
+            teardown_test_environment()
+            celery_app.conf.task_always_eager = celery_eager
+            celery_app.conf.broker_write_url = celery_broker
+
+        output = Path(options['output'])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2, sort_keys=True))
+        self.stdout.write(f'Results written to {output}')
+
+        baseline = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline.parent.mkdir(parents=True, exist_ok=True)
+            baseline.write_text(json.dumps(report, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {baseline}'))
+        elif baseline.exists():
+            regressions = compare(json.loads(baseline.read_text()), report, options['tolerance'])
+            if regressions:
+                for line in regressions:
+                    self.stdout.write(self.style.ERROR(line))
+                raise CommandError(f'{len(regressions)} regression(s) against {baseline}')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {baseline}'))
+
+    def parse_scale(self, name):
+        if name in SCALES:
+            return name, SCALES[name]
+        try:
+            return name, int(name)
+        except ValueError:
+            raise CommandError(f'Unknown scale {name!r}')
+
+    def run_scale(self, label, lessons, options):
+        # a fresh throwaway database per scale: never touches the configured one
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        try:
+            size = CatalogSize.for_lessons(lessons)
+            started = time.perf_counter()
+            CatalogSeeder(size, seed=options['seed']).run()
+            seeded = time.perf_counter() - started
+            self.stdout.write(f'[{label}] seeded {size.as_dict()} in {seeded:.1f}s')
+
+            course = Course.objects.order_by('pk')[size.courses // 2]
+            routes = {}
+            for pattern in get_resolver().url_patterns:
+                for route, view_name in _api_routes(pattern):
+                    build = REQUESTS.get(view_name)
+                    if build is None:
+                        routes[route] = {'skipped': f'no sample request for {view_name}'}
+                        continue
+                    if view_name in NEEDS_REDIS and options['cache'] != 'fakeredis':
+                        routes[route] = {'skipped': f'{view_name} needs --cache fakeredis'}
+                        continue
+                    for variant, sample in build(course).items():
+                        if isinstance(sample, str):
+                            sample = Sample(sample)
+                        client = Client()
+                        if sample.user is not None:
+                            client.force_login(sample.user)
+                        key = f'{route} [{variant}]'
+                        celery_app.conf.task_always_eager = sample.eager
+                        try:
+                            routes[key] = {
+                                state: self.measure(client, sample, options['requests'], warm=state == 'warm')
+                                for state in ('cold', 'warm')
+                            }
+                        finally:
+                            celery_app.conf.task_always_eager = True
+                        self.stdout.write(f'[{label}] {key}: ' + ', '.join(
+                            f"{state} p50={routes[key][state]['p50_ms']:.1f}ms "
+                            f"p95={routes[key][state]['p95_ms']:.1f}ms q={routes[key][state]['queries']}"
+                            for state in ('cold', 'warm')
+                        ))
+            return {'size': size.as_dict(), 'seed_seconds': round(seeded, 2), 'routes': routes}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=False)
+
+    def measure(self, client, sample, requests, warm):
+        latencies, db_times, serializer_times, queries = [], [], [], []
+        count_queries(connection)
+        if warm:
+            cache.clear()
+            _send(client, sample)
+
+        for _ in range(requests):
+            if not warm:
+                cache.clear()
+            # counted on every thread, like the telemetry middleware: the async
+            # views run their queries on worker threads
+            counter = _QueryCounter()
+            token = query_counter.set(counter)
+            try:
+                with SerializerTimer() as timer:
+                    started = time.perf_counter()
+                    _send(client, sample)
+                    latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                query_counter.reset(token)
+            db_times.append(counter.duration * 1000)
+            serializer_times.append(timer.elapsed * 1000)
+            queries.append(counter.count)
+
+        # separate pass: tracemalloc would distort the timings above
+        if not warm:
+            cache.clear()
+        tracemalloc.start()
+        try:
+            _send(client, sample)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'queries': max(queries),
+            'db_ms': round(statistics.median(db_times), 3),
+            'serializer_ms': round(statistics.median(serializer_times), 3),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+
+def _send(client, sample):
+    if sample.data is None:
+        response = client.get(sample.url)
+    else:
+        response = client.post(sample.url, sample.data, content_type='application/json')
+    if not 200 <= response.status_code < 300:
+        raise CommandError(f'{sample.url} returned {response.status_code}')
+    if getattr(response, 'streaming', False):
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def _api_routes(pattern, prefix=''):
+    """(route, view class name) for every URLPattern under /api/."""
+    if isinstance(pattern, URLPattern):
+        view_class = getattr(pattern.callback, 'view_class', None)
+        name = view_class.__name__ if view_class else pattern.callback.__name__
+        yield prefix + str(pattern.pattern), name
+        return
+    route = prefix + str(pattern.pattern)
+    if not route.startswith('api/'):
+        return
+    for child in pattern.url_patterns:
+        yield from _api_routes(child, route)
+
+
+def compare(baseline, current, tolerance):
+    """Human readable regressions of `current` against `baseline`."""
+    problems = []
+    for scale, result in current['results'].items():
+        old_routes = baseline.get('results', {}).get(scale, {}).get('routes', {})
+        for route, states in result['routes'].items():
+            old_states = old_routes.get(route)
+            if not old_states or 'skipped' in states or 'skipped' in old_states:
+                continue
+            for state, now in states.items():
+                before = old_states.get(state)
+                if before is None:
+                    continue
+                if now['queries'] > before['queries']:
+                    problems.append(f"[{scale}] {route} {state}: queries {before['queries']} -> {now['queries']}")
+                # the median: a p95 of a handful of samples is one outlier
+                limit = before['p50_ms'] * (1 + tolerance)
+                # ignore sub-millisecond jitter
+                if now['p50_ms'] > limit and now['p50_ms'] - before['p50_ms'] > 1:
+                    problems.append(
+                        f"[{scale}] {route} {state}: p50 {before['p50_ms']:.1f}ms -> {now['p50_ms']:.1f}ms"
+                    )
+    return problems
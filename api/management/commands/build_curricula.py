@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.curriculum import build_curriculum_document
+from api.models import Course
+
+
+class Command(BaseCommand):
+    help = "Builds the pre-rendered curriculum document of every course"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help='Only build these course ids (repeatable)')
+
+    def handle(self, *args, **options):
+        course_ids = options['courses'] or Course.objects.values_list('pk', flat=True).iterator()
+        built = 0
+        for course_id in course_ids:
+            if build_curriculum_document(course_id) is not None:
+                built += 1
+        self.stdout.write(self.style.SUCCESS(f'Built {built} curriculum documents'))
@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = "Refills the search index from the catalog (after bulk writes that skip signals, e.g. seed_data)"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} entries in {time.perf_counter() - started:.1f}s'))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import outbox
+
+
+class Command(BaseCommand):
+    help = "Publishes pending outbox messages to the broker (a standalone alternative to the beat task)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            sent = outbox.relay(batch_size=options['batch_size'], max_batches=1000)
+            if options['once']:
+                self.stdout.write(f'Relayed {sent} messages')
+                return
+            if not sent:
+                time.sleep(options['interval'])
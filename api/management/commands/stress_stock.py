@@ -0,0 +1,98 @@
+import itertools
+import threading
+import time
+
+from django.db import OperationalError, connection, transaction
+from django.core.management.base import BaseCommand, CommandError
+
+from api import inventory
+from api.models import Order, Product
+
+RETRIES = 50
+
+
+class Command(BaseCommand):
+    help = "Hammers one product with concurrent orders; checks nothing is oversold and reports orders/sec"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--orders', type=int, default=2000, help='Order attempts across all threads')
+        parser.add_argument('--stock', type=int, default=1000)
+        parser.add_argument('--quantity', type=int, default=1)
+        parser.add_argument('--shards', type=int, default=0, help='Split the stock over N shard rows')
+        parser.add_argument('--locking', action='store_true',
+                            help='Old path for comparison: select_for_update + read-modify-write')
+        parser.add_argument('--keep', action='store_true', help='Keep the product and its orders')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite allows one writer at a time: numbers only mean something on Postgres/MySQL',
+            ))
+        product = Product.objects.create(name='stress-test', price=1, stock=options['stock'])
+        if options['shards']:
+            inventory.set_stock_shards(product.id, options['shards'])
+
+        attempts = itertools.count()
+        counts = {'reserved': 0, 'rejected': 0, 'retries': 0}
+        counts_lock = threading.Lock()
+        place = self.place_locked if options['locking'] else self.place
+
+        def worker():
+            try:
+                while next(attempts) < options['orders']:
+                    for retry in range(RETRIES):
+                        try:
+                            outcome = place(product.id, options['quantity'])
+                            break
+                        except OperationalError:
+                            # SQLite "database is locked"; Postgres deadlocks can't happen here
+                            with counts_lock:
+                                counts['retries'] += 1
+                            time.sleep(0.001 * (retry + 1))
+                    else:
+                        raise CommandError(f'Gave up after {RETRIES} retries')
+                    with counts_lock:
+                        counts[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        remaining = inventory.available_stock(product.id)
+        sold = sum(Order.objects.filter(product=product).values_list('quantity', flat=True))
+        self.stdout.write(
+            f"{options['threads']} threads, {options['orders']} attempts in {elapsed:.2f}s: "
+            f"{counts['reserved'] / elapsed:.0f} orders/s, {counts['reserved']} reserved, "
+            f"{counts['rejected']} rejected, {counts['retries']} retries, {remaining} left"
+        )
+        if not options['keep']:
+            Order.objects.filter(product=product).delete()
+            product.delete()
+
+        if sold + remaining != options['stock'] or sold != counts['reserved'] * options['quantity']:
+            raise CommandError(f"Stock mismatch: sold {sold} + left {remaining} != {options['stock']}")
+        self.stdout.write(self.style.SUCCESS('No oversell'))
+
+    def place(self, product_id, quantity):
+        with transaction.atomic():
+            if not inventory.reserve(product_id, quantity):
+                return 'rejected'
+            Order.objects.create(product_id=product_id, quantity=quantity, status=Order.Status.STOCK_RESERVED)
+        return 'reserved'
+
+    def place_locked(self, product_id, quantity):
+        with transaction.atomic():
+            product = Product.objects.select_for_update().get(id=product_id)
+            if product.stock < quantity:
+                return 'rejected'
+            product.stock -= quantity
+            product.save()
+            Order.objects.create(product_id=product_id, quantity=quantity, status=Order.Status.STOCK_RESERVED)
+        return 'reserved'
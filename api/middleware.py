@@ -0,0 +1,178 @@
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .budgets import get_query_budget
+
+logger = logging.getLogger('api.queries')
+
+# upper bounds of the query-count and DB-time (ms) histogram buckets
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+DB_TIME_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 1000)
+
+_lock = threading.Lock()
+_routes = {}
+# the current request's counter; context variables follow the request into
+# the threads sync_to_async runs it on
+_counter = contextvars.ContextVar('query_counter', default=None)
+
+
+class _QueryCounter:
+    """connection.execute_wrapper hook: counts queries and their wall time."""
+
+    __slots__ = ('count', 'duration', 'lock')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        # async views run a request's queries on several threads at once
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.duration += elapsed
+                self.count += 1
+
+
+def _count(execute, sql, params, many, context):
+    counter = _counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+def install(connection):
+    """
+    Count `connection`'s queries towards whichever request runs them. Every
+    connection gets this once, so queries are counted on any thread: the
+    request's own, the thread Django runs a sync view on under ASGI, or the
+    worker threads of the async views.
+    """
+    if _count not in connection.execute_wrappers:
+        # first: execute_wrapper() blocks pop their own wrapper off the end
+        connection.execute_wrappers.insert(0, _count)
+
+
+@receiver(connection_created)
+def _connection_created(sender, connection, **kwargs):
+    install(connection)
+
+
+def _empty_route():
+    return {
+        'requests': 0,
+        'queries': 0,
+        'db_time_ms': 0.0,
+        'over_budget': 0,
+        'queries_histogram': [0] * (len(QUERY_BUCKETS) + 1),
+        'db_time_histogram': [0] * (len(DB_TIME_BUCKETS) + 1),
+    }
+
+
+def record(route, queries, db_time_ms, over_budget=False):
+    with _lock:
+        stats = _routes.get(route)
+        if stats is None:
+            stats = _routes[route] = _empty_route()
+        stats['requests'] += 1
+        stats['queries'] += queries
+        stats['db_time_ms'] += db_time_ms
+        stats['over_budget'] += over_budget
+        stats['queries_histogram'][bisect_left(QUERY_BUCKETS, queries)] += 1
+        stats['db_time_histogram'][bisect_left(DB_TIME_BUCKETS, db_time_ms)] += 1
+
+
+def snapshot():
+    """Copy of the per-route counters collected by this process."""
+    with _lock:
+        return {
+            'query_buckets': list(QUERY_BUCKETS),
+            'db_time_buckets_ms': list(DB_TIME_BUCKETS),
+            'routes': {
+                route: {
+                    **stats,
+                    'queries_histogram': list(stats['queries_histogram']),
+                    'db_time_histogram': list(stats['db_time_histogram']),
+                }
+                for route, stats in _routes.items()
+            },
+        }
+
+
+def reset():
+    with _lock:
+        _routes.clear()
+
+
+class QueryTelemetryMiddleware:
+    """
+    Query count and DB time per route, kept as in-process counters.
+
+    Unlike silk it stores nothing per request and never touches the database:
+    the cost is one wrapper call per query and a dict update per request.
+    Queries run while a StreamingHttpResponse is being consumed happen after
+    this middleware returns and are not counted.
+
+    Under ASGI it runs as a coroutine, so it doesn't force the async views
+    through a thread. The counter travels with the request as a context
+    variable and every connection reports to it (`install`), whatever thread
+    the queries run on.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # opened before this module was imported
+        for opened in connections.all(initialized_only=True):
+            install(opened)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        install(connection)
+        counter = _QueryCounter()
+        token = _counter.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            _counter.reset(token)
+        return self._record(request, response, counter)
+
+    async def __acall__(self, request):
+        counter = _QueryCounter()
+        token = _counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _counter.reset(token)
+        return self._record(request, response, counter)
+
+    def _record(self, request, response, counter):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+
+        budget = get_query_budget(getattr(match.func, 'view_class', None))
+        over_budget = budget is not None and counter.count > budget
+        if over_budget:
+            logger.warning(
+                'Query budget exceeded on %s: %d queries (budget %d)',
+                match.route, counter.count, budget,
+            )
+        record(match.route, counter.count, counter.duration * 1000, over_budget)
+        return response
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.9 on 2026-10-17 21:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_course_stats(apps, schema_editor):
+    Course = apps.get_model('api', 'Course')
+    CourseStats = apps.get_model('api', 'CourseStats')
+    Module = apps.get_model('api', 'Module')
+    Lesson = apps.get_model('api', 'Lesson')
+    Resource = apps.get_model('api', 'Resource')
+    Enrollment = apps.get_model('api', 'Enrollment')
+
+    def per_course(queryset, course_path, aggregate):
+        return dict(
+            queryset.order_by().values_list(course_path).annotate(value=aggregate)
+        )
+
+    modules = per_course(Module.objects, 'course', models.Count('pk'))
+    lessons = per_course(Lesson.objects, 'module__course', models.Count('pk'))
+    resources = per_course(Resource.objects, 'lesson__module__course', models.Count('pk'))
+    students = per_course(Enrollment.objects, 'course', models.Count('pk'))
+    duration = per_course(Lesson.objects, 'module__course', models.Sum('duration_seconds'))
+
+    CourseStats.objects.bulk_create([
+        CourseStats(
+            course_id=pk,
+            modules_count=modules.get(pk, 0),
+            lessons_count=lessons.get(pk, 0),
+            resources_count=resources.get(pk, 0),
+            students_count=students.get(pk, 0),
+            total_duration_seconds=duration.get(pk) or 0,
+        )
+        for pk in Course.objects.values_list('pk', flat=True)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_remove_session_course_delete_quiz_delete_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseStats',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.course')),
+                ('modules_count', models.PositiveIntegerField(default=0)),
+                ('lessons_count', models.PositiveIntegerField(default=0)),
+                ('resources_count', models.PositiveIntegerField(default=0)),
+                ('students_count', models.PositiveIntegerField(default=0)),
+                ('total_duration_seconds', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=120)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('stock', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('stock_reserved', 'Stock Reserved'), ('paid', 'Paid'), ('failed', 'Failed'), ('shipped', 'Shipped')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='api.product')),
+            ],
+        ),
+        migrations.RunPython(backfill_course_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.9 on 2026-10-17 21:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_course_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurriculumDocument',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='curriculum_document', serialize=False, to='api.course')),
+                ('slug', models.SlugField(unique=True)),
+                ('body', models.BinaryField()),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
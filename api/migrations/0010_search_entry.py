@@ -0,0 +1,89 @@
+# Generated by Django 4.2.9 on 2026-10-17 22:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The text index lives outside the model: an FTS5 table kept in sync by
+# triggers on SQLite, a generated tsvector column + GIN index on Postgres.
+TEXT_INDEX = {
+    'sqlite': (
+        [
+            "CREATE VIRTUAL TABLE api_searchentry_fts USING fts5("
+            "title, content='api_searchentry', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+            "CREATE TRIGGER api_searchentry_fts_insert AFTER INSERT ON api_searchentry BEGIN "
+            "INSERT INTO api_searchentry_fts(rowid, title) VALUES (new.id, new.title); END",
+            "CREATE TRIGGER api_searchentry_fts_delete AFTER DELETE ON api_searchentry BEGIN "
+            "INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, title) VALUES ('delete', old.id, old.title); END",
+            "CREATE TRIGGER api_searchentry_fts_update AFTER UPDATE OF title ON api_searchentry BEGIN "
+            "INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+            "INSERT INTO api_searchentry_fts(rowid, title) VALUES (new.id, new.title); END",
+        ],
+        [
+            "DROP TRIGGER IF EXISTS api_searchentry_fts_update",
+            "DROP TRIGGER IF EXISTS api_searchentry_fts_delete",
+            "DROP TRIGGER IF EXISTS api_searchentry_fts_insert",
+            "DROP TABLE IF EXISTS api_searchentry_fts",
+        ],
+    ),
+    'postgresql': (
+        [
+            "ALTER TABLE api_searchentry ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('simple', title)) STORED",
+            "CREATE INDEX api_searchentry_vector_gin ON api_searchentry USING gin (search_vector)",
+        ],
+        [
+            "DROP INDEX IF EXISTS api_searchentry_vector_gin",
+            "ALTER TABLE api_searchentry DROP COLUMN IF EXISTS search_vector",
+        ],
+    ),
+}
+
+BACKFILL = [
+    "INSERT INTO api_searchentry (kind, object_id, course_id, title) "
+    "SELECT 'course', c.id, c.id, c.title FROM api_course c",
+    "INSERT INTO api_searchentry (kind, object_id, course_id, title) "
+    "SELECT 'module', m.id, m.course_id, m.title FROM api_module m",
+    "INSERT INTO api_searchentry (kind, object_id, course_id, title) "
+    "SELECT 'lesson', l.id, m.course_id, l.title FROM api_lesson l JOIN api_module m ON m.id = l.module_id",
+    "INSERT INTO api_searchentry (kind, object_id, course_id, title) "
+    "SELECT 'resource', r.id, m.course_id, r.name FROM api_resource r "
+    "JOIN api_lesson l ON l.id = r.lesson_id JOIN api_module m ON m.id = l.module_id",
+]
+
+
+def create_text_index(apps, schema_editor):
+    forward, _ = TEXT_INDEX.get(schema_editor.connection.vendor, ([], []))
+    for statement in forward + BACKFILL:
+        schema_editor.execute(statement)
+
+
+def drop_text_index(apps, schema_editor):
+    _, backward = TEXT_INDEX.get(schema_editor.connection.vendor, ([], []))
+    for statement in backward:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_order_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('course', 'Course'), ('module', 'Module'), ('lesson', 'Lesson'), ('resource', 'Resource')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='api.course')),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.9 on 2026-10-17 22:49
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_search_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursestats',
+            name='curriculum_updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='coursestats',
+            name='curriculum_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='coursestats',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='curriculumdocument',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,76 @@
+from django.db import migrations
+
+
+# Rank = the title's length in characters, fixed at write time, so the text
+# index can hand out matches already in rank order. On SQLite it goes into
+# the high bits of the FTS rowid ((length << 40) | entry id) of a contentless
+# FTS5 table; on Postgres it is a (char_length(title), id) index.
+RANK_INDEX = {
+    'sqlite': (
+        [
+            "DROP TRIGGER IF EXISTS api_searchentry_fts_update",
+            "DROP TRIGGER IF EXISTS api_searchentry_fts_delete",
+            "DROP TRIGGER IF EXISTS api_searchentry_fts_insert",
+            "DROP TABLE IF EXISTS api_searchentry_fts",
+            "CREATE VIRTUAL TABLE api_searchentry_fts USING fts5("
+            "title, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+            "CREATE TRIGGER api_searchentry_fts_insert AFTER INSERT ON api_searchentry BEGIN "
+            "INSERT INTO api_searchentry_fts(rowid, title) "
+            "VALUES ((length(new.title) << 40) | new.id, new.title); END",
+            "CREATE TRIGGER api_searchentry_fts_delete AFTER DELETE ON api_searchentry BEGIN "
+            "INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, title) "
+            "VALUES ('delete', (length(old.title) << 40) | old.id, old.title); END",
+            "CREATE TRIGGER api_searchentry_fts_update AFTER UPDATE OF title ON api_searchentry BEGIN "
+            "INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, title) "
+            "VALUES ('delete', (length(old.title) << 40) | old.id, old.title); "
+            "INSERT INTO api_searchentry_fts(rowid, title) "
+            "VALUES ((length(new.title) << 40) | new.id, new.title); END",
+            "INSERT INTO api_searchentry_fts(rowid, title) "
+            "SELECT (length(title) << 40) | id, title FROM api_searchentry",
+        ],
+        [
+            "DROP TRIGGER IF EXISTS api_searchentry_fts_update",
+            "DROP TRIGGER IF EXISTS api_searchentry_fts_delete",
+            "DROP TRIGGER IF EXISTS api_searchentry_fts_insert",
+            "DROP TABLE IF EXISTS api_searchentry_fts",
+            "CREATE VIRTUAL TABLE api_searchentry_fts USING fts5("
+            "title, content='api_searchentry', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+            "CREATE TRIGGER api_searchentry_fts_insert AFTER INSERT ON api_searchentry BEGIN "
+            "INSERT INTO api_searchentry_fts(rowid, title) VALUES (new.id, new.title); END",
+            "CREATE TRIGGER api_searchentry_fts_delete AFTER DELETE ON api_searchentry BEGIN "
+            "INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, title) VALUES ('delete', old.id, old.title); END",
+            "CREATE TRIGGER api_searchentry_fts_update AFTER UPDATE OF title ON api_searchentry BEGIN "
+            "INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+            "INSERT INTO api_searchentry_fts(rowid, title) VALUES (new.id, new.title); END",
+            "INSERT INTO api_searchentry_fts(api_searchentry_fts) VALUES ('rebuild')",
+        ],
+    ),
+    'postgresql': (
+        ["CREATE INDEX api_searchentry_rank ON api_searchentry ((char_length(title)), id)"],
+        ["DROP INDEX IF EXISTS api_searchentry_rank"],
+    ),
+}
+
+
+def create_rank_index(apps, schema_editor):
+    forward, _ = RANK_INDEX.get(schema_editor.connection.vendor, ([], []))
+    for statement in forward:
+        schema_editor.execute(statement)
+
+
+def drop_rank_index(apps, schema_editor):
+    _, backward = RANK_INDEX.get(schema_editor.connection.vendor, ([], []))
+    for statement in backward:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_course_version_stamps'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rank_index, drop_rank_index),
+    ]
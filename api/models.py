@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -81,7 +82,49 @@ class Enrollment(models.Model):
     class Meta:
         unique_together = ('user', 'course')
         indexes = [models.Index(fields=['course', 'user'])]
-        
+
+
+class CourseStats(models.Model):
+    # rollup محدّث تلقائياً (signals) بدل Count(distinct) على أربع علاقات
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    modules_count = models.PositiveIntegerField(default=0)
+    lessons_count = models.PositiveIntegerField(default=0)
+    resources_count = models.PositiveIntegerField(default=0)
+    students_count = models.PositiveIntegerField(default=0)
+    total_duration_seconds = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    # أختام الإصدار لـ ETag/Last-Modified (api/conditional.py): version لأي تعديل يظهر في الكورس،
+    # curriculum_version لتعديلات شجرة الكورس فقط (وحدات/دروس/ملفات)
+    version = models.PositiveBigIntegerField(default=0)
+    curriculum_version = models.PositiveBigIntegerField(default=0)
+    curriculum_updated_at = models.DateTimeField(default=timezone.now)
+
+
+class CurriculumDocument(models.Model):
+    # منهج الكورس جاهز كـ JSON bytes، يبنيه Celery عند أي تعديل (api/curriculum.py)
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='curriculum_document')
+    slug = models.SlugField(unique=True)
+    body = models.BinaryField()
+    built_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveBigIntegerField(default=0)  # CourseStats.curriculum_version وقت البناء
+
+
+class SearchEntry(models.Model):
+    # صف لكل عنوان قابل للبحث (كورس/وحدة/درس/ملف)، فهرس النص عليه FTS5 أو tsvector (api/search.py)
+    class Kind(models.TextChoices):
+        COURSE = "course"
+        MODULE = "module"
+        LESSON = "lesson"
+        RESOURCE = "resource"
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    object_id = models.PositiveBigIntegerField()
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='search_entries')
+    title = models.CharField(max_length=255)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
         
 # apps/orders/models.py
 from django.db import models
@@ -90,6 +133,18 @@ class Product(models.Model):
     name = models.CharField(max_length=120)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField()
+    # 0 = stock lives in `stock`; N = split across N ProductStockShard rows (api/inventory.py)
+    stock_shards = models.PositiveSmallIntegerField(default=0)
+
+
+class ProductStockShard(models.Model):
+    # جزء من مخزون منتج عليه ضغط عالي، كل حجز يقفل صف واحد بدل صف المنتج
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shard_rows')
+    shard = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'shard')
 
 
 class Order(models.Model):
@@ -97,6 +152,7 @@ class Order(models.Model):
     class Status(models.TextChoices):
         PENDING = "pending"
         STOCK_RESERVED = "stock_reserved"
+        CHARGING = "charging"
         PAID = "paid"
         FAILED = "failed"
         SHIPPED = "shipped"
@@ -111,3 +167,26 @@ class Order(models.Model):
     )
 
     created_at = models.DateTimeField(auto_now_add=True)
+
+    # batch charging (api/payments.py)
+    payment_attempts = models.PositiveSmallIntegerField(default=0)
+    charge_claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # charge_reserved_orders polls by status, oldest first
+        indexes = [models.Index(fields=['status', 'id'])]
+
+
+class OutboxMessage(models.Model):
+    # رسالة Celery تُكتب في نفس transaction الطلب، relay_outbox ينشرها بعد ذلك (api/outbox.py)
+    task = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class OrderEvent(models.Model):
+    # سجل أحداث الطلب (append-only) بدل TaskResult لكل خطوة، يُكتب على دفعات (api/events.py)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    kind = models.CharField(max_length=30)
+    created_at = models.DateTimeField(auto_now_add=True)
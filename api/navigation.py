@@ -0,0 +1,102 @@
+"""
+Previous/next lesson navigation across a whole course.
+
+Lessons are ordered by (module.order, lesson.order), so "next" on the last
+lesson of a module continues with the first lesson of the following module.
+"""
+from django.conf import settings
+from django.db.models import F, Subquery, Window
+from django.db.models.functions import FirstValue, Lag, Lead
+
+from .caching import course_scope, get_or_build
+from .models import Lesson
+
+COURSE_ORDER = [F('module__order').asc(), F('order').asc()]
+
+
+def _over_course(expression):
+    return Window(expression, order_by=COURSE_ORDER)
+
+
+def lesson_with_navigation(lesson_id, queryset=None):
+    """
+    One query: the lesson (with module and course) plus LAG/LEAD of its
+    neighbours, annotated as previous_lesson_id/title and next_lesson_id/title.
+    """
+    if queryset is None:
+        queryset = Lesson.objects.select_related('module', 'module__course')
+    course_id = Lesson.objects.filter(pk=lesson_id).order_by().values('module__course_id')
+    return (
+        queryset
+        .filter(module__course_id=Subquery(course_id[:1]))
+        .annotate(
+            previous_lesson_id=_over_course(Lag('id')),
+            previous_lesson_title=_over_course(Lag('title')),
+            next_lesson_id=_over_course(Lead('id')),
+            next_lesson_title=_over_course(Lead('title')),
+            # A plain `id=` filter would run before the window and leave a
+            # single-row partition; filtering on a window value makes Django
+            # apply it around the windowed subquery instead.
+            current_id=Window(FirstValue('id'), partition_by=F('id')),
+        )
+        .filter(current_id=lesson_id)
+    )
+
+
+def lesson_neighbours(lesson_id):
+    """
+    (previous, next) of a lesson as {"id", "title"} dicts or None: the LAG/LEAD
+    scan of `lesson_with_navigation` without the lesson's own columns, for
+    callers that load the lesson separately. (None, None) for an unknown id.
+    """
+    rows = lesson_with_navigation(lesson_id, Lesson.objects.all()).values_list(
+        'previous_lesson_id', 'previous_lesson_title', 'next_lesson_id', 'next_lesson_title',
+    )
+    for previous_id, previous_title, next_id, next_title in rows:
+        return (
+            {'id': previous_id, 'title': previous_title} if previous_id is not None else None,
+            {'id': next_id, 'title': next_title} if next_id is not None else None,
+        )
+    return None, None
+
+
+def navigation_index_enabled():
+    return getattr(settings, 'LESSON_NAVIGATION_INDEX', False)
+
+
+def build_navigation_index(course_id):
+    rows = list(
+        Lesson.objects.filter(module__course_id=course_id)
+        .order_by(*COURSE_ORDER)
+        .values_list('id', 'title')
+    )
+    return {
+        'lessons': rows,
+        # JSON object keys are strings
+        'positions': {str(lesson_id): position for position, (lesson_id, _) in enumerate(rows)},
+    }
+
+
+def get_navigation_index(course_id):
+    """Ordered lesson ids/titles of a course, cached under its generation."""
+    return get_or_build(
+        f'lessons:navigation:{course_id}',
+        lambda: build_navigation_index(course_id),
+        timeout=60 * 60,
+        scopes=[course_scope(course_id)],
+    )
+
+
+def neighbours(index, lesson_id):
+    """(previous, next) as {"id", "title"} dicts or None, in O(1)."""
+    lessons = index['lessons']
+    position = index['positions'].get(str(lesson_id))
+    if position is None:
+        return None, None
+
+    def entry(at):
+        if 0 <= at < len(lessons):
+            return {'id': lessons[at][0], 'title': lessons[at][1]}
+        return None
+
+    return entry(position - 1), entry(position + 1)
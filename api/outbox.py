@@ -0,0 +1,72 @@
+"""
+Transactional outbox for Celery messages.
+
+`enqueue(task, *args)` writes an OutboxMessage row inside the caller's
+transaction, so the message exists exactly when the order does: no broker
+round trip in the request, and nothing is lost if the process dies between
+commit and publish.
+
+`relay()` (the `relay_outbox` beat task, or `manage.py relay_outbox` as a
+standalone process) locks a batch of rows (SKIP LOCKED on Postgres), publishes
+them over one shared producer connection and deletes them in the same
+transaction. If it dies after publishing but before committing, the rows are
+published again by the next run - delivery is at-least-once, which is why
+the workflow steps are idempotent (api/workflow.py).
+"""
+import logging
+
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+
+from .models import OutboxMessage
+
+logger = logging.getLogger('api.outbox')
+
+
+def _task_name(task):
+    return task if isinstance(task, str) else task.name
+
+
+def enqueue(task, *args, **kwargs):
+    return OutboxMessage.objects.create(task=_task_name(task), args=list(args), kwargs=kwargs)
+
+
+def enqueue_many(task, calls):
+    """One row per args tuple in `calls`, with a single INSERT."""
+    name = _task_name(task)
+    return OutboxMessage.objects.bulk_create([OutboxMessage(task=name, args=list(args)) for args in calls])
+
+
+def relay_batch(batch_size):
+    """Publish and delete up to `batch_size` messages, oldest first; returns how many."""
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .order_by('id')[:batch_size]
+        )
+        if not messages:
+            return 0
+        with current_app.producer_or_acquire() as producer:
+            for message in messages:
+                task = current_app.tasks.get(message.task)
+                if task is not None:
+                    task.apply_async(args=message.args, kwargs=message.kwargs, producer=producer)
+                else:
+                    # registered only on the workers
+                    current_app.send_task(message.task, args=message.args, kwargs=message.kwargs, producer=producer)
+        OutboxMessage.objects.filter(id__in=[message.id for message in messages]).delete()
+    return len(messages)
+
+
+def relay(batch_size=None, max_batches=20):
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    total = 0
+    for _ in range(max_batches):
+        sent = relay_batch(batch_size)
+        total += sent
+        if sent < batch_size:
+            break
+    if total:
+        logger.debug('Relayed %d outbox messages', total)
+    return total
@@ -0,0 +1,200 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .search import ID_BITS, SCORE_BITS, search
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on a compound, indexed key.
+
+    Unlike OFFSET pagination (and DRF's CursorPagination, which only seeks on
+    the first ordering field and skips ties with an offset) every page is read
+    with `WHERE a >= x AND (a > x OR (a = x AND b > y) OR ...) ORDER BY a, b, c
+    LIMIT n`: the `a >= x` bound lets the index seek straight to the boundary
+    row, so the cost of a page stays the same no matter how deep the client
+    pages.
+
+    The cursor is opaque to clients: a base64 blob holding the key of the
+    boundary row and the paging direction.
+    """
+
+    ordering = ('id',)
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_requested(self, request):
+        # Paging is opt-in so existing clients keep getting the plain list.
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+
+        position, reverse = self.decode_cursor(request)
+
+        order_by = [f'-{name}' if reverse else name for name in self.ordering]
+        queryset = queryset.order_by(*order_by)
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(position, reverse))
+
+        # One extra row tells us whether there is anything beyond this page.
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def seek_filter(self, position, reverse):
+        # (a, b, c) > (x, y, z) expanded into an OR of prefixes, which every
+        # backend understands:
+        #   a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        # On its own the OR is not an index range: SQLite walks the index from
+        # its start and filters. The redundant `a >= x` in front gives the
+        # planner a range to seek to.
+        lookup = 'lt' if reverse else 'gt'
+        condition = Q()
+        for index, name in enumerate(self.ordering):
+            prefix = {field: position[field] for field in self.ordering[:index]}
+            condition |= Q(**prefix, **{f'{name}__{lookup}': position[name]})
+        first = self.ordering[0]
+        return Q(**{f'{first}__{lookup[0]}te': position[first]}) & condition
+
+    def get_position(self, row):
+        return {
+            name: row[name] if isinstance(row, dict) else getattr(row, name)
+            for name in self.ordering
+        }
+
+    def encode_cursor(self, row, reverse):
+        position = self.get_position(row)
+        payload = {
+            'p': [_to_primitive(position[name]) for name in self.ordering],
+            'r': int(reverse),
+        }
+        token = urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(token.encode()).decode())
+            values = payload['p']
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            # the key columns are NOT NULL, and a NULL never compares
+            if any(value is None for value in values):
+                raise ValueError
+            position = {name: self.cursor_value(name, value) for name, value in zip(self.ordering, values)}
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def cursor_value(self, name, value):
+        value = self.model._meta.get_field(name).to_python(value)
+        # a key no column can hold fails here rather than in the database driver
+        if isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63:
+            raise ValueError
+        return value
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+def _to_primitive(value):
+    # Datetimes keep their microseconds and offset so the seek is exact.
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class CourseCursorPagination(KeysetPagination):
+    ordering = ('created_at', 'id')
+
+
+class LessonCursorPagination(KeysetPagination):
+    ordering = ('module_id', 'order', 'id')
+    page_size = 100
+
+
+class SearchCursorPagination(KeysetPagination):
+    """Keyset pages over ranked search hits (api/search.py), seeking on (score, id)."""
+
+    ordering = ('score', 'id')
+    page_size = 20
+    max_page_size = 100
+
+    def paginate_search(self, query, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        position, reverse = self.decode_cursor(request)
+        results = search(query, self.page_size + 1, position, reverse)
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def cursor_value(self, name, value):
+        # both halves of the SQLite FTS rowid the cursor seeks to
+        bits = SCORE_BITS if name == 'score' else ID_BITS
+        value = int(value)
+        if not 0 <= value < 2 ** bits:
+            raise ValueError
+        return value
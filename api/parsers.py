@@ -0,0 +1,38 @@
+"""
+JSON request parsing through orjson, the counterpart of `api/renderers.py`.
+
+UTF-8 bodies are parsed by orjson straight from bytes. Anything it rejects is
+handed to DRF's stdlib parser, which either accepts it (NaN when STRICT_JSON
+is off) or raises the usual ParseError - so the fast path never refuses more
+than `JSONParser` does. orjson reads integers beyond 64 bits as floats, so a
+body with a run of 20+ digits goes to the stdlib parser too, as do other
+charsets and everything without orjson installed.
+"""
+import io
+import re
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from .renderers import ORJSONRenderer, orjson
+
+UTF8 = {'utf-8', 'utf8'}
+# may not fit in 64 bits
+LONG_NUMBER = re.compile(rb'\d{20}')
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower() not in UTF8:
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        if LONG_NUMBER.search(body):
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
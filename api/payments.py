@@ -0,0 +1,218 @@
+"""
+Payment gateways and the batch charger.
+
+With PAYMENT_BATCHING on, the order workflow stops after `reserve_stock`.
+The `charge_reserved_orders` beat task polls for `stock_reserved` orders
+(index on status, id) and claims a batch by moving it to `charging`.
+It charges the batch through the configured gateway with
+PAYMENT_CONCURRENCY threads, at most PAYMENT_RATE_LIMIT charges per second,
+then writes the results back with one UPDATE per outcome:
+
+* paid                   -> `paid`, then shipped by `ship_paid_orders`
+* transient error        -> back to `stock_reserved`, claimable again after PAYMENT_RETRY_DELAY
+* declined / out of tries -> `failed`, stock released
+
+A worker that dies mid-batch leaves its orders in `charging`. Claims older
+than PAYMENT_CLAIM_TIMEOUT are put back in the queue. Every charge carries
+the order's idempotency key, so the gateway won't bill a re-sent charge twice.
+"""
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import events, inventory
+from .models import Order
+
+logger = logging.getLogger('api.payments')
+
+Status = Order.Status
+
+Charge = namedtuple('Charge', 'order_id amount idempotency_key')
+# retryable: a timeout or outage worth trying again; otherwise a decline
+ChargeResult = namedtuple('ChargeResult', 'order_id ok retryable error')
+
+
+class PaymentGateway:
+    """
+    Subclasses implement `charge`. A provider with a real batch API can
+    override `charge_many` as well.
+    """
+
+    def charge(self, charge):
+        raise NotImplementedError
+
+    def charge_many(self, charges, concurrency=1, limiter=None):
+        def one(charge):
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                return self.charge(charge)
+            except Exception as exc:
+                # one broken call mustn't cost the batch its other results;
+                # the idempotency key makes retrying this charge safe
+                logger.exception('Charge for order %s failed', charge.order_id)
+                return ChargeResult(charge.order_id, False, True, f'{type(exc).__name__}: {exc}')
+
+        if concurrency <= 1:
+            return [one(charge) for charge in charges]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(one, charges))
+
+
+class FakeGateway(PaymentGateway):
+    """Local gateway for tests and benchmarks: fixed latency, random timeouts and declines."""
+
+    def __init__(self, latency=0.2, failure_rate=0.3, decline_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.settled = {}
+        self.calls = 0
+
+    def charge(self, charge):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+            if charge.idempotency_key in self.settled:
+                return self.settled[charge.idempotency_key]
+            roll = self.random.random()
+            if roll < self.failure_rate:
+                return ChargeResult(charge.order_id, False, True, 'Payment provider timeout')
+            if roll < self.failure_rate + self.decline_rate:
+                result = ChargeResult(charge.order_id, False, False, 'Card declined')
+            else:
+                result = ChargeResult(charge.order_id, True, False, '')
+            self.settled[charge.idempotency_key] = result
+            return result
+
+
+class RateLimiter:
+    """Spaces out calls to at most `rate` per second across threads (0 = no limit)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_at = time.monotonic()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+_gateway = None
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        _gateway = import_string(settings.PAYMENT_GATEWAY)(**settings.PAYMENT_GATEWAY_OPTIONS)
+    return _gateway
+
+
+def claim_batch(size):
+    """Move up to `size` reserved orders to `charging`; returns their charges."""
+    now = timezone.now()
+    # charge_claimed_at is kept on retries: it doubles as the retry backoff
+    due = Q(charge_claimed_at__isnull=True) | Q(charge_claimed_at__lt=now - timedelta(seconds=settings.PAYMENT_RETRY_DELAY))
+    with transaction.atomic():
+        # SKIP LOCKED: concurrent chargers take different orders (ignored on SQLite)
+        ids = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(due, status=Status.STOCK_RESERVED).order_by('id')
+            .values_list('id', flat=True)[:size]
+        )
+        if not ids:
+            return []
+        Order.objects.filter(id__in=ids).update(status=Status.CHARGING, charge_claimed_at=now)
+    rows = Order.objects.filter(id__in=ids).values_list('id', 'quantity', 'product__price', 'payment_attempts')
+    return [
+        (Charge(order_id, Decimal(price) * quantity, f'order-{order_id}'), attempts)
+        for order_id, quantity, price, attempts in rows
+    ]
+
+
+def requeue_stale_claims():
+    cutoff = timezone.now() - timedelta(seconds=settings.PAYMENT_CLAIM_TIMEOUT)
+    return Order.objects.filter(status=Status.CHARGING, charge_claimed_at__lt=cutoff).update(
+        status=Status.STOCK_RESERVED,
+    )
+
+
+def record_results(results, attempts):
+    """Bulk write-back: one UPDATE per outcome, stock released per product."""
+    paid, retry, failed = [], [], []
+    for result in results:
+        if result.ok:
+            paid.append(result.order_id)
+        elif result.retryable and attempts[result.order_id] + 1 < settings.PAYMENT_MAX_ATTEMPTS:
+            retry.append(result.order_id)
+        else:
+            failed.append(result.order_id)
+
+    with transaction.atomic():
+        if paid:
+            Order.objects.filter(id__in=paid, status=Status.CHARGING).update(
+                status=Status.PAID, charge_claimed_at=None,
+            )
+        if retry:
+            Order.objects.filter(id__in=retry, status=Status.CHARGING).update(
+                status=Status.STOCK_RESERVED, payment_attempts=F('payment_attempts') + 1,
+            )
+        if failed:
+            Order.objects.filter(id__in=failed, status=Status.CHARGING).update(
+                status=Status.FAILED, charge_claimed_at=None,
+                payment_attempts=F('payment_attempts') + 1,
+            )
+            released = defaultdict(int)
+            for product_id, quantity in Order.objects.filter(id__in=failed).values_list('product_id', 'quantity'):
+                released[product_id] += quantity
+            for product_id, quantity in released.items():
+                inventory.release(product_id, quantity)
+        # one INSERT for the whole batch
+        events.record(
+            [(order_id, 'paid') for order_id in paid]
+            + [(order_id, 'payment_retry') for order_id in retry]
+            + [(order_id, 'payment_failed') for order_id in failed]
+        )
+    return paid, retry, failed
+
+
+def charge_reserved_orders(gateway=None, batch_size=None, max_batches=10):
+    """Charge up to `max_batches` batches; returns the ids paid, retried and failed."""
+    gateway = gateway or get_gateway()
+    batch_size = batch_size or settings.PAYMENT_BATCH_SIZE
+    limiter = RateLimiter(settings.PAYMENT_RATE_LIMIT)
+    totals = {'paid': [], 'retry': [], 'failed': []}
+
+    for _ in range(max_batches):
+        claimed = claim_batch(batch_size)
+        if not claimed:
+            break
+        charges = [charge for charge, _ in claimed]
+        attempts = {charge.order_id: tried for charge, tried in claimed}
+        results = gateway.charge_many(charges, concurrency=settings.PAYMENT_CONCURRENCY, limiter=limiter)
+        paid, retry, failed = record_results(results, attempts)
+        totals['paid'] += paid
+        totals['retry'] += retry
+        totals['failed'] += failed
+    return totals
@@ -0,0 +1,142 @@
+"""
+Write-behind buffer for Enrollment.progress.
+
+Video players report progress every few seconds. Writing each report to its
+row means one UPDATE (and one row lock) per report, for a value that is
+overwritten a moment later. Instead:
+
+* `report(user_id, course_id, progress)` stores the latest value in a Redis
+  hash (`user:course` -> progress) - no database write.
+* `flush()` (the `flush_progress_buffer` beat task, every
+  PROGRESS_FLUSH_INTERVAL seconds) renames the hash out of the way and writes
+  it with `bulk_update`, so each enrollment is written at most once per
+  interval whatever its report rate. The same runs on worker shutdown.
+  Only one flush runs at a time (a `cache.add` lock).
+* `buffered()` / `merge()` let reads put pending values over the DB ones, so
+  readers never see the lag.
+
+If a flush dies halfway, the renamed hash stays behind and the next flush
+writes it first. Reports for enrollments that don't exist are dropped there.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from celery.signals import worker_shutdown
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from .caching import acquire_lock, release_lock
+from .models import Enrollment
+
+logger = logging.getLogger('api.progress')
+
+FLUSH_LOCK = 'lock:progress:flush'
+# longer than any flush should take; a crashed flush frees it after this
+FLUSH_LOCK_TIMEOUT = 60
+
+
+def _keys():
+    return cache.make_key('progress:buffer'), cache.make_key('progress:flushing')
+
+
+def _field(user_id, course_id):
+    return f'{user_id}:{course_id}'
+
+
+def report(user_id, course_id, progress):
+    buffer, _ = _keys()
+    get_redis_connection('default').hset(buffer, _field(user_id, course_id), str(progress))
+
+
+def buffered(user_id, course_ids):
+    """{course_id: Decimal} of the values not written to the DB yet."""
+    course_ids = list(course_ids)
+    if not course_ids:
+        return {}
+    fields = [_field(user_id, course_id) for course_id in course_ids]
+    pipe = get_redis_connection('default').pipeline(transaction=False)
+    for key in _keys():
+        pipe.hmget(key, fields)
+    latest, flushing = pipe.execute()
+    values = {}
+    for course_id, new, old in zip(course_ids, latest, flushing):
+        # a report newer than the one being flushed wins
+        value = new if new is not None else old
+        if value is not None:
+            values[course_id] = Decimal(value.decode())
+    return values
+
+
+def merge(user_id, enrollments):
+    """Rows of {'course_id', 'progress'} with pending values applied."""
+    enrollments = list(enrollments)
+    pending = buffered(user_id, [row['course_id'] for row in enrollments])
+    for row in enrollments:
+        row['progress'] = pending.get(row['course_id'], row['progress'])
+    return enrollments
+
+
+def flush(batch_size=None):
+    """Write buffered progress to the DB; returns the number of enrollments updated."""
+    # one flush at a time: the beat task and a worker shutting down can overlap
+    token = acquire_lock(FLUSH_LOCK, FLUSH_LOCK_TIMEOUT)
+    if not token:
+        return 0
+    try:
+        return _flush(batch_size or settings.PROGRESS_FLUSH_BATCH_SIZE)
+    finally:
+        release_lock(FLUSH_LOCK, token)
+
+
+def _flush(batch_size):
+    buffer, flushing = _keys()
+    redis = get_redis_connection('default')
+    try:
+        # fails if a previous flush left its hash behind: that one goes first
+        redis.renamenx(buffer, flushing)
+    except ResponseError:
+        pass  # nothing new buffered
+    entries = redis.hgetall(flushing)
+    if not entries:
+        return 0
+
+    values = {}
+    for field, value in entries.items():
+        user_id, course_id = field.decode().split(':')
+        values[int(user_id), int(course_id)] = Decimal(value.decode())
+
+    updated = 0
+    items = list(values.items())
+    for start in range(0, len(items), batch_size):
+        chunk = dict(items[start:start + batch_size])
+        # exactly the reported (user, course) pairs, one term per user
+        courses_by_user = defaultdict(list)
+        for user_id, course_id in chunk:
+            courses_by_user[user_id].append(course_id)
+        pairs = reduce(or_, (
+            Q(user_id=user_id, course_id__in=course_ids) for user_id, course_ids in courses_by_user.items()
+        ))
+        changed = []
+        for enrollment in Enrollment.objects.filter(pairs).only('id', 'user_id', 'course_id'):
+            enrollment.progress = chunk[enrollment.user_id, enrollment.course_id]
+            changed.append(enrollment)
+        with transaction.atomic():
+            Enrollment.objects.bulk_update(changed, ['progress'], batch_size=batch_size)
+        updated += len(changed)
+
+    redis.delete(flushing)
+    if len(values) > updated:
+        logger.info('Dropped progress for %d unknown enrollments', len(values) - updated)
+    return updated
+
+
+@worker_shutdown.connect
+def _flush_on_shutdown(**kwargs):
+    flush()
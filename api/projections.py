@@ -0,0 +1,117 @@
+"""
+Read-only projections: a values()-backed fast path for list endpoints.
+
+A `Projection` declares the output shape once, as output name -> ORM lookup.
+It compiles to a single `.values(...)` query and builds the response dicts
+straight from the rows, without model instances or DRF's per-field
+`to_representation`. Output is the same JSON as the matching serializer
+(`CourseSerializer`, `LessonSerializer`): `ProjectionTests` holds them to it,
+and `bench_projections` compares their speed.
+"""
+OMIT = object()
+
+
+class Column:
+    """
+    One output value read from `lookup`.
+
+    `default` replaces a NULL (use `OMIT` to drop the key, which is what DRF
+    does for a read-only field whose relation is missing).
+    """
+
+    def __init__(self, lookup, default=None, cast=None):
+        self.lookup = lookup
+        self.default = default
+        self.cast = cast
+
+
+class Projection:
+    # output name -> lookup string, Column, or a nested {name: ...} dict
+    shape = {}
+
+    def __init__(self, fields=None):
+        if fields is not None:
+            unknown = set(fields) - set(self.shape)
+            if unknown:
+                raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+        names = list(self.shape) if fields is None else [name for name in self.shape if name in fields]
+        self.plan = self._compile({name: self.shape[name] for name in names})
+        self.lookups = sorted(self._lookups(self.plan))
+
+    def _compile(self, shape):
+        plan = []
+        for name, spec in shape.items():
+            if isinstance(spec, dict):
+                plan.append((name, self._compile(spec)))
+            elif isinstance(spec, Column):
+                plan.append((name, spec))
+            else:
+                plan.append((name, Column(spec)))
+        return plan
+
+    def _lookups(self, plan):
+        for _, spec in plan:
+            if isinstance(spec, list):
+                yield from self._lookups(spec)
+            else:
+                yield spec.lookup
+
+    def queryset(self, queryset, extra_lookups=()):
+        """`queryset` narrowed to a values() query over the projected lookups."""
+        lookups = list(dict.fromkeys([*self.lookups, *extra_lookups]))
+        return queryset.values(*lookups)
+
+    def _build(self, plan, row):
+        data = {}
+        for name, spec in plan:
+            if isinstance(spec, list):
+                data[name] = self._build(spec, row)
+                continue
+            value = row[spec.lookup]
+            if value is None:
+                if spec.default is OMIT:
+                    continue
+                value = spec.default
+            elif spec.cast is not None:
+                value = spec.cast(value)
+            data[name] = value
+        return data
+
+    def to_representation(self, row):
+        return self._build(self.plan, row)
+
+    def many(self, rows):
+        plan = self.plan
+        build = self._build
+        return [build(plan, row) for row in rows]
+
+
+class CourseProjection(Projection):
+    # == CourseSerializer
+    shape = {
+        'id': 'id',
+        'title': 'title',
+        'slug': 'slug',
+        'category': Column('category__name', default=OMIT),
+        'instructor': {
+            'user': 'instructor__user__username',
+            'rating': Column('instructor__rating', cast=float),
+        },
+        'number_of_modules': Column('stats__modules_count', default=0),
+        'number_of_lessons': Column('stats__lessons_count', default=0),
+        'number_of_resources': Column('stats__resources_count', default=0),
+        'total_video_duration': Column('stats__total_duration_seconds', default=0),
+        'number_of_students': Column('stats__students_count', default=0),
+    }
+
+
+class LessonProjection(Projection):
+    # == LessonSerializer for the list fields
+    shape = {
+        'id': 'id',
+        'title': 'title',
+        'video_url': 'video_url',
+        'duration_seconds': 'duration_seconds',
+        'module_name': 'module__title',
+        'course_title': 'module__course__title',
+    }
@@ -0,0 +1,57 @@
+"""
+JSON rendering through orjson.
+
+`ORJSONRenderer` is a drop-in for DRF's `JSONRenderer` (see REST_FRAMEWORK in
+settings): same bytes out, encoded in C. Types orjson doesn't know - Decimal,
+lazy translation strings, querysets, timedelta - and datetimes (so they keep
+DRF's format: milliseconds, `Z` for UTC) go through DRF's own `JSONEncoder`
+as orjson's `default`, so the output matches the stdlib renderer.
+
+One difference: a NaN or infinite float becomes `null` instead of an error.
+
+What orjson can't do falls back to the stdlib renderer: indented output (the
+browsable API asks for indent=4), and everything when orjson isn't installed.
+
+`dumps()` is the same encoder for code that writes JSON bytes itself
+(streaming, curriculum documents).
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # stdlib json through DRF's JSONRenderer
+    orjson = None
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+_encoder = JSONEncoder()
+_fallback = JSONRenderer()
+
+
+def dumps(data):
+    """Compact JSON bytes for `data`, as DRF's JSONRenderer would write them."""
+    if orjson is None:
+        return _fallback.render(data)
+    body = orjson.dumps(data, default=_encoder.default, option=OPTIONS)
+    # like DRF: U+2028/U+2029 are valid JSON but end a line in JavaScript
+    if b'\xe2\x80\xa8' in body or b'\xe2\x80\xa9' in body:
+        body = body.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return body
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if (
+            orjson is None
+            or self.get_indent(accepted_media_type, renderer_context)
+            or not api_settings.UNICODE_JSON
+            or not api_settings.COMPACT_JSON
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
@@ -0,0 +1,172 @@
+"""
+Cache of finished response bodies: rendered JSON bytes, pre-compressed.
+
+`api/caching.py` stores Python data, so every hit still pays a decode, DRF's
+render and a compression pass. Here a miss renders the body once with the
+view's own renderer and stores it as bytes in every encoding worth having:
+
+    response:<key>:<generation>:identity
+    response:<key>:<generation>:gzip
+    response:<key>:<generation>:br        (only with the `brotli` package)
+
+A hit picks the best variant the client's Accept-Encoding allows (br, then
+gzip, then identity) in one `get_many` and returns those bytes as they are,
+with Content-Encoding and `Vary: Accept-Encoding` set. With the two-tier cache
+that is a dict lookup in process memory; through Redis the bytes come back
+untouched (see `api/cache_serializers.py`).
+
+Invalidation is the same generation scheme as `get_or_build`, and so is the
+stampede protection: one worker renders under `lock:response:<key>`, the
+others serve the last body written (`response:<key>:stale:*`) or wait briefly.
+
+Only JSON is cached; other renderers (the browsable API) return None and the
+view renders as usual.
+
+`acached_response` is the async version: hits come from the cache's async
+API, a miss runs `cached_response` in a thread.
+"""
+import gzip
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .caching import (
+    CATALOG, DEFAULT_TIMEOUT, STALE_FACTOR, WAIT_ATTEMPTS, WAIT_STEP, acquire_lock, aget_generation,
+    get_generation, release_lock,
+)
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+IDENTITY = 'identity'
+# smaller bodies aren't worth compressing (GZipMiddleware's threshold)
+MIN_COMPRESS_LENGTH = 200
+GZIP_LEVEL = 6
+# 5 is ~100x faster than 11 for ~20% more bytes; the miss that compresses waits on it
+BROTLI_QUALITY = 5
+
+
+def compress(body):
+    """{encoding: bytes} for `body`."""
+    variants = {IDENTITY: body}
+    if len(body) >= MIN_COMPRESS_LENGTH:
+        # mtime=0: the same body always compresses to the same bytes
+        variants['gzip'] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        if brotli is not None:
+            variants['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return variants
+
+
+def acceptable(accept_encoding):
+    """Encodings the client takes, best first; identity unless refused."""
+    qualities = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name] = quality
+    default = qualities.get('*', 0.0)
+    ranked = [
+        encoding for encoding in ('br', 'gzip')
+        if qualities.get(encoding, default) > 0 and (encoding != 'br' or brotli is not None)
+    ]
+    if qualities.get(IDENTITY, qualities.get('*', 1.0)) > 0 or not ranked:
+        ranked.append(IDENTITY)
+    return ranked
+
+
+def _lookup(prefix, encodings):
+    found = cache.get_many([f'{prefix}:{encoding}' for encoding in encodings])
+    for encoding in encodings:
+        body = found.get(f'{prefix}:{encoding}')
+        if body is not None:
+            return encoding, body
+    return None, None
+
+
+def _pick(variants, encodings):
+    encoding = next(encoding for encoding in encodings + [IDENTITY] if encoding in variants)
+    return encoding, variants[encoding]
+
+
+def _response(encoding, body, renderer):
+    response = HttpResponse(body, content_type=renderer.media_type)
+    if encoding != IDENTITY:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def cached_response(request, key, builder, timeout=DEFAULT_TIMEOUT, scopes=(CATALOG,), renderer=None):
+    """
+    The response for `builder()` (the view's data) from the body cache, or
+    None when the negotiated renderer isn't JSON. `renderer` defaults to the
+    one DRF negotiated.
+    """
+    renderer = renderer or request.accepted_renderer
+    if renderer.format != 'json':
+        return None
+    encodings = acceptable(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    versioned = f'response:{key}:{get_generation(*scopes)}'
+    encoding, body = _lookup(versioned, encodings)
+    if body is not None:
+        return _response(encoding, body, renderer)
+
+    def render():
+        body = renderer.render(builder(), renderer.media_type, {'request': request})
+        return compress(body)
+
+    lock_key = f'lock:response:{key}'
+    token = acquire_lock(lock_key)
+    if token:
+        try:
+            variants = render()
+            cache.set_many({f'{versioned}:{name}': value for name, value in variants.items()}, timeout)
+            stale = f'response:{key}:stale'
+            cache.set_many({f'{stale}:{name}': value for name, value in variants.items()}, timeout * STALE_FACTOR)
+            # a smaller body may have fewer variants than the one it replaces
+            cache.delete_many([f'{stale}:{name}' for name in ('gzip', 'br') if name not in variants])
+        finally:
+            release_lock(lock_key, token)
+        return _response(*_pick(variants, encodings), renderer)
+
+    # another worker is rendering: serve the last body, or wait for the new one
+    encoding, body = _lookup(f'response:{key}:stale', encodings)
+    for _ in range(WAIT_ATTEMPTS if body is None else 0):
+        time.sleep(WAIT_STEP)
+        encoding, body = _lookup(versioned, encodings)
+        if body is not None:
+            break
+    if body is None:
+        encoding, body = _pick(render(), encodings)
+    return _response(encoding, body, renderer)
+
+
+async def acached_response(request, key, builder, renderer, timeout=DEFAULT_TIMEOUT, scopes=(CATALOG,),
+                           thread=sync_to_async):
+    """`cached_response` for async views; `thread` runs a miss (`sync_to_async` by default)."""
+    if renderer.format != 'json':
+        return None
+    encodings = acceptable(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    generation = await aget_generation(*scopes)
+    if generation is not None:
+        prefix = f'response:{key}:{generation}'
+        found = await cache.aget_many([f'{prefix}:{encoding}' for encoding in encodings])
+        for encoding in encodings:
+            body = found.get(f'{prefix}:{encoding}')
+            if body is not None:
+                return _response(encoding, body, renderer)
+    return await thread(cached_response)(request, key, builder, timeout, scopes, renderer)
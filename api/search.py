@@ -0,0 +1,185 @@
+"""
+Full-text search over course, module, lesson and resource titles.
+
+Every searchable title is one `SearchEntry` row; the text index on it comes
+from migrations 0010 and 0012:
+
+* SQLite: a contentless FTS5 table (`api_searchentry_fts`), kept in sync by
+  triggers.
+* Postgres: a generated `tsvector` column with a GIN index.
+
+The signals in `api/signals.py` upsert or delete one entry per save/delete,
+so the index follows the catalog row by row. `rebuild()` (the
+`rebuild_search_index` command) refills it after bulk writes that skip
+signals, like `seed_data`.
+
+A query is split into words; every word must match and the last one also
+matches as a prefix (search-as-you-type). Hits are ordered by (score, id),
+lower score first, so pages can seek on that key like the other keyset
+endpoints.
+
+The score is the title's length in characters: every hit contains all the
+words searched for, so the shorter the title, the less else it is about.
+bm25 ranks such hits the same way (by length in words, plus a bonus for
+repeated words), but it has to score every match per query. The length is
+known when the entry is written, so the index stores hits in rank order
+(migration 0012):
+
+* SQLite: the FTS rowid is (length << ID_BITS) | entry id, so a page is the
+  first n matching rowids after the cursor's, read straight off the index;
+* Postgres: a (char_length(title), id) index next to the GIN one.
+
+Nothing is scored per query, so a page costs about the same however many
+titles match. Entry ids must stay below 2 ** ID_BITS.
+"""
+import re
+
+from django.db import connection, transaction
+
+from .models import Course, Lesson, Module, Resource, SearchEntry
+
+Kind = SearchEntry.Kind
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+# low bits of the SQLite FTS rowid hold the entry id, the ones above the score
+ID_BITS = 40
+SCORE_BITS = 63 - ID_BITS
+
+# INSERT ... SELECT per kind: the whole catalog in four statements
+REBUILD = {
+    Kind.COURSE: "SELECT 'course', c.id, c.id, c.title FROM {course} c",
+    Kind.MODULE: "SELECT 'module', m.id, m.course_id, m.title FROM {module} m",
+    Kind.LESSON: "SELECT 'lesson', l.id, m.course_id, l.title FROM {lesson} l JOIN {module} m ON m.id = l.module_id",
+    Kind.RESOURCE: (
+        "SELECT 'resource', r.id, m.course_id, r.name FROM {resource} r "
+        "JOIN {lesson} l ON l.id = r.lesson_id JOIN {module} m ON m.id = l.module_id"
+    ),
+}
+
+
+class SearchUnavailable(Exception):
+    """The database has no text index (neither SQLite FTS5 nor Postgres)."""
+
+
+def terms(query):
+    return WORD.findall(query.lower())[:10]
+
+
+def index(kind, object_id, course_id, title):
+    """Insert or refresh one entry."""
+    SearchEntry.objects.bulk_create(
+        [SearchEntry(kind=kind, object_id=object_id, course_id=course_id, title=title)],
+        update_conflicts=True, unique_fields=['kind', 'object_id'], update_fields=['course_id', 'title'],
+    )
+
+
+def remove(kind, object_id):
+    SearchEntry.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def move_module(module):
+    """A module's lessons and resources follow it to another course."""
+    lesson_ids = Lesson.objects.filter(module=module).values('id')
+    SearchEntry.objects.filter(kind=Kind.LESSON, object_id__in=lesson_ids).exclude(
+        course_id=module.course_id,
+    ).update(course_id=module.course_id)
+    resource_ids = Resource.objects.filter(lesson__module=module).values('id')
+    SearchEntry.objects.filter(kind=Kind.RESOURCE, object_id__in=resource_ids).exclude(
+        course_id=module.course_id,
+    ).update(course_id=module.course_id)
+
+
+def move_lesson(lesson, course_id):
+    resource_ids = Resource.objects.filter(lesson=lesson).values('id')
+    SearchEntry.objects.filter(kind=Kind.RESOURCE, object_id__in=resource_ids).exclude(
+        course_id=course_id,
+    ).update(course_id=course_id)
+
+
+def rebuild():
+    """Refill the index from the catalog tables; returns the number of entries."""
+    tables = {
+        'course': Course._meta.db_table,
+        'module': Module._meta.db_table,
+        'lesson': Lesson._meta.db_table,
+        'resource': Resource._meta.db_table,
+    }
+    table = SearchEntry._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # drop the FTS rows in one go instead of one delete-trigger per entry
+            cursor.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('delete-all')")
+            cursor.execute('DROP TRIGGER IF EXISTS api_searchentry_fts_delete')
+            SearchEntry.objects.all()._raw_delete(connection.alias)
+            cursor.execute(
+                'CREATE TRIGGER api_searchentry_fts_delete AFTER DELETE ON api_searchentry BEGIN '
+                "INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, title) "
+                f"VALUES ('delete', (length(old.title) << {ID_BITS}) | old.id, old.title); END"
+            )
+        else:
+            SearchEntry.objects.all()._raw_delete(connection.alias)
+        for select in REBUILD.values():
+            cursor.execute(f'INSERT INTO {table} (kind, object_id, course_id, title) ' + select.format(**tables))
+    return SearchEntry.objects.count()
+
+
+def _match_sqlite(words):
+    # every word quoted (FTS5 syntax characters are literal), the last one as a prefix
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def _match_postgres(words):
+    return ' & '.join(words[:-1] + [f'{words[-1]}:*'])
+
+
+def search(query, limit, position=None, reverse=False):
+    """
+    Up to `limit` hits for `query` after the (score, id) `position`, or
+    before it when `reverse` (returned in that reversed order). Each hit is a
+    dict: id (entry), kind, object_id, title, score, course_id, course_title,
+    course_slug.
+
+    The index returns matches in (score, id) order, so only the page's rows
+    are read, however many titles match or how deep the client pages.
+    """
+    words = terms(query)
+    if not words:
+        return []
+    entry, course = SearchEntry._meta.db_table, Course._meta.db_table
+    direction = 'DESC' if reverse else 'ASC'
+    op = '<' if reverse else '>'
+
+    if connection.vendor == 'sqlite':
+        where, params = '', [_match_sqlite(words)]
+        if position is not None:
+            where = f'AND rowid {op} %s '
+            params.append(position['score'] << ID_BITS | position['id'])
+        hits = (
+            f'SELECT rowid >> {ID_BITS} AS score, rowid & {2 ** ID_BITS - 1} AS id FROM {entry}_fts '
+            f'WHERE {entry}_fts MATCH %s {where}ORDER BY rowid {direction} LIMIT %s'
+        )
+    elif connection.vendor == 'postgresql':
+        where, params = '', [_match_postgres(words)]
+        if position is not None:
+            where = f'AND (char_length(title), id) {op} (%s, %s) '
+            params += [position['score'], position['id']]
+        hits = (
+            f'SELECT char_length(title) AS score, id FROM {entry} '
+            f"WHERE search_vector @@ to_tsquery('simple', %s) {where}"
+            f'ORDER BY char_length(title) {direction}, id {direction} LIMIT %s'
+        )
+    else:
+        raise SearchUnavailable(connection.vendor)
+
+    sql = (
+        f'WITH hits AS ({hits}) '
+        f'SELECT e.id, e.kind, e.object_id, e.title, hits.score, c.id, c.title, c.slug '
+        f'FROM hits JOIN {entry} e ON e.id = hits.id JOIN {course} c ON c.id = e.course_id '
+        f'ORDER BY hits.score {direction}, hits.id {direction}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, limit])
+        rows = cursor.fetchall()
+    columns = ('id', 'kind', 'object_id', 'title', 'score', 'course_id', 'course_title', 'course_slug')
+    return [dict(zip(columns, row)) for row in rows]
@@ -0,0 +1,368 @@
+"""
+Deterministic bulk catalog generator.
+
+Rows are generated as plain tuples, with primary keys assigned up front so
+related rows never need a read-back, and written in batches: `bulk_create`
+everywhere, `COPY ... FROM STDIN` on Postgres. Every course draws from its
+own seeded RNG, so the same seed always produces the same catalog however
+the work is split - which is what lets `workers > 1` generate courses in
+parallel processes, and what the benchmark suite relies on to compare runs.
+"""
+import io
+import random
+from datetime import datetime
+from multiprocessing import get_context
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (
+    Category, Course, CourseStats, CurriculumDocument, Enrollment, Instructor, Lesson, Module,
+    Resource, SearchEntry, TrainingOption,
+)
+from . import search
+from .curriculum import build_curriculum_document
+from .stats import rebuild_course_stats
+
+User = get_user_model()
+
+WORDS = (
+    'python django orm query index cache async data design web api backend '
+    'testing docker redis celery postgres scaling security patterns modern '
+    'practical advanced complete guide fundamentals masterclass projects'
+).split()
+
+CATEGORIES = ['Web Development', 'Data Science', 'Mobile Apps', 'DevOps', 'UI/UX Design']
+TRAINING_OPTIONS = ['OnDemand', 'Live', 'Workshop', 'Bootcamp', 'Mentorship']
+VIDEO_URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+FILE_URL = 'http://example.com/file.pdf'
+
+USER_COLUMNS = (
+    'id', 'username', 'email', 'password', 'first_name', 'last_name',
+    'is_superuser', 'is_staff', 'is_active', 'date_joined',
+)
+INSTRUCTOR_COLUMNS = ('id', 'user_id', 'bio', 'rating')
+COURSE_COLUMNS = ('id', 'title', 'slug', 'instructor_id', 'category_id', 'published', 'created_at')
+OPTION_COLUMNS = ('course_id', 'trainingoption_id')
+MODULE_COLUMNS = ('id', 'course_id', 'order', 'title')
+LESSON_COLUMNS = ('id', 'module_id', 'order', 'title', 'duration_seconds', 'video_url')
+RESOURCE_COLUMNS = ('id', 'lesson_id', 'name', 'file_url')
+ENROLLMENT_COLUMNS = ('id', 'user_id', 'course_id', 'progress', 'enrolled_at')
+
+
+class CatalogSize:
+    """How many rows of each kind to generate."""
+
+    def __init__(self, courses, modules_per_course=5, lessons_per_module=10,
+                 students=None, enrollments_per_course=None, instructors=None):
+        self.courses = courses
+        self.modules_per_course = modules_per_course
+        self.lessons_per_module = lessons_per_module
+        self.lessons = courses * modules_per_course * lessons_per_module
+        # enrollments and resources grow with the catalog
+        self.students = students if students is not None else max(50, self.lessons // 20)
+        self.enrollments_per_course = min(
+            self.students,
+            enrollments_per_course if enrollments_per_course is not None else 25,
+        )
+        self.instructors = instructors if instructors is not None else max(10, courses // 20)
+
+    @classmethod
+    def for_lessons(cls, lessons, modules_per_course=5, lessons_per_module=10):
+        per_course = modules_per_course * lessons_per_module
+        return cls(max(1, -(-lessons // per_course)), modules_per_course, lessons_per_module)
+
+    @property
+    def resources_per_module(self):
+        # one resource on every second lesson
+        return self.lessons_per_module // 2
+
+    def as_dict(self):
+        return {
+            'courses': self.courses,
+            'modules': self.courses * self.modules_per_course,
+            'lessons': self.lessons,
+            'resources': self.courses * self.modules_per_course * self.resources_per_module,
+            'students': self.students,
+            'enrollments': self.courses * self.enrollments_per_course,
+        }
+
+
+def generate_courses(plan):
+    """
+    Rows for courses [start, start + count) of the catalog, as
+    {table: [tuple, ...]}. Pure Python with no database access, so it can run
+    in a worker process.
+    """
+    M, L, R, E = plan['modules'], plan['lessons'], plan['resources'], plan['enrollments']
+    first_instructor, instructors = plan['instructors_range']
+    first_student, students = plan['students_range']
+    students = range(first_student, first_student + students)
+    now = plan['now']
+
+    rows = {name: [] for name in ('courses', 'options', 'modules', 'lessons', 'resources', 'enrollments')}
+    for index in range(plan['start'], plan['start'] + plan['count']):
+        rng = random.Random(f"{plan['seed']}:{index}")
+
+        def title(words=4):
+            return ' '.join(rng.choice(WORDS) for _ in range(words)).title()
+
+        course_id = plan['course_id'] + index
+        rows['courses'].append((
+            course_id, title(), f'course-{course_id}',
+            first_instructor + rng.randrange(instructors),
+            rng.choice(plan['category_ids']),
+            rng.random() < 0.7, now,
+        ))
+        for option_id in rng.sample(plan['option_ids'], k=rng.randint(1, 2)):
+            rows['options'].append((course_id, option_id))
+
+        for m in range(M):
+            module_index = index * M + m
+            module_id = plan['module_id'] + module_index
+            rows['modules'].append((module_id, course_id, m + 1, f'Module {m + 1}: {title(3)}'))
+            for n in range(L):
+                lesson_id = plan['lesson_id'] + module_index * L + n
+                rows['lessons'].append((
+                    lesson_id, module_id, n + 1, title(), rng.randint(300, 3600), VIDEO_URL,
+                ))
+                if n % 2:
+                    rows['resources'].append((
+                        plan['resource_id'] + module_index * R + n // 2, lesson_id,
+                        f'Download: {rng.choice(WORDS)}.pdf', FILE_URL,
+                    ))
+
+        for k, user_id in enumerate(rng.sample(students, k=E)):
+            rows['enrollments'].append((
+                plan['enrollment_id'] + index * E + k, user_id, course_id,
+                rng.choice([0, 10, 50, 100]), now,
+            ))
+    return rows
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def copy_rows(table, columns, rows):
+    """COPY rows into a Postgres table (psycopg2 or psycopg 3)."""
+    quote = connection.ops.quote_name
+    sql = f'COPY {quote(table)} ({", ".join(quote(c) for c in columns)}) FROM STDIN'
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        if hasattr(cursor.cursor, 'copy_expert'):
+            cursor.copy_expert(sql, buffer)
+        else:
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+class CatalogSeeder:
+
+    def __init__(self, size, seed=0, batch_size=5000, password='password123', log=None,
+                 workers=1, use_copy=None):
+        self.size = size
+        self.seed_value = seed
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.password = password
+        self.log = log or (lambda message: None)
+        self.workers = max(1, workers)
+        self.use_copy = connection.vendor == 'postgresql' if use_copy is None else use_copy
+
+    def run(self, documents=True):
+        with transaction.atomic():
+            self.seed()
+        self.reset_sequences()
+        # bulk writes skip the signals that keep these current
+        rebuild_course_stats(self.course_ids)
+        self.log('Rebuilt course stats')
+        search.rebuild()
+        self.log('Rebuilt search index')
+        if documents:
+            for course_id in self.course_ids:
+                build_curriculum_document(course_id)
+            self.log('Built curriculum documents')
+
+    def seed(self):
+        # one PBKDF2 hash shared by every generated user
+        password = make_password(self.password)
+        self.options = self.lookup_rows(TrainingOption, TRAINING_OPTIONS, lambda name: TrainingOption(name=name))
+        self.categories = self.lookup_rows(
+            Category, CATEGORIES, lambda name: Category(name=name, slug=name.lower().replace('/', '-').replace(' ', '-')),
+        )
+        self.instructor_ids = self.create_instructors(password)
+        self.student_ids = self.create_users('student', self.size.students, password)
+        self.create_courses()
+
+    # ---------- helpers ----------
+
+    def next_id(self, model):
+        return (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+    def write(self, model, columns, rows):
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            if self.use_copy:
+                copy_rows(model._meta.db_table, columns, batch)
+            else:
+                model.objects.bulk_create([model(**dict(zip(columns, row))) for row in batch])
+
+    def title(self, words=4):
+        return ' '.join(self.random.choice(WORDS) for _ in range(words)).title()
+
+    def lookup_rows(self, model, names, build):
+        existing = {row.name: row for row in model.objects.filter(name__in=names)}
+        missing = [build(name) for name in names if name not in existing]
+        if missing:
+            model.objects.bulk_create(missing)
+            existing = {row.name: row for row in model.objects.filter(name__in=names)}
+        return [existing[name] for name in names]
+
+    # ---------- rows ----------
+
+    def create_users(self, kind, count, password):
+        first = self.next_id(User)
+        now = timezone.now()
+        for start in range(0, count, self.batch_size):
+            self.write(User, USER_COLUMNS, [
+                (user_id, f'{kind}{user_id}', f'{kind}{user_id}@example.com', password, '', '',
+                 False, False, True, now)
+                for user_id in range(first + start, first + min(count, start + self.batch_size))
+            ])
+        self.log(f'Created {count} {kind} users')
+        return range(first, first + count)
+
+    def create_instructors(self, password):
+        user_ids = self.create_users('instructor', self.size.instructors, password)
+        first = self.next_id(Instructor)
+        self.write(Instructor, INSTRUCTOR_COLUMNS, [
+            (first + i, user_id, self.title(12), round(self.random.uniform(3.5, 5.0), 1))
+            for i, user_id in enumerate(user_ids)
+        ])
+        return range(first, first + len(user_ids))
+
+    def course_plans(self):
+        size = self.size
+        base = {
+            'seed': self.seed_value,
+            'modules': size.modules_per_course,
+            'lessons': size.lessons_per_module,
+            'resources': size.resources_per_module,
+            'enrollments': size.enrollments_per_course,
+            'instructors_range': (self.instructor_ids.start, len(self.instructor_ids)),
+            'students_range': (self.student_ids.start, len(self.student_ids)),
+            'category_ids': [category.id for category in self.categories],
+            'option_ids': [option.id for option in self.options],
+            'now': timezone.now(),
+            'course_id': self.next_id(Course),
+            'module_id': self.next_id(Module),
+            'lesson_id': self.next_id(Lesson),
+            'resource_id': self.next_id(Resource),
+            'enrollment_id': self.next_id(Enrollment),
+        }
+        self.course_ids = range(base['course_id'], base['course_id'] + size.courses)
+        # about batch_size lessons per chunk
+        per_chunk = max(1, self.batch_size // max(1, size.modules_per_course * size.lessons_per_module))
+        for start in range(0, size.courses, per_chunk):
+            yield {**base, 'start': start, 'count': min(per_chunk, size.courses - start)}
+
+    def create_courses(self):
+        plans = self.course_plans()
+        if self.workers == 1:
+            chunks = map(generate_courses, plans)
+            self.write_chunks(chunks)
+        else:
+            # workers only build tuples; this process does all the writing, in
+            # chunk order, so parents always land before their children
+            with get_context('fork').Pool(self.workers) as pool:
+                self.write_chunks(pool.imap(generate_courses, plans))
+        self.log(f'Created {self.size.courses} courses, {self.size.lessons} lessons')
+
+    def write_chunks(self, chunks):
+        tables = [
+            ('courses', Course, COURSE_COLUMNS),
+            ('options', Course.options.through, OPTION_COLUMNS),
+            ('modules', Module, MODULE_COLUMNS),
+            ('lessons', Lesson, LESSON_COLUMNS),
+            ('resources', Resource, RESOURCE_COLUMNS),
+            ('enrollments', Enrollment, ENROLLMENT_COLUMNS),
+        ]
+        for rows in chunks:
+            for name, model, columns in tables:
+                self.write(model, columns, rows[name])
+
+    def reset_sequences(self):
+        # explicit ids leave Postgres sequences behind
+        models = [User, Instructor, Category, TrainingOption, Course, Module, Lesson, Resource, Enrollment]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+
+def seeded_users():
+    """The users CatalogSeeder creates (`student<id>` / `instructor<id>` @example.com)."""
+    return User.objects.filter(
+        is_superuser=False, username__regex=r'^(student|instructor)[0-9]+$', email__endswith='@example.com',
+    )
+
+
+def clear_catalog():
+    """
+    Delete the catalog with one DELETE per table: every course and everything
+    hanging off it (modules, lessons, resources, enrollments, stats, search
+    entries, curriculum documents) and every instructor profile. Users,
+    categories and training options go only if seeding created them; the
+    ones added by hand stay.
+
+    `_raw_delete` skips the collector (which would load every row to cascade
+    and fire signals one object at a time), so children are deleted first.
+    Returns the ids of the deleted courses.
+    """
+    course_ids = list(Course.objects.values_list('pk', flat=True))
+    users = seeded_users()
+    querysets = [
+        Enrollment.objects.all(),
+        Resource.objects.all(),
+        Lesson.objects.all(),
+        Module.objects.all(),
+        CurriculumDocument.objects.all(),
+        CourseStats.objects.all(),
+        SearchEntry.objects.all(),
+        Course.options.through.objects.all(),
+        Course.objects.all(),
+        Instructor.objects.all(),
+        Category.objects.filter(name__in=CATEGORIES),
+        TrainingOption.objects.filter(name__in=TRAINING_OPTIONS),
+        User.groups.through.objects.filter(user__in=users),
+        User.user_permissions.through.objects.filter(user__in=users),
+    ]
+    if apps.is_installed('django.contrib.admin'):
+        from django.contrib.admin.models import LogEntry
+        querysets.append(LogEntry.objects.filter(user__in=users))
+    querysets.append(users)
+
+    with transaction.atomic():
+        for queryset in querysets:
+            queryset._raw_delete(queryset.db)
+    return course_ids
@@ -1,6 +1,9 @@
-from .models import Course, Instructor, Category , TrainingOption, Lesson, Module
+from .models import Course, Instructor, Category , TrainingOption, Lesson, Module, Resource
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from rest_framework.serializers import ModelSerializer
 from rest_framework import serializers
+from decimal import ROUND_HALF_UP, Decimal
 
 
 from django.contrib.auth import get_user_model
@@ -15,6 +18,52 @@ User = get_user_model()
 
 
 
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets: `fields=[...]` drops serializer fields, and
+    `optimize_queryset` shrinks the SQL to what those fields read.
+
+    `Meta.field_requirements` maps a field to the columns (`only`), joins
+    (`select_related`) and `annotations` it needs; a field that isn't listed
+    reads the model column of the same name.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # Pop the optional "fields" argument
+        fields = kwargs.pop('fields', None)
+
+        # Instantiate normally
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            # Drop any fields that are not specified
+            allowed = set(fields)
+            existing = set(self.fields.keys())
+            for field_name in existing - allowed:
+                self.fields.pop(field_name)
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields=None, extra_columns=()):
+        fields = cls.Meta.fields if fields is None else fields
+        requirements = getattr(cls.Meta, 'field_requirements', {})
+
+        columns = {'id', *extra_columns}
+        related = set()
+        annotations = {}
+        for name in fields:
+            needs = requirements.get(name, {'only': [name]})
+            columns.update(needs.get('only', ()))
+            related.update(needs.get('select_related', ()))
+            annotations.update(needs.get('annotations', {}))
+
+        if related:
+            queryset = queryset.select_related(*sorted(related))
+        queryset = queryset.only(*sorted(columns))
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        return queryset
+
+
 class InstructorSerializer(ModelSerializer):
     user = serializers.CharField(source='user.username', read_only=True)
     class Meta:
@@ -26,20 +75,43 @@ class TrainingOptionSerializer(ModelSerializer):
         model = TrainingOption
         fields = '__all__'
 
-class CourseSerializer(ModelSerializer):
+class StatsCounter(serializers.IntegerField):
+    # a course without a stats row counts 0, like CourseProjection (not null)
+    def __init__(self, **kwargs):
+        super().__init__(read_only=True, **kwargs)
+
+    def get_attribute(self, instance):
+        value = super().get_attribute(instance)
+        return 0 if value is None else value
+
+class CourseSerializer(DynamicFieldsMixin, ModelSerializer):
     category = serializers.CharField(source='category.name',read_only=True)
     instructor = InstructorSerializer(read_only=True)
-    number_of_modules = serializers.IntegerField(read_only=True)
-    number_of_lessons = serializers.IntegerField(read_only=True)
-    total_video_duration = serializers.IntegerField(read_only=True)
-    number_of_students = serializers.IntegerField(read_only=True)
+    # counters come from the CourseStats rollup (select_related('stats'))
+    number_of_modules = StatsCounter(source='stats.modules_count')
+    number_of_lessons = StatsCounter(source='stats.lessons_count')
+    number_of_resources = StatsCounter(source='stats.resources_count')
+    total_video_duration = StatsCounter(source='stats.total_duration_seconds')
+    number_of_students = StatsCounter(source='stats.students_count')
     
     class Meta:
         model = Course
-        fields = ['id', 'title', 'slug', 'category', 'instructor', 'number_of_modules', 'number_of_lessons', 'total_video_duration', 'number_of_students']
-
-
-class LessonSerializer(ModelSerializer):
+        fields = ['id', 'title', 'slug', 'category', 'instructor', 'number_of_modules', 'number_of_lessons', 'number_of_resources', 'total_video_duration', 'number_of_students']
+        field_requirements = {
+            'category': {'select_related': ['category'], 'only': ['category__name']},
+            'instructor': {
+                'select_related': ['instructor', 'instructor__user'],
+                'only': ['instructor__rating', 'instructor__user__username'],
+            },
+            'number_of_modules': {'select_related': ['stats'], 'only': ['stats__modules_count']},
+            'number_of_lessons': {'select_related': ['stats'], 'only': ['stats__lessons_count']},
+            'number_of_resources': {'select_related': ['stats'], 'only': ['stats__resources_count']},
+            'total_video_duration': {'select_related': ['stats'], 'only': ['stats__total_duration_seconds']},
+            'number_of_students': {'select_related': ['stats'], 'only': ['stats__students_count']},
+        }
+
+
+class LessonSerializer(DynamicFieldsMixin, ModelSerializer):
     module_name = serializers.CharField(source='module.title')
     course_title = serializers.CharField(source='module.course.title')
     resources_count = serializers.IntegerField(read_only=True)
@@ -54,31 +126,34 @@ class LessonSerializer(ModelSerializer):
                   'resources_count',
                   'next_lesson', 'previous_lesson'
                   ]
-    def __init__(self, *args, **kwargs):
-        # Pop the optional "fields" argument
-        fields = kwargs.pop('fields', None)
-
-        # Instantiate normally
-        super().__init__(*args, **kwargs)
-
-        if fields is not None:
-            # Drop any fields that are not specified
-            allowed = set(fields)
-            existing = set(self.fields.keys())
-            for field_name in existing - allowed:
-                self.fields.pop(field_name)
-
+        field_requirements = {
+            'module_name': {'select_related': ['module'], 'only': ['module__title']},
+            'course_title': {'select_related': ['module__course'], 'only': ['module__course__title']},
+            'resources_count': {'annotations': {
+                'resources_count': Coalesce(Subquery(
+                    Resource.objects.filter(lesson=OuterRef('pk')).order_by()
+                    .values('lesson').annotate(n=Count('pk')).values('n')
+                ), 0),
+            }},
+            # LAG/LEAD annotations, see api.navigation.lesson_with_navigation
+            'next_lesson': {},
+            'previous_lesson': {},
+        }
     def get_previous_lesson(self, obj):
-        prev = self.context.get('previous_lesson')
-        if not prev:
+        if 'previous_lesson' in self.context:
+            return self.context['previous_lesson']
+        # annotated by api.navigation.lesson_with_navigation (LAG)
+        if getattr(obj, 'previous_lesson_id', None) is None:
             return None
-        return {"id": prev.id, "title": prev.title}
+        return {"id": obj.previous_lesson_id, "title": obj.previous_lesson_title}
 
     def get_next_lesson(self, obj):
-        nxt = self.context.get('next_lesson')
-        if not nxt:
+        if 'next_lesson' in self.context:
+            return self.context['next_lesson']
+        # annotated by api.navigation.lesson_with_navigation (LEAD)
+        if getattr(obj, 'next_lesson_id', None) is None:
             return None
-        return {"id": nxt.id, "title": nxt.title}
+        return {"id": obj.next_lesson_id, "title": obj.next_lesson_title}
     
     
     
@@ -104,3 +179,17 @@ class CourseCurriculumSerializer(serializers.ModelSerializer):
     class Meta:
         model = Course
         fields = ['id', 'title', 'modules']
+
+
+class OrderItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class ProgressReportSerializer(serializers.Serializer):
+    course_id = serializers.IntegerField(min_value=1)
+    progress = serializers.FloatField(min_value=0, max_value=100)
+
+    def validate_progress(self, value):
+        # players report floats like 41.666; Enrollment.progress keeps 2 places
+        return Decimal(str(value)).quantize(Decimal('0.01'), ROUND_HALF_UP)
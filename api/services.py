@@ -1,25 +1,108 @@
+from collections import defaultdict
 
+from django.conf import settings
 from django.db import transaction
-from .models import Order, Product
-from .tasks import start_order_workflow
+from . import events, inventory, outbox
+from .inventory import OutOfStock, available_stock
+from .models import Order
+from .tasks import start_order_workflow, start_reserved_order_workflows
 
-def create_order(product_id, quantity):
+# orders per start_reserved_order_workflows message
+WORKFLOW_BATCH = 500
 
-    with transaction.atomic():
+def create_order(product_id, quantity):
 
-        product = Product.objects.select_for_update().get(id=product_id)
+    # بدون select_for_update: الفحص هنا مبدئي فقط، الحجز الفعلي في reserve_stock
+    # هو UPDATE مشروط (stock >= quantity) فما في oversell حتى مع آلاف الطلبات
+    if available_stock(product_id) < quantity:
+        raise OutOfStock("Out of stock")
 
-        if product.stock < quantity:
-            raise Exception("Out of stock")
+    with transaction.atomic():
 
         order = Order.objects.create(
-            product=product,
+            product_id=product_id,
             quantity=quantity,
         )
 
-        # لاحظ هنا
-        transaction.on_commit(
-            lambda: start_order_workflow.delay(order.id)
-        )
+        # outbox بدل on_commit + delay: الرسالة تُحفظ مع الطلب في نفس الـ transaction
+        # و relay_outbox ينشرها على دفعات
+        outbox.enqueue(start_order_workflow, order.id, product_id, quantity)
 
     return order
+
+
+def create_orders(items):
+    """
+    Bulk intake: `items` is a list of {'product_id', 'quantity'}.
+
+    Items are grouped by product and each product's total is reserved at once
+    (see `inventory.reserve_many`). When a product can't cover its whole
+    total, as many of its items as fit are kept, in the order given. Orders
+    are created already STOCK_RESERVED with one bulk_create, and their
+    workflows are written to the outbox in batches, in the same transaction.
+
+    Returns one result per item, in the same order:
+    {'status': 'created', 'order_id': ...} or {'status': 'rejected', 'reason': ...}.
+    """
+    results = [None] * len(items)
+    by_product = defaultdict(list)
+    for index, item in enumerate(items):
+        by_product[item['product_id']].append(index)
+    wanted = {
+        product_id: sum(items[index]['quantity'] for index in indexes)
+        for product_id, indexes in by_product.items()
+    }
+
+    with transaction.atomic():
+        reserved = inventory.reserve_many(wanted)
+        accepted = [index for product_id in reserved for index in by_product[product_id]]
+
+        short = [product_id for product_id in wanted if product_id not in reserved]
+        if short:
+            levels = inventory.stock_levels(short)
+            partial, kept = {}, {}
+            for product_id in short:
+                if product_id not in levels:
+                    for index in by_product[product_id]:
+                        results[index] = {'status': 'rejected', 'reason': 'unknown_product'}
+                    continue
+                left, fits = levels[product_id], []
+                for index in by_product[product_id]:
+                    if items[index]['quantity'] <= left:
+                        left -= items[index]['quantity']
+                        fits.append(index)
+                    else:
+                        results[index] = {'status': 'rejected', 'reason': 'out_of_stock'}
+                if fits:
+                    partial[product_id] = sum(items[index]['quantity'] for index in fits)
+                    kept[product_id] = fits
+            # stock may have moved since it was read: the guard still applies
+            second = inventory.reserve_many(partial) if partial else set()
+            for product_id, fits in kept.items():
+                if product_id in second:
+                    accepted.extend(fits)
+                else:
+                    for index in fits:
+                        results[index] = {'status': 'rejected', 'reason': 'out_of_stock'}
+
+        accepted.sort()
+        orders = Order.objects.bulk_create([
+            Order(
+                product_id=items[index]['product_id'], quantity=items[index]['quantity'],
+                status=Order.Status.STOCK_RESERVED,
+            )
+            for index in accepted
+        ])
+        for index, order in zip(accepted, orders):
+            results[index] = {'status': 'created', 'order_id': order.id}
+
+        order_ids = [order.id for order in orders]
+        events.record_many(order_ids, 'stock_reserved')
+        # with PAYMENT_BATCHING, charge_reserved_orders picks them up instead
+        if order_ids and not settings.PAYMENT_BATCHING:
+            outbox.enqueue_many(start_reserved_order_workflows, [
+                (order_ids[start:start + WORKFLOW_BATCH],)
+                for start in range(0, len(order_ids), WORKFLOW_BATCH)
+            ])
+
+    return results
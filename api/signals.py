@@ -0,0 +1,255 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .caching import CATALOG, course_scope, invalidate_on_commit
+from .curriculum import schedule_curriculum_rebuild
+from . import search
+from .models import Category, Course, CourseStats, Enrollment, Instructor, Lesson, Module, Resource, SearchEntry
+from .stats import apply_stats_delta, course_id_for, rebuild_course_stats, touch_courses
+from .trending import record_enrollment
+
+User = get_user_model()
+
+
+# Each handler resolves the owning course once, then:
+# * CourseStats rollup: create/delete shift the counters in place (one UPDATE),
+#   updates that can change a total (lesson duration) recompute that course,
+#   and a move to another course recomputes the old course too.
+# * version stamps: bumped in the same transaction (ETag / Last-Modified).
+# * cache: bump the `catalog` and `course:<id>` generations after commit.
+# * curriculum document: queue a debounced rebuild after commit.
+# * trending: new enrollments bump the course's sorted sets after commit.
+# * search: the object's SearchEntry is upserted/deleted in the same transaction.
+# Instructors, their users and categories only show in CourseSerializer: they
+# bump `version` (not `curriculum_version`) of every course that shows them.
+# Deleting a course cascades to its whole tree, stats row and search entries:
+# the per-row delete handlers of its modules, lessons, resources and
+# enrollments do nothing then, course_deleted covers the course once.
+
+def _touches(update_fields, *names):
+    # save() without update_fields may have changed anything
+    return update_fields is None or bool(set(names) & set(update_fields))
+
+
+# the column that moves a row to another course, and the path to that course
+_PARENTS = {
+    Module: ('course', 'course_id'),
+    Lesson: ('module', 'module__course_id'),
+    Resource: ('lesson', 'lesson__module__course_id'),
+    Enrollment: ('course', 'course_id'),
+}
+
+
+def _course_cascade(origin):
+    """True when a delete started at a Course (or Course queryset)."""
+    if isinstance(origin, QuerySet):
+        return origin.model is Course
+    return isinstance(origin, Course)
+
+
+@receiver(pre_save, sender=Module)
+@receiver(pre_save, sender=Lesson)
+@receiver(pre_save, sender=Resource)
+@receiver(pre_save, sender=Enrollment)
+def remember_course(sender, instance, raw=False, update_fields=None, **kwargs):
+    # a save can move the row to another course: the rollups of both change
+    parent, path = _PARENTS[sender]
+    if raw or instance.pk is None or not _touches(update_fields, parent):
+        return
+    instance._previous_course_id = sender.objects.filter(pk=instance.pk).values_list(path, flat=True).first()
+
+
+def _moved_from(instance, course_id):
+    """The course `instance` was just moved out of, or None."""
+    previous = instance.__dict__.pop('_previous_course_id', None)
+    return previous if previous is not None and previous != course_id else None
+
+
+def course_changed(course_id, curriculum=True):
+    if course_id:
+        touch_courses([course_id], curriculum=curriculum)
+    invalidate_on_commit(CATALOG, course_scope(course_id) if course_id else None)
+    if curriculum and course_id:
+        transaction.on_commit(lambda: schedule_curriculum_rebuild(course_id))
+
+
+def courses_changed(courses):
+    """Like course_changed(curriculum=False), for every course in `courses`."""
+    course_ids = list(courses.values_list('pk', flat=True))
+    if course_ids:
+        touch_courses(course_ids, curriculum=False)
+        invalidate_on_commit(CATALOG, *(course_scope(course_id) for course_id in course_ids))
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        CourseStats.objects.get_or_create(course=instance)
+    if created or _touches(update_fields, 'title'):
+        search.index(SearchEntry.Kind.COURSE, instance.pk, instance.pk, instance.title)
+    course_changed(instance.pk)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    course_changed(instance.pk, curriculum=False)
+
+
+@receiver(post_save, sender=Module)
+def module_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        apply_stats_delta(instance.course_id, modules_count=1)
+    if created or _touches(update_fields, 'title', 'course'):
+        search.index(SearchEntry.Kind.MODULE, instance.pk, instance.course_id, instance.title)
+    if not created and _touches(update_fields, 'course'):
+        search.move_module(instance)
+    previous = _moved_from(instance, instance.course_id)
+    if previous:
+        rebuild_course_stats([previous, instance.course_id])
+        course_changed(previous)
+    course_changed(instance.course_id)
+
+
+@receiver(post_delete, sender=Module)
+def module_deleted(sender, instance, origin=None, **kwargs):
+    if _course_cascade(origin):
+        return
+    apply_stats_delta(instance.course_id, modules_count=-1)
+    search.remove(SearchEntry.Kind.MODULE, instance.pk)
+    course_changed(instance.course_id)
+
+
+@receiver(post_save, sender=Lesson)
+def lesson_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    course_id = course_id_for(instance)
+    if created:
+        apply_stats_delta(
+            course_id,
+            lessons_count=1,
+            total_duration_seconds=instance.duration_seconds,
+        )
+    previous = _moved_from(instance, course_id)
+    if previous:
+        rebuild_course_stats([previous, course_id])
+        course_changed(previous)
+    elif not created and _touches(update_fields, 'duration_seconds', 'module'):
+        rebuild_course_stats([course_id])
+    if created or _touches(update_fields, 'title', 'module'):
+        search.index(SearchEntry.Kind.LESSON, instance.pk, course_id, instance.title)
+    if not created and _touches(update_fields, 'module'):
+        search.move_lesson(instance, course_id)
+    course_changed(course_id)
+
+
+@receiver(post_delete, sender=Lesson)
+def lesson_deleted(sender, instance, origin=None, **kwargs):
+    if _course_cascade(origin):
+        return
+    course_id = course_id_for(instance)
+    apply_stats_delta(
+        course_id,
+        lessons_count=-1,
+        total_duration_seconds=-instance.duration_seconds,
+    )
+    search.remove(SearchEntry.Kind.LESSON, instance.pk)
+    course_changed(course_id)
+
+
+@receiver(post_save, sender=Resource)
+def resource_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    course_id = course_id_for(instance)
+    if created:
+        apply_stats_delta(course_id, resources_count=1)
+    previous = _moved_from(instance, course_id)
+    if previous:
+        apply_stats_delta(previous, resources_count=-1)
+        apply_stats_delta(course_id, resources_count=1)
+        course_changed(previous)
+    if created or _touches(update_fields, 'name', 'lesson'):
+        search.index(SearchEntry.Kind.RESOURCE, instance.pk, course_id, instance.name)
+    course_changed(course_id)
+
+
+@receiver(post_delete, sender=Resource)
+def resource_deleted(sender, instance, origin=None, **kwargs):
+    if _course_cascade(origin):
+        return
+    course_id = course_id_for(instance)
+    apply_stats_delta(course_id, resources_count=-1)
+    search.remove(SearchEntry.Kind.RESOURCE, instance.pk)
+    course_changed(course_id)
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, created, raw=False, **kwargs):
+    # only the students counters show an enrollment: progress saves touch nothing
+    if raw:
+        return
+    if created:
+        apply_stats_delta(instance.course_id, students_count=1)
+        transaction.on_commit(lambda: record_enrollment(instance.course_id))
+        course_changed(instance.course_id, curriculum=False)
+        return
+    previous = _moved_from(instance, instance.course_id)
+    if previous:
+        apply_stats_delta(previous, students_count=-1)
+        apply_stats_delta(instance.course_id, students_count=1)
+        course_changed(previous, curriculum=False)
+        course_changed(instance.course_id, curriculum=False)
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, origin=None, **kwargs):
+    if _course_cascade(origin):
+        return
+    apply_stats_delta(instance.course_id, students_count=-1)
+    course_changed(instance.course_id, curriculum=False)
+
+
+@receiver(post_save, sender=Instructor)
+def instructor_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or created or not _touches(update_fields, 'rating', 'user'):
+        return
+    courses_changed(Course.objects.filter(instructor_id=instance.pk))
+
+
+@receiver(post_delete, sender=Instructor)
+def instructor_deleted(sender, instance, **kwargs):
+    courses_changed(Course.objects.filter(instructor_id=instance.pk))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # logins save last_login only
+    if raw or created or not _touches(update_fields, 'username'):
+        return
+    courses_changed(Course.objects.filter(instructor__user_id=instance.pk))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or created or not _touches(update_fields, 'name'):
+        return
+    courses_changed(Course.objects.filter(category_id=instance.pk))
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # SET_NULL has cleared Course.category by post_delete: remember the courses now
+    instance._course_ids = list(Course.objects.filter(category_id=instance.pk).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    courses_changed(Course.objects.filter(pk__in=getattr(instance, '_course_ids', ())))
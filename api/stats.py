@@ -0,0 +1,105 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
+
+from .models import Course, CourseStats, Enrollment, Lesson, Module, Resource
+
+
+def _rollup(queryset, course_path, aggregate):
+    # correlated subquery per counter: each one walks its own index instead of
+    # multiplying modules × lessons × resources × enrollments in one join
+    subquery = (
+        queryset.filter(**{course_path: OuterRef('pk')})
+        .order_by()
+        .values(course_path)
+        .annotate(value=aggregate)
+        .values('value')
+    )
+    return Coalesce(Subquery(subquery), Value(0), output_field=IntegerField())
+
+
+def rebuild_course_stats(course_ids=None, batch_size=1000):
+    """Recompute CourseStats from scratch, for every course or only `course_ids`."""
+    courses = Course.objects.order_by('pk')
+    if course_ids is not None:
+        courses = courses.filter(pk__in=course_ids)
+
+    rows = courses.annotate(
+        modules_count=_rollup(Module.objects, 'course', Count('pk')),
+        lessons_count=_rollup(Lesson.objects, 'module__course', Count('pk')),
+        resources_count=_rollup(Resource.objects, 'lesson__module__course', Count('pk')),
+        students_count=_rollup(Enrollment.objects, 'course', Count('pk')),
+        total_duration_seconds=_rollup(Lesson.objects, 'module__course', Sum('duration_seconds')),
+    ).values_list(
+        'pk', 'modules_count', 'lessons_count', 'resources_count',
+        'students_count', 'total_duration_seconds',
+    )
+
+    fields = ['modules_count', 'lessons_count', 'resources_count',
+              'students_count', 'total_duration_seconds', 'updated_at']
+    batch = []
+    total = 0
+    for pk, modules, lessons, resources, students, duration in rows.iterator(chunk_size=batch_size):
+        batch.append(CourseStats(
+            course_id=pk,
+            modules_count=modules,
+            lessons_count=lessons,
+            resources_count=resources,
+            students_count=students,
+            total_duration_seconds=duration,
+        ))
+        if len(batch) >= batch_size:
+            total += _upsert(batch, fields)
+            batch = []
+    if batch:
+        total += _upsert(batch, fields)
+    return total
+
+
+def _upsert(batch, fields):
+    CourseStats.objects.bulk_create(
+        batch, update_conflicts=True, unique_fields=['course'], update_fields=fields,
+    )
+    # whatever skipped the signals may have changed these courses
+    touch_courses([stats.course_id for stats in batch])
+    return len(batch)
+
+
+def touch_courses(course_ids, curriculum=True):
+    """
+    Bump the version stamps conditional GETs are answered from
+    (api/conditional.py); `curriculum=False` for changes outside the
+    module/lesson/resource tree, like enrollments.
+    """
+    changes = {'version': F('version') + 1, 'updated_at': Now()}
+    if curriculum:
+        changes.update(curriculum_version=F('curriculum_version') + 1, curriculum_updated_at=Now())
+    CourseStats.objects.filter(course_id__in=course_ids).update(**changes)
+
+
+def apply_stats_delta(course_id, **deltas):
+    """Shift counters of one course in place, e.g. apply_stats_delta(3, lessons_count=1)."""
+    if course_id is None or not deltas:
+        return
+    changes = {name: F(name) + delta for name, delta in deltas.items() if delta}
+    if changes:
+        CourseStats.objects.filter(course_id=course_id).update(updated_at=Now(), **changes)
+
+
+def course_id_for(instance):
+    """Course id that owns a Course/Module/Lesson/Resource/Enrollment instance."""
+    if isinstance(instance, Course):
+        return instance.pk
+    if isinstance(instance, (Module, Enrollment)):
+        return instance.course_id
+    if isinstance(instance, Lesson):
+        module = Lesson.module.field.get_cached_value(instance, None)
+        if module is not None:
+            return module.course_id
+        return Module.objects.filter(pk=instance.module_id).values_list('course_id', flat=True).first()
+    if isinstance(instance, Resource):
+        return (
+            Lesson.objects.filter(pk=instance.lesson_id)
+            .values_list('module__course_id', flat=True)
+            .first()
+        )
+    return None
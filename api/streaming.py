@@ -0,0 +1,74 @@
+"""
+Streaming JSON for large list endpoints.
+
+Rows are read with `.iterator(chunk_size=...)` (a server-side cursor on
+Postgres), serialized one at a time and written out as they are read, so
+memory per request stays bounded and the first byte goes out after the first
+chunk instead of after the whole table.
+"""
+from django.http import StreamingHttpResponse
+
+from .renderers import dumps
+
+STREAM_QUERY_PARAM = 'stream'
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def requested_stream_format(request):
+    """'json', 'ndjson' or None when the client did not ask for streaming."""
+    value = request.query_params.get(STREAM_QUERY_PARAM)
+    if value in CONTENT_TYPES:
+        return value
+    if value in ('1', 'true'):
+        return 'json'
+    return None
+
+
+def _encode(rows, to_representation):
+    for row in rows:
+        yield dumps(to_representation(row))
+
+
+def _json_array(items):
+    yield b'['
+    first = True
+    for item in items:
+        yield item if first else b',' + item
+        first = False
+    yield b']'
+
+
+def _ndjson(items):
+    for item in items:
+        yield item + b'\n'
+
+
+def _buffered(parts):
+    # Group many small rows per write instead of one socket write per row.
+    buffer = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= BUFFER_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def stream_queryset(queryset, serializer, fmt='json', chunk_size=CHUNK_SIZE):
+    """
+    StreamingHttpResponse for `queryset`, one `serializer.to_representation`
+    per row. `serializer` is an unbound (many=False) serializer instance.
+    """
+    items = _encode(queryset.iterator(chunk_size=chunk_size), serializer.to_representation)
+    parts = _ndjson(items) if fmt == 'ndjson' else _json_array(items)
+    return StreamingHttpResponse(_buffered(parts), content_type=CONTENT_TYPES[fmt])
@@ -1,16 +1,27 @@
+import logging
 import random
 import time
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
-from .models import Order, Product
+from . import events, inventory, outbox, payments, progress, trending, workflow
+from .models import Order
 from celery import chain
 
+logger = logging.getLogger('api.tasks')
+
 
 @shared_task
-def start_order_workflow(order_id):
+def start_order_workflow(order_id, product_id=None, quantity=None):
+
+    if settings.PAYMENT_BATCHING:
+        # الدفع يتم على دفعات عبر charge_reserved_orders (api/payments.py)
+        reserve_stock.delay(order_id, product_id, quantity)
+        return
 
     workflow = chain(
-        reserve_stock.s(order_id),
+        reserve_stock.s(order_id, product_id, quantity),
         charge_payment.s(),
         generate_invoice.s(),
         notify_shipping.s(),
@@ -20,64 +31,129 @@ def start_order_workflow(order_id):
 
 @shared_task
 def notify_shipping(order_id):
-    order = Order.objects.get(id=order_id)
-    order.status = Order.Status.SHIPPED
-    order.save()
+    # كل خطوة تستقبل order_id فقط وترجعه، None يعني الطلب توقف (FAILED)
+    if order_id is None or workflow.already_done('notify_shipping', order_id):
+        return order_id
+
+    if not workflow.transition(order_id, Order.Status.PAID, Order.Status.SHIPPED) \
+            and not workflow.reached(order_id, Order.Status.SHIPPED):
+        return None
+
+    workflow.mark_done('notify_shipping', order_id)
+    events.emit(order_id, 'shipped')
+    return order_id
 
 
 @shared_task
 def generate_invoice(order_id):
-    order = Order.objects.get(id=order_id)
+    if order_id is None or workflow.already_done('generate_invoice', order_id):
+        return order_id
+
     print(f"Invoice generated for order {order_id}")
+    workflow.mark_done('generate_invoice', order_id)
+    events.emit(order_id, 'invoiced')
     return order_id
 
 
 @shared_task(bind=True, autoretry_for=(ConnectionError,), retry_backoff=10)
 def charge_payment(self, order_id):
 
-    order = Order.objects.get(id=order_id)
+    if order_id is None or workflow.already_done('charge_payment', order_id):
+        return order_id
 
     # simulate external gateway failure
     if random.random() < 0.3:
         raise ConnectionError("Payment provider timeout")
 
-    order.status = Order.Status.PAID
-    order.save()
+    if not workflow.transition(order_id, Order.Status.STOCK_RESERVED, Order.Status.PAID) \
+            and not workflow.reached(order_id, Order.Status.PAID):
+        return None
 
+    workflow.mark_done('charge_payment', order_id)
+    events.emit(order_id, 'paid')
     return order_id
 
-@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=5, retry_kwargs={'max_retries': 5})
-def reserve_stock(self, order_id):
+# the one result worth polling (order id, or None when out of stock); everything
+# else follows CELERY_TASK_IGNORE_RESULT
+@shared_task(bind=True, ignore_result=False, autoretry_for=(Exception,), retry_backoff=5, retry_kwargs={'max_retries': 5})
+def reserve_stock(self, order_id, product_id=None, quantity=None):
 
-    with transaction.atomic():
-        order = Order.objects.select_for_update().get(id=order_id)
-        product = order.product
+    if workflow.already_done('reserve_stock', order_id):
+        return order_id
 
-        if product.stock < order.quantity:
-            order.status = Order.Status.FAILED
-            order.save()
-            return
+    if product_id is None:
+        # callers that only know the id
+        product_id, quantity = Order.objects.filter(id=order_id).values_list('product_id', 'quantity').get()
+
+    with transaction.atomic():
+        # the status guard first: a retry of a finished step stops here
+        if not workflow.transition(order_id, Order.Status.PENDING, Order.Status.STOCK_RESERVED):
+            return order_id if workflow.reached(order_id, Order.Status.STOCK_RESERVED) else None
 
-        product.stock -= order.quantity
-        product.save()
+        # UPDATE مشروط بدل select_for_update + product.save()
+        if not inventory.reserve(product_id, quantity):
+            workflow.transition(order_id, Order.Status.STOCK_RESERVED, Order.Status.FAILED)
+            events.emit(order_id, 'out_of_stock')
+            return None
 
-        order.status = Order.Status.STOCK_RESERVED
-        order.save()
+        workflow.mark_done('reserve_stock', order_id)
+        events.emit(order_id, 'stock_reserved')
 
     return order_id
 
+
 @shared_task
-def start_order_workflow(order_id):
+def start_reserved_order_workflows(order_ids):
+    # طلبات create_orders محجوزة مسبقاً: السلسلة تبدأ من الدفع
+    for order_id in order_ids:
+        chain(
+            charge_payment.s(order_id),
+            generate_invoice.s(),
+            notify_shipping.s(),
+        ).delay()
 
-    workflow = chain(
-        reserve_stock.s(order_id),
-        charge_payment.s(),
-        generate_invoice.s(),
-        notify_shipping.s(),
-    )
 
-    workflow.delay()
 
+@shared_task
+def charge_reserved_orders():
+    # beat task; a no-op unless PAYMENT_BATCHING is on
+    if not settings.PAYMENT_BATCHING:
+        return
+    payments.requeue_stale_claims()
+    paid = payments.charge_reserved_orders()['paid']
+    for start in range(0, len(paid), 500):
+        ship_paid_orders.delay(paid[start:start + 500])
+
+
+@shared_task
+def ship_paid_orders(order_ids):
+    logger.info('Generating invoices for %d orders', len(order_ids))
+    with transaction.atomic():
+        Order.objects.filter(id__in=order_ids, status=Order.Status.PAID).update(status=Order.Status.SHIPPED)
+        events.record_many(order_ids, 'shipped')
+
+
+@shared_task
+def relay_outbox():
+    outbox.relay()
+
+
+@shared_task
+def flush_progress_buffer():
+    progress.flush()
+
+
+@shared_task
+def reconcile_trending():
+    trending.reconcile()
+
+
+@shared_task
+def build_curriculum(course_id):
+    from .curriculum import build_curriculum_document, pending_key
+
+    cache.delete(pending_key(course_id))
+    build_curriculum_document(course_id)
 
 
 @shared_task
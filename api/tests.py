@@ -1,3 +1,1758 @@
-from django.test import TestCase
+import gzip
+import json
+import threading
+import time
+from base64 import urlsafe_b64encode
+from io import BytesIO
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import skipIf
+from unittest.mock import patch
 
-# Create your tests here.
+import redis.asyncio
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from . import caching, events, inventory, middleware, outbox, payments, progress, search, trending
+from .async_views import AsyncCourseCurriculum, AsyncCoursesDetails, AsyncLessonDetails, concurrently
+from .cache_serializers import OrjsonSerializer
+from .parsers import ORJSONParser
+from .renderers import ORJSONRenderer
+from .response_cache import acceptable
+from .tiered_cache import LocalTier, TieredRedisCache
+from .budgets import get_query_budget
+from .caching import CATALOG, bump_generation, get_generation, get_or_build
+from .management.commands.benchmark_api import REQUESTS, _api_routes, compare
+from .curriculum import build_curriculum_document, curriculum_queryset, pending_key
+from .stats import rebuild_course_stats
+from .navigation import build_navigation_index, lesson_neighbours, lesson_with_navigation, neighbours
+from .models import (
+    Category, Course, CourseStats, CurriculumDocument, Enrollment, Instructor, Lesson, Module, Order, OrderEvent,
+    OutboxMessage, Product, Resource, SearchEntry, TrainingOption,
+)
+from .projections import CourseProjection, LessonProjection
+from .seeding import CatalogSeeder, CatalogSize, clear_catalog
+from .serializers import CourseCurriculumSerializer, CourseSerializer, LessonSerializer
+from .services import create_order
+from .tasks import (
+    charge_payment, generate_invoice, notify_shipping, reserve_stock, start_order_workflow,
+)
+from .views import (
+    BulkCreateOrders, CourseCurriculum, CoursesDetails, EnrollmentProgress, LessonDetails, ListCourses, ListLesson,
+    Search, TrendingCourses,
+)
+
+try:
+    import fakeredis
+    import fakeredis.aioredis
+except ImportError:  # the Redis-backed tests are skipped without it
+    fakeredis = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+User = get_user_model()
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+# silk stores every request and its queries; keep it out of the counts
+TEST_MIDDLEWARE = [m for m in settings.MIDDLEWARE if not m.startswith('silk.')]
+# django_redis on an in-process fake Redis, for code that talks to Redis directly
+FAKE_REDIS_CACHES = {'default': {
+    'BACKEND': 'django_redis.cache.RedisCache',
+    'LOCATION': 'redis://tests:6379/1',
+    'OPTIONS': {
+        'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        'SERIALIZER': 'api.cache_serializers.OrjsonSerializer',
+        'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection} if fakeredis else {},
+    },
+}}
+# the same fake Redis behind the two-tier backend, with a tiny local tier
+TIERED_CACHES = {'default': {
+    **FAKE_REDIS_CACHES['default'],
+    'BACKEND': 'api.tiered_cache.TieredRedisCache',
+    'OPTIONS': {
+        **FAKE_REDIS_CACHES['default']['OPTIONS'], 'LOCAL_MAX_ENTRIES': 2, 'LOCAL_TIMEOUT': 30,
+        'ASYNC_CONNECTION_CLASS': fakeredis.aioredis.FakeConnection if fakeredis else None,
+    },
+}}
+
+
+def seed_catalog(courses, modules=3, lessons=4, students=3, prefix='c'):
+    """Small catalog built through the ORM (so signals keep the rollups current)."""
+    user = User.objects.create(username=f'{prefix}-instructor')
+    instructor = Instructor.objects.create(user=user, rating=4.5)
+    category = Category.objects.create(name=f'{prefix}-category', slug=f'{prefix}-category')
+    learners = [User.objects.create(username=f'{prefix}-student-{i}') for i in range(students)]
+
+    created = []
+    for c in range(courses):
+        course = Course.objects.create(
+            title=f'Course {prefix}{c}', slug=f'{prefix}-course-{c}',
+            instructor=instructor, category=category if c % 2 else None,
+        )
+        for m in range(modules):
+            module = Module.objects.create(course=course, title=f'Module {m}', order=m + 1)
+            for n in range(lessons):
+                lesson = Lesson.objects.create(
+                    module=module, title=f'Lesson {m}.{n}', order=n + 1,
+                    duration_seconds=60 * (n + 1),
+                )
+                if n % 2:
+                    Resource.objects.create(lesson=lesson, name='Slides', file_url='https://example.com/s.pdf')
+        for learner in learners:
+            Enrollment.objects.create(user=learner, course=course)
+        created.append(course)
+    return created
+
+
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class QueryBudgetTestCase(TestCase):
+    """
+    assertWithinQueryBudget runs a request against datasets of growing size
+    and fails when it goes over the view's @query_budget, or when the query
+    count grows with the data (an N+1).
+    """
+
+    sizes = (1, 3, 6)
+
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def assertWithinQueryBudget(self, view_class, url_for):
+        budget = get_query_budget(view_class)
+        self.assertIsNotNone(budget, f'{view_class.__name__} has no @query_budget')
+
+        counts = []
+        for round_, size in enumerate(self.sizes):
+            courses = seed_catalog(size, modules=size, lessons=size + 1, prefix=f'r{round_}')
+            url = url_for(courses[-1])
+            count = self.count_queries(url)
+            self.assertLessEqual(
+                count, budget,
+                f'{url}: {count} queries, budget is {budget} ({view_class.__name__})',
+            )
+            counts.append(count)
+        self.assertEqual(len(set(counts)), 1, f'query count grows with data size: {counts}')
+
+
+class QueryBudgetTests(QueryBudgetTestCase):
+
+    def test_list_courses(self):
+        self.assertWithinQueryBudget(ListCourses, lambda course: '/api/courses/')
+
+    def test_list_courses_page(self):
+        self.assertWithinQueryBudget(ListCourses, lambda course: '/api/courses/?page_size=2')
+
+    def test_list_courses_stream(self):
+        self.assertWithinQueryBudget(ListCourses, lambda course: '/api/courses/?stream=ndjson')
+
+    def test_course_details(self):
+        self.assertWithinQueryBudget(CoursesDetails, lambda course: f'/api/courses/{course.pk}/curriculum/')
+
+    def test_course_curriculum(self):
+        self.assertWithinQueryBudget(CourseCurriculum, lambda course: f'/api/courses/{course.slug}/')
+
+    def test_list_lessons(self):
+        self.assertWithinQueryBudget(ListLesson, lambda course: '/api/lessons/')
+
+    def test_list_lessons_page(self):
+        self.assertWithinQueryBudget(ListLesson, lambda course: '/api/lessons/?page_size=5')
+
+    def test_lesson_details(self):
+        def url(course):
+            lesson = Lesson.objects.filter(module__course=course).order_by('module__order', 'order')[1]
+            return f'/api/lessons/{lesson.pk}/'
+        self.assertWithinQueryBudget(LessonDetails, url)
+
+    def test_search(self):
+        self.assertWithinQueryBudget(Search, lambda course: '/api/search/?q=lesson&page_size=5')
+
+    def test_lesson_details_navigation_index(self):
+        def url(course):
+            lesson = Lesson.objects.filter(module__course=course).first()
+            return f'/api/lessons/{lesson.pk}/'
+        with self.settings(LESSON_NAVIGATION_INDEX=True):
+            self.assertWithinQueryBudget(LessonDetails, url)
+
+
+def cursor(payload):
+    return urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        seed_catalog(5, modules=2, lessons=2, students=0)
+        # ties on created_at: the id decides
+        Course.objects.filter(pk__in=Course.objects.order_by('pk').values('pk')[:3]).update(
+            created_at=timezone.now(),
+        )
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def assertPagesCover(self, url, expected):
+        forward = self.walk(url, 'next')
+        self.assertEqual(sum(forward, []), expected)
+        self.assertTrue(all(len(page) == 2 for page in forward[:-1]))
+
+        # back from the last page gives the same pages in reverse
+        last = self.client.get(url)
+        while last.data['next']:
+            last = self.client.get(last.data['next'])
+        backward = self.walk(last.data['previous'], 'previous')
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_courses_forward_and_back(self):
+        expected = list(Course.objects.order_by('created_at', 'id').values_list('id', flat=True))
+        self.assertPagesCover('/api/courses/?page_size=2', expected)
+
+    def test_lessons_forward_and_back(self):
+        expected = list(Lesson.objects.order_by('module_id', 'order', 'id').values_list('id', flat=True))
+        self.assertPagesCover('/api/lessons/?page_size=2', expected)
+
+    @skipIf(connection.vendor != 'sqlite', 'reads the SQLite query plan')
+    def test_deep_pages_seek_the_index(self):
+        for path in ('/api/courses/?page_size=2', '/api/lessons/?page_size=2'):
+            page = self.client.get(path).data
+            for link in ('next', 'previous'):
+                url = page['next'] if link == 'next' else self.client.get(page['next']).data['previous']
+                with self.subTest(path=path, link=link), CaptureQueriesContext(connection) as queries:
+                    self.client.get(url)
+                    with connection.cursor() as cursor:
+                        cursor.execute('EXPLAIN QUERY PLAN ' + queries[-1]['sql'])
+                        plan = [row[-1] for row in cursor.fetchall()]
+                    self.assertTrue(plan[0].startswith('SEARCH'), plan)
+                    self.assertFalse([step for step in plan if step.startswith('SCAN')], plan)
+
+    def test_forged_cursors_are_not_found(self):
+        forged = {
+            '/api/lessons/': [
+                {'p': ['x', 'y', 'z']},
+                {'p': [None, None, None]},
+                {'p': [1, 2]},
+                {'p': 'abc'},
+                {'p': [1, 2, 2 ** 70]},
+                {'p': [[1], {}, 3]},
+                [1, 2, 3],
+                {},
+            ],
+            '/api/courses/': [
+                {'p': ['yesterday', 1]},
+                {'p': [None, 1]},
+            ],
+            '/api/search/?q=lesson&': [
+                {'p': ['x', 1]},
+                {'p': [None, 1]},
+                {'p': ['nan', 1]},
+                {'p': [1.0, 2 ** 70]},
+            ],
+        }
+        for path, payloads in forged.items():
+            joiner = '' if path.endswith('&') else '?'
+            for payload in payloads:
+                with self.subTest(path=path, payload=payload):
+                    response = self.client.get(f'{path}{joiner}cursor={cursor(payload)}')
+                    self.assertEqual(response.status_code, 404)
+                    self.assertEqual(response.data, {'detail': 'Invalid cursor'})
+        for token in ('not-base64!', urlsafe_b64encode(b'not json').decode(), urlsafe_b64encode(b'\xff').decode()):
+            with self.subTest(token=token):
+                self.assertEqual(self.client.get(f'/api/lessons/?cursor={token}').status_code, 404)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CourseStatsTests(TestCase):
+    """The rollup kept by the signals always equals a rebuild from scratch."""
+
+    def setUp(self):
+        self.first, self.second = seed_catalog(2, modules=2, lessons=2, students=1)
+
+    def stats(self):
+        return {
+            row[0]: row[1:] for row in CourseStats.objects.order_by('course_id').values_list(
+                'course_id', 'modules_count', 'lessons_count', 'resources_count', 'students_count',
+                'total_duration_seconds',
+            )
+        }
+
+    def assertConsistent(self):
+        incremental = self.stats()
+        rebuild_course_stats()
+        self.assertEqual(incremental, self.stats())
+
+    def test_creates_and_deletes(self):
+        module = Module.objects.create(course=self.first, title='Extra', order=9)
+        lesson = Lesson.objects.create(module=module, title='Extra', order=1, duration_seconds=30)
+        Resource.objects.create(lesson=lesson, name='Notes', file_url='https://example.com/n.pdf')
+        Enrollment.objects.create(user=User.objects.create(username='late'), course=self.first)
+        self.assertConsistent()
+        Lesson.objects.filter(module__course=self.second).first().delete()
+        module.delete()
+        self.assertConsistent()
+
+    def test_duration_change(self):
+        lesson = Lesson.objects.filter(module__course=self.first).first()
+        lesson.duration_seconds += 100
+        lesson.save()
+        self.assertConsistent()
+
+    def test_lesson_moved_to_another_course(self):
+        lesson = Lesson.objects.filter(module__course=self.first).first()
+        lesson.module, lesson.order = Module.objects.filter(course=self.second).first(), 99
+        lesson.save()
+        self.assertConsistent()
+
+    def test_module_moved_to_another_course(self):
+        module = Module.objects.filter(course=self.first).first()
+        module.course, module.order = self.second, 99
+        module.save(update_fields=['course', 'order'])
+        self.assertConsistent()
+
+    def test_resource_moved_to_another_course(self):
+        resource = Resource.objects.filter(lesson__module__course=self.first).first()
+        resource.lesson = Lesson.objects.filter(module__course=self.second).first()
+        resource.save()
+        self.assertConsistent()
+
+    def test_enrollment_moved_to_another_course(self):
+        enrollment = Enrollment.objects.create(user=User.objects.create(username='mover'), course=self.first)
+        enrollment.course = self.second
+        enrollment.save()
+        self.assertConsistent()
+
+    def test_progress_saves_leave_the_course_alone(self):
+        before = dict(CourseStats.objects.values_list('course_id', 'version'))
+        enrollment = Enrollment.objects.filter(course=self.first).first()
+        enrollment.progress = 50
+        enrollment.save(update_fields=['progress'])
+        enrollment.progress = 60
+        enrollment.save()
+        self.assertEqual(dict(CourseStats.objects.values_list('course_id', 'version')), before)
+
+    def test_course_delete_skips_the_per_row_handlers(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.first.delete()
+        sql = [query['sql'] for query in queries]
+        # course_deleted's own version bump only, no counter shift or entry delete per row
+        self.assertLessEqual(len([q for q in sql if q.startswith('UPDATE "api_coursestats"')]), 1)
+        self.assertFalse([q for q in sql if q.startswith('DELETE FROM "api_searchentry" WHERE ("api_searchentry"."kind"')])
+        self.assertFalse(SearchEntry.objects.filter(course_id=self.first.pk).exists())
+        self.assertConsistent()
+
+    def test_move_bumps_both_versions(self):
+        before = dict(CourseStats.objects.values_list('course_id', 'curriculum_version'))
+        lesson = Lesson.objects.filter(module__course=self.first).first()
+        lesson.module, lesson.order = Module.objects.filter(course=self.second).first(), 99
+        lesson.save()
+        after = dict(CourseStats.objects.values_list('course_id', 'curriculum_version'))
+        self.assertGreater(after[self.first.pk], before[self.first.pk])
+        self.assertGreater(after[self.second.pk], before[self.second.pk])
+
+
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class CatalogSeederTests(TestCase):
+
+    def seed(self):
+        size = CatalogSize(3, modules_per_course=2, lessons_per_module=4, students=8,
+                           enrollments_per_course=5, instructors=2)
+        CatalogSeeder(size, seed=7, batch_size=7).run()
+        return size
+
+    def snapshot(self):
+        return {
+            'courses': list(Course.objects.order_by('pk').values_list(
+                'pk', 'title', 'slug', 'instructor_id', 'category__name', 'published',
+            )),
+            'modules': list(Module.objects.order_by('pk').values_list('pk', 'course_id', 'order', 'title')),
+            'lessons': list(Lesson.objects.order_by('pk').values_list('pk', 'module_id', 'order', 'title', 'duration_seconds')),
+            'resources': list(Resource.objects.order_by('pk').values_list('pk', 'lesson_id', 'name')),
+            'enrollments': list(Enrollment.objects.order_by('pk').values_list('user_id', 'course_id', 'progress')),
+        }
+
+    def test_counts(self):
+        size = self.seed()
+        counts = size.as_dict()
+        self.assertEqual(counts, {
+            'courses': 3, 'modules': 6, 'lessons': 24, 'resources': 12, 'students': 8, 'enrollments': 15,
+        })
+        self.assertEqual(Course.objects.count(), counts['courses'])
+        self.assertEqual(Module.objects.count(), counts['modules'])
+        self.assertEqual(Lesson.objects.count(), counts['lessons'])
+        self.assertEqual(Resource.objects.count(), counts['resources'])
+        self.assertEqual(Enrollment.objects.count(), counts['enrollments'])
+        self.assertEqual(User.objects.filter(username__startswith='student').count(), counts['students'])
+        self.assertEqual(Instructor.objects.count(), 2)
+
+    def test_same_seed_same_catalog(self):
+        self.seed()
+        first = self.snapshot()
+        clear_catalog()
+        self.assertFalse(Course.objects.exists())
+        self.seed()
+        self.assertEqual(self.snapshot(), first)
+
+    def test_derived_rows_match_the_catalog(self):
+        self.seed()
+        stats = {
+            row[0]: row[1:] for row in CourseStats.objects.values_list(
+                'course_id', 'modules_count', 'lessons_count', 'resources_count', 'students_count',
+                'total_duration_seconds',
+            )
+        }
+        expected = {
+            course.pk: (
+                course.modules.count(),
+                Lesson.objects.filter(module__course=course).count(),
+                Resource.objects.filter(lesson__module__course=course).count(),
+                course.enrollments.count(),
+                sum(Lesson.objects.filter(module__course=course).values_list('duration_seconds', flat=True)),
+            )
+            for course in Course.objects.all()
+        }
+        self.assertEqual(stats, expected)
+
+        entries = set(SearchEntry.objects.values_list('kind', 'object_id', 'title'))
+        self.assertEqual(entries, {
+            *(('course', pk, title) for pk, title in Course.objects.values_list('pk', 'title')),
+            *(('module', pk, title) for pk, title in Module.objects.values_list('pk', 'title')),
+            *(('lesson', pk, title) for pk, title in Lesson.objects.values_list('pk', 'title')),
+            *(('resource', pk, name) for pk, name in Resource.objects.values_list('pk', 'name')),
+        })
+
+        for course_id, body in CurriculumDocument.objects.values_list('course_id', 'body'):
+            self.assertEqual(bytes(body), build_curriculum_document(course_id).body)
+        self.assertEqual(CurriculumDocument.objects.count(), Course.objects.count())
+
+    def test_clear_keeps_what_seeding_did_not_create(self):
+        admin = User.objects.create(username='admin', is_superuser=True)
+        user = User.objects.create(username='student-teacher', email='st@example.com')
+        category = Category.objects.create(name='Own category', slug='own')
+        self.seed()
+        clear_catalog()
+        self.assertEqual(set(User.objects.all()), {admin, user})
+        self.assertEqual(list(Category.objects.all()), [category])
+        self.assertFalse(TrainingOption.objects.exists())
+        self.assertFalse(SearchEntry.objects.exists())
+
+
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class QueryTelemetryMiddlewareTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        middleware.reset()
+        self.course = seed_catalog(1)[0]
+
+    def test_records_queries_per_route(self):
+        self.client.get('/api/courses/')
+        self.client.get(f'/api/courses/{self.course.pk}/curriculum/')
+        cache.clear()
+        self.client.get('/api/courses/')
+
+        routes = middleware.snapshot()['routes']
+        self.assertEqual(routes['api/courses/']['requests'], 2)
+        self.assertEqual(routes['api/courses/']['queries'], 2)
+        self.assertEqual(routes['api/courses/<slug:slug>/curriculum/']['requests'], 1)
+        self.assertEqual(routes['api/courses/']['over_budget'], 0)
+
+    def test_counts_sync_views_under_asgi(self):
+        # Django runs a sync view on a thread of its own under ASGI
+        async def get():
+            return await AsyncClient().get('/api/lessons/?page_size=5')
+
+        async_to_sync(get)()
+        self.client.get('/api/lessons/?page_size=5')
+        stats = middleware.snapshot()['routes']['api/lessons/']
+        self.assertEqual((stats['requests'], stats['queries']), (2, 2))
+
+    def test_flags_requests_over_budget(self):
+        with patch.object(ListCourses, 'query_budget', 0), self.assertLogs('api.queries', level='WARNING'):
+            self.client.get('/api/courses/')
+        self.assertEqual(middleware.snapshot()['routes']['api/courses/']['over_budget'], 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class GetOrBuildTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.builds = []
+
+    def builder(self, value):
+        def build():
+            self.builds.append(value)
+            return value
+        return build
+
+    def versioned_key(self):
+        return f'key:{get_generation(CATALOG)}'
+
+    def test_builds_once_until_the_generation_moves(self):
+        self.assertEqual(get_or_build('key', self.builder('v1')), 'v1')
+        self.assertEqual(get_or_build('key', self.builder('v2')), 'v1')
+        self.assertEqual(self.builds, ['v1'])
+
+        bump_generation('course:1')  # another scope: same entry
+        self.assertEqual(get_or_build('key', self.builder('v2')), 'v1')
+        bump_generation(CATALOG)
+        self.assertEqual(get_or_build('key', self.builder('v2')), 'v2')
+        self.assertEqual(self.builds, ['v1', 'v2'])
+
+    def test_lock_holders_build_others_serve_stale(self):
+        get_or_build('key', self.builder('v1'))
+        bump_generation(CATALOG)
+        cache.add('lock:key', 1)  # another worker is rebuilding
+        self.assertEqual(get_or_build('key', self.builder('v2')), 'v1')
+        self.assertEqual(self.builds, ['v1'])
+        self.assertIsNone(cache.get(self.versioned_key()))
+
+        cache.delete('lock:key')
+        self.assertEqual(get_or_build('key', self.builder('v2')), 'v2')
+        self.assertIsNone(cache.get('lock:key'))
+
+    def test_slow_builds_leave_the_next_holders_lock(self):
+        def build():
+            # the lock timed out mid-build and another worker took it
+            cache.set('lock:key', 'theirs')
+            return 'v1'
+
+        async def abuild():
+            await cache.aset('lock:akey', 'theirs')
+            return 'v1'
+
+        self.assertEqual(get_or_build('key', build), 'v1')
+        self.assertEqual(cache.get('lock:key'), 'theirs')
+        self.assertEqual(async_to_sync(caching.aget_or_build)('akey', abuild), 'v1')
+        self.assertEqual(cache.get('lock:akey'), 'theirs')
+
+    def test_cold_start_waits_for_the_lock_holder(self):
+        cache.add('lock:key', 1)
+        versioned_key = self.versioned_key()
+
+        def winner_lands(seconds):
+            cache.set(versioned_key, {'v': 'theirs', 'x': time.time() + 60, 'd': 0.01})
+
+        with patch('api.caching.time.sleep', side_effect=winner_lands) as sleep:
+            self.assertEqual(get_or_build('key', self.builder('mine')), 'theirs')
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(self.builds, [])
+
+        # the holder never finishes: build without it rather than fail
+        cache.delete(versioned_key)
+        with patch('api.caching.time.sleep') as sleep:
+            self.assertEqual(get_or_build('key', self.builder('mine')), 'mine')
+        self.assertEqual(sleep.call_count, caching.WAIT_ATTEMPTS)
+
+    def test_refreshes_early_near_expiry(self):
+        # one second left on a value that took ten to build
+        cache.set(self.versioned_key(), {'v': 'old', 'x': time.time() + 1, 'd': 10})
+        with patch('api.caching.random.random', return_value=0.99):
+            self.assertEqual(get_or_build('key', self.builder('new')), 'old')
+        with patch('api.caching.random.random', return_value=0.5):
+            self.assertEqual(get_or_build('key', self.builder('new'), beta=0), 'old')
+            self.assertEqual(get_or_build('key', self.builder('new')), 'new')
+        self.assertEqual(self.builds, ['new'])
+
+        entry = cache.get(self.versioned_key())
+        self.assertEqual(entry['v'], 'new')
+        self.assertGreater(entry['x'], time.time() + caching.DEFAULT_TIMEOUT - 5)
+        self.assertEqual(cache.get('key:stale')['v'], 'new')
+
+
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.courses = seed_catalog(2)
+
+    def get(self, url='/api/courses/', encoding='gzip, deflate'):
+        return self.client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+
+    def test_hits_serve_the_stored_compressed_body(self):
+        plain = self.get(encoding='')
+        self.assertNotIn('Content-Encoding', plain)
+        with CaptureQueriesContext(connection) as queries:
+            compressed = self.get()
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(compressed['Content-Type'], 'application/json')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(len(json.loads(plain.content)), 2)
+
+    @skipIf(brotli is None, 'needs brotli')
+    def test_brotli_when_preferred(self):
+        plain = self.get(encoding='')
+        compressed = self.get(encoding='gzip;q=0.5, br')
+        self.assertEqual(compressed['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(compressed.content), plain.content)
+
+    def test_generation_bump_replaces_the_body(self):
+        self.get()
+        Course.objects.filter(pk=self.courses[0].pk).update(title='Renamed')
+        self.assertNotIn('Renamed', gzip.decompress(self.get().content).decode())
+        bump_generation(CATALOG)  # what the catalog signals do on commit
+        titles = {row['title'] for row in json.loads(gzip.decompress(self.get().content))}
+        self.assertIn('Renamed', titles)
+
+    def test_browsable_api_is_rendered_as_usual(self):
+        response = self.client.get('/api/courses/', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+    def test_accept_encoding_negotiation(self):
+        self.assertEqual(acceptable(''), ['identity'])
+        self.assertEqual(acceptable('gzip;q=0, deflate'), ['identity'])
+        self.assertEqual(acceptable('GZIP, identity;q=0'), ['gzip'])
+        self.assertEqual(acceptable('*;q=0'), ['identity'])  # nothing else to send
+
+    def test_orjson_serializer_matches_json_serializer(self):
+        serializer = OrjsonSerializer({})
+        value = {'price': Decimal('9.90'), 'at': timezone.now(), 1: [1, 2], 'title': 'دورة'}
+        expected = json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+        self.assertEqual(serializer.loads(serializer.dumps(value)), expected)
+        self.assertEqual(serializer.loads(serializer.dumps(b'{"raw": 1}')), b'{"raw": 1}')
+
+
+class JSONRendererTests(TestCase):
+    payload = {
+        'price': Decimal('19.90'),
+        'progress': Decimal('33.33'),
+        'at': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        'day': date(2024, 5, 1),
+        'took': timedelta(seconds=90),
+        'label': gettext_lazy('Course'),
+        'text': 'دورة\u2028',
+        1: [None, True, 1.5],
+    }
+
+    def test_output_matches_drf(self):
+        self.assertEqual(ORJSONRenderer().render(self.payload), JSONRenderer().render(self.payload))
+
+    def test_indented_output_falls_back(self):
+        context = {'indent': 4}
+        self.assertEqual(
+            ORJSONRenderer().render(self.payload, renderer_context=context),
+            JSONRenderer().render(self.payload, renderer_context=context),
+        )
+
+    def test_parser(self):
+        parse = lambda body: ORJSONParser().parse(BytesIO(body))
+        self.assertEqual(parse('{"title": "دورة", "n": [1, 2.5]}'.encode()), {'title': 'دورة', 'n': [1, 2.5]})
+        self.assertEqual(parse(b'{"big": 123456789012345678901234567890}'), {'big': 123456789012345678901234567890})
+        with self.assertRaises(ParseError):
+            parse(b'{"n": NaN}')
+        with self.assertRaises(ParseError):
+            parse(b'{"broken": ')
+
+
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class SparseFieldsetTests(TestCase):
+    """?fields= drops the joins and columns of the fields left out (optimize_queryset)."""
+
+    def setUp(self):
+        cache.clear()
+        self.course = seed_catalog(2, modules=2, lessons=2, students=1)[-1]
+        self.lesson = Lesson.objects.filter(module__course=self.course).order_by('module__order', 'order')[1]
+
+    def body_query(self, url):
+        # after the version stamp: the query that loads what is shown
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, queries[-1]['sql']
+
+    def test_course_details(self):
+        url = f'/api/courses/{self.course.pk}/curriculum/'
+        response, sql = self.body_query(url)
+        for table in ('api_category', 'api_instructor', 'auth_user', 'api_coursestats'):
+            self.assertIn(f'JOIN "{table}"', sql)
+
+        response, sql = self.body_query(f'{url}?fields=id,title')
+        self.assertEqual(list(response.data[0]), ['id', 'title'])
+        self.assertNotIn('JOIN', sql)
+        self.assertTrue(sql.startswith('SELECT "api_course"."id", "api_course"."title" FROM'), sql)
+
+        response, sql = self.body_query(f'{url}?fields=id,instructor')
+        self.assertEqual(response.data[0]['instructor'], {'user': 'c-instructor', 'rating': 4.5})
+        self.assertIn('JOIN "auth_user"', sql)
+        for table in ('api_category', 'api_coursestats'):
+            self.assertNotIn(f'"{table}"', sql)
+
+    def test_lesson_details(self):
+        url = f'/api/lessons/{self.lesson.pk}/'
+        response, sql = self.body_query(url)
+        for fragment in ('"api_resource"', 'LAG(', 'LEAD(', '"api_module"'):
+            self.assertIn(fragment, sql)
+
+        response, sql = self.body_query(f'{url}?fields=id,title')
+        self.assertEqual(response.data, {'id': self.lesson.pk, 'title': self.lesson.title})
+        self.assertTrue(sql.startswith('SELECT "api_lesson"."id", "api_lesson"."title" FROM'), sql)
+        for fragment in ('JOIN', '"api_resource"', 'LAG(', 'video_url'):
+            self.assertNotIn(fragment, sql)
+
+        response, sql = self.body_query(f'{url}?fields=id,module_name')
+        self.assertEqual(response.data['module_name'], self.lesson.module.title)
+        self.assertIn('JOIN "api_module"', sql)
+        for fragment in ('"api_course"', '"api_resource"', 'LAG('):
+            self.assertNotIn(fragment, sql)
+
+
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class ProjectionTests(TestCase):
+    """The values() projections render the same JSON as the serializers they stand in for."""
+
+    def setUp(self):
+        cache.clear()
+        courses = seed_catalog(4, modules=2, lessons=2, students=1)
+        # courses[0] has no category; only courses[2] has videos
+        Lesson.objects.filter(module__course=courses[2]).update(video_url='https://example.com/v.mp4')
+        # courses[3] has no stats row: its counters are 0 either way
+        CourseStats.objects.filter(course=courses[3]).delete()
+
+    def assertSameJSON(self, projected, serialized):
+        render = JSONRenderer().render
+        self.assertEqual(json.loads(render(projected)), json.loads(render(serialized)))
+
+    def test_course_projection(self):
+        fields_sets = [None, ['id', 'title'], ['id', 'category', 'instructor'], ['number_of_lessons', 'slug']]
+        for fields in fields_sets:
+            with self.subTest(fields=fields):
+                projection = CourseProjection(fields)
+                projected = projection.many(projection.queryset(Course.objects.order_by('id')))
+                queryset = CourseSerializer.optimize_queryset(Course.objects.order_by('id'), fields)
+                self.assertSameJSON(projected, CourseSerializer(queryset, many=True, fields=fields).data)
+                self.assertEqual(len(projected), 4)
+
+    def test_lesson_projection(self):
+        for fields in (ListLesson.list_fields, ['id', 'course_title'], ['video_url']):
+            with self.subTest(fields=fields):
+                projection = LessonProjection(fields)
+                projected = projection.many(projection.queryset(Lesson.objects.order_by('id')))
+                queryset = LessonSerializer.optimize_queryset(Lesson.objects.order_by('id'), fields)
+                self.assertSameJSON(projected, LessonSerializer(queryset, many=True, fields=fields).data)
+                self.assertEqual(len(projected), 16)
+
+    def test_list_endpoints_serve_the_projection(self):
+        by_id = lambda row: row['id']
+        courses = json.loads(self.client.get('/api/courses/').content)
+        serialized = CourseSerializer(CourseSerializer.optimize_queryset(Course.objects.all()), many=True).data
+        self.assertSameJSON(sorted(courses, key=by_id), sorted(serialized, key=by_id))
+
+
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class StreamingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        seed_catalog(4, modules=2, lessons=3, students=0)
+
+    def streamed(self, url):
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def paged(self, url):
+        rows, url = [], f'{url}page_size=5'
+        while url:
+            page = json.loads(self.client.get(url).content)
+            rows += page['results']
+            url = page['next']
+        return rows
+
+    def test_matches_the_unstreamed_list(self):
+        for path in ('/api/courses/', '/api/lessons/'):
+            for query in ('', 'fields=id,title&'):
+                with self.subTest(path=path, query=query), patch('api.streaming.BUFFER_SIZE', 100):
+                    plain = json.loads(self.client.get(f'{path}?{query}').content)
+                    response, body = self.streamed(f'{path}?{query}stream=json')
+                    self.assertEqual(response['Content-Type'], 'application/json')
+                    streamed = json.loads(body)
+                    by_id = lambda row: row['id']
+                    self.assertEqual(sorted(streamed, key=by_id), sorted(plain, key=by_id))
+                    # the keyset order, as the pages give it
+                    self.assertEqual(streamed, self.paged(f'{path}?{query}'))
+
+                    response, body = self.streamed(f'{path}?{query}stream=ndjson')
+                    self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+                    self.assertTrue(body.endswith(b'\n'))
+                    self.assertEqual([json.loads(line) for line in body.splitlines()], streamed)
+
+    def test_empty_list(self):
+        Course.objects.all().delete()
+        self.assertEqual(self.streamed('/api/courses/?stream=1')[1], b'[]')
+        self.assertEqual(self.streamed('/api/lessons/?stream=ndjson')[1], b'')
+
+
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class LessonNavigationTests(TestCase):
+    """LAG/LEAD and the cached index against plain per-lesson lookups."""
+
+    def setUp(self):
+        cache.clear()
+        other, self.course = seed_catalog(2, modules=3, lessons=3, students=0)
+        # modules out of creation order, gaps in the numbering, an empty module
+        modules = list(Module.objects.filter(course=self.course).order_by('order'))
+        modules[0].order, modules[2].order = 30, 5
+        for module in modules:
+            module.save(update_fields=['order'])
+        Module.objects.create(course=self.course, title='Empty', order=10)
+        Lesson.objects.filter(module=modules[1], order=2).update(order=7)
+
+    def expected(self, lesson):
+        course_lessons = Lesson.objects.filter(module__course_id=lesson.module.course_id)
+        mo, o = lesson.module.order, lesson.order
+        previous_lesson = course_lessons.filter(
+            Q(module__order__lt=mo) | Q(module__order=mo, order__lt=o),
+        ).order_by('-module__order', '-order').first()
+        next_lesson = course_lessons.filter(
+            Q(module__order__gt=mo) | Q(module__order=mo, order__gt=o),
+        ).order_by('module__order', 'order').first()
+        return tuple(
+            {'id': neighbour.id, 'title': neighbour.title} if neighbour else None
+            for neighbour in (previous_lesson, next_lesson)
+        )
+
+    def test_matches_per_lesson_lookups(self):
+        lessons = list(
+            Lesson.objects.filter(module__course=self.course).select_related('module')
+            .order_by('module__order', 'order')
+        )
+        index = build_navigation_index(self.course.pk)
+        crossings = 0
+        for lesson in lessons:
+            expected = self.expected(lesson)
+            with self.subTest(lesson=lesson.title):
+                row = lesson_with_navigation(lesson.pk).get()
+                annotated = tuple(
+                    {'id': id_, 'title': title} if id_ is not None else None
+                    for id_, title in ((row.previous_lesson_id, row.previous_lesson_title),
+                                       (row.next_lesson_id, row.next_lesson_title))
+                )
+                self.assertEqual(annotated, expected)
+                self.assertEqual(lesson_neighbours(lesson.pk), expected)
+                self.assertEqual(neighbours(index, lesson.pk), expected)
+                data = self.client.get(f'/api/lessons/{lesson.pk}/').data
+                self.assertEqual((data['previous_lesson'], data['next_lesson']), expected)
+            if expected[1] and Lesson.objects.get(pk=expected[1]['id']).module_id != lesson.module_id:
+                crossings += 1
+
+        # course edges, and next across every module boundary (the empty one skipped)
+        self.assertIsNone(self.expected(lessons[0])[0])
+        self.assertIsNone(self.expected(lessons[-1])[1])
+        self.assertEqual(crossings, 2)
+
+    def test_unknown_lesson(self):
+        self.assertEqual(lesson_neighbours(999999), (None, None))
+        self.assertEqual(neighbours(build_navigation_index(self.course.pk), 999999), (None, None))
+
+
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE, CURRICULUM_REBUILD_DELAY=5)
+class CurriculumDocumentTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.course = seed_catalog(2, modules=2, lessons=2)[-1]
+
+    def test_a_burst_of_saves_schedules_one_rebuild(self):
+        lesson = Lesson.objects.filter(module__course=self.course).first()
+        with patch('api.tasks.build_curriculum.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                lesson.title = 'Edited'
+                lesson.save()
+                lesson.module.title = 'Edited module'
+                lesson.module.save()
+                Resource.objects.create(lesson=lesson, name='Notes', file_url='https://example.com/n.pdf')
+            apply_async.assert_called_once_with((self.course.pk,), countdown=5)
+
+            # the task clears the flag before it builds: the next edit queues again
+            cache.delete(pending_key(self.course.pk))
+            with self.captureOnCommitCallbacks(execute=True):
+                lesson.save()
+            self.assertEqual(apply_async.call_count, 2)
+
+    def test_document_is_the_serializer_output(self):
+        document = build_curriculum_document(self.course.pk)
+        course = curriculum_queryset().get(pk=self.course.pk)
+        expected = json.loads(JSONRenderer().render(CourseCurriculumSerializer(course).data))
+        self.assertEqual(json.loads(document.body), expected)
+        self.assertEqual(json.loads(self.client.get(f'/api/courses/{self.course.slug}/').content), expected)
+
+
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.course = seed_catalog(1, modules=1, lessons=2, students=1)[0]
+        self.lesson = Lesson.objects.filter(module__course=self.course).first()
+
+    def assertNotModified(self, url, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304, url)
+        self.assertEqual(len(queries), 1, [query['sql'] for query in queries])
+        return response
+
+    def edit_lesson(self):
+        self.lesson.title = 'Edited'
+        self.lesson.save()
+
+    def test_course_details(self):
+        url = f'/api/courses/{self.course.pk}/curriculum/'
+        first = self.client.get(url)
+        self.assertTrue(first['ETag'].startswith('W/"'))
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertNotModified(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        # another representation, another tag
+        self.assertNotEqual(self.client.get(f'{url}?fields=id,title')['ETag'], first['ETag'])
+
+        Enrollment.objects.create(user=User.objects.create(username='late'), course=self.course)
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data[0]['number_of_students'], 2)
+
+    def test_course_details_follow_instructor_and_category(self):
+        url = f'/api/courses/{self.course.pk}/curriculum/'
+        category = Category.objects.create(name='Old', slug='old')
+        self.course.category = category
+        self.course.save()
+        instructor = self.course.instructor
+
+        def rate():
+            instructor.rating = 3.0
+            instructor.save()
+
+        def rename_category():
+            category.name = 'New'
+            category.save()
+
+        def rename_user():
+            instructor.user.username = 'renamed'
+            instructor.user.save()
+
+        for change in (rate, rename_category, rename_user):
+            first = self.client.get(url)
+            change()
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(second.status_code, 200, change.__name__)
+        self.assertEqual(second.data[0]['category'], 'New')
+        self.assertEqual(second.data[0]['instructor'], {'user': 'renamed', 'rating': 3.0})
+
+        # logins don't change what the course shows
+        first = self.client.get(url)
+        instructor.user.save(update_fields=['last_login'])
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        category.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_live_curriculum_follows_the_tree(self):
+        url = f'/api/courses/{self.course.slug}/'
+        first = self.client.get(url)
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        # enrollments don't show in the curriculum
+        Enrollment.objects.create(user=User.objects.create(username='late'), course=self.course)
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.edit_lesson()
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertIn('Edited', second.content.decode())
+
+    def test_stored_document_keeps_its_own_version(self):
+        build_curriculum_document(self.course.pk)
+        url = f'/api/courses/{self.course.slug}/'
+        first = self.client.get(url)
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        # the document isn't rebuilt yet: still the same bytes, still current
+        self.edit_lesson()
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        build_curriculum_document(self.course.pk)
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertIn(b'Edited', second.content)
+
+    def test_lesson_details(self):
+        url = f'/api/lessons/{self.lesson.pk}/'
+        first = self.client.get(url)
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.edit_lesson()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        self.assertEqual(self.client.get('/api/lessons/999999/').status_code, 404)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class StockReservationTests(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Keyboard', price=10, stock=5)
+
+    def test_reserve_never_oversells(self):
+        self.assertTrue(inventory.reserve(self.product.id, 3))
+        self.assertFalse(inventory.reserve(self.product.id, 3))
+        self.assertTrue(inventory.reserve(self.product.id, 2))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+
+    def test_sharded_stock(self):
+        inventory.set_stock_shards(self.product.id, 3)
+        self.assertEqual(inventory.available_stock(self.product.id), 5)
+        # shards hold 2/2/1: the third reservation has to gather across shards
+        self.assertTrue(inventory.reserve(self.product.id, 2))
+        self.assertTrue(inventory.reserve(self.product.id, 2))
+        self.assertFalse(inventory.reserve(self.product.id, 2))
+        self.assertTrue(inventory.reserve(self.product.id, 1))
+        self.assertEqual(inventory.available_stock(self.product.id), 0)
+
+        inventory.release(self.product.id, 4)
+        inventory.set_stock_shards(self.product.id, 0)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.stock_shards), (4, 0))
+
+    def test_reserve_stock_task(self):
+        first = Order.objects.create(product=self.product, quantity=4)
+        second = Order.objects.create(product=self.product, quantity=4)
+        self.assertEqual(reserve_stock.apply(args=(first.id,)).get(), first.id)
+        self.assertIsNone(reserve_stock.apply(args=(second.id,)).get())
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), (Order.Status.STOCK_RESERVED, Order.Status.FAILED))
+
+
+
+
+@override_settings(CACHES=TEST_CACHES, ORDER_EVENT_FLUSH_INTERVAL=None)
+@patch('api.tasks.random.random', return_value=1.0)  # no simulated gateway failures
+class OrderWorkflowTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Mouse', price=10, stock=10)
+        self.order = Order.objects.create(product=self.product, quantity=2)
+
+    def run_workflow(self):
+        result = reserve_stock.apply(args=(self.order.id, self.product.id, 2)).get()
+        for step in (charge_payment, generate_invoice, notify_shipping):
+            result = step.apply(args=(result,)).get()
+        return result
+
+    def test_each_step_is_one_guarded_update(self, _random):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.run_workflow(), self.order.id)
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('UPDATE', 'SELECT'))]
+        # reserve: order + product, charge: order, ship: order; no reads at all
+        self.assertEqual(len(writes), 4, writes)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.SHIPPED)
+
+    def test_retries_are_no_ops(self, _random):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_workflow()
+        with self.assertNumQueries(0):
+            self.run_workflow()
+
+        # idempotency keys gone: the status guard still stops the steps
+        cache.clear()
+        self.assertEqual(self.run_workflow(), self.order.id)
+        self.product.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((self.product.stock, self.order.status), (8, Order.Status.SHIPPED))
+
+    def test_events_are_buffered_and_written_in_one_insert(self, _random):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_workflow()
+        self.assertFalse(OrderEvent.objects.exists())
+        with self.assertNumQueries(1):
+            self.assertEqual(events.flush(), 4)
+        self.assertEqual(
+            list(OrderEvent.objects.order_by('id').values_list('kind', flat=True)),
+            ['stock_reserved', 'paid', 'invoiced', 'shipped'],
+        )
+
+    def test_late_step_cannot_move_order_back(self, _random):
+        Order.objects.filter(id=self.order.id).update(status=Order.Status.FAILED)
+        self.assertIsNone(charge_payment.apply(args=(self.order.id,)).get())
+        self.assertIsNone(notify_shipping.apply(args=(None,)).get())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.FAILED)
+
+
+
+@override_settings(PAYMENT_BATCHING=True, PAYMENT_RETRY_DELAY=0, PAYMENT_CONCURRENCY=4, PAYMENT_MAX_ATTEMPTS=3)
+class BatchPaymentTests(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Headset', price=25, stock=0)
+        Order.objects.bulk_create([
+            Order(product=self.product, quantity=1, status=Order.Status.STOCK_RESERVED) for _ in range(40)
+        ])
+
+    def test_charges_until_every_order_is_settled(self):
+        gateway = payments.FakeGateway(latency=0, failure_rate=0.4, decline_rate=0.1, seed=3)
+        rounds = 0
+        while payments.charge_reserved_orders(gateway=gateway, batch_size=15)['retry']:
+            rounds += 1
+        self.assertGreater(rounds, 0)
+
+        statuses = dict(Order.objects.values_list('status').annotate(n=Count('id')).order_by())
+        self.assertEqual(set(statuses), {Order.Status.PAID, Order.Status.FAILED})
+        self.assertEqual(statuses[Order.Status.PAID], sum(r.ok for r in gateway.settled.values()))
+        # every failed order gave its unit back
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, statuses[Order.Status.FAILED])
+
+    def test_batch_costs_the_same_queries_whatever_its_size(self):
+        gateway = payments.FakeGateway(latency=0, failure_rate=0)
+        with CaptureQueriesContext(connection) as small:
+            payments.charge_reserved_orders(gateway=gateway, batch_size=5, max_batches=1)
+        with CaptureQueriesContext(connection) as large:
+            payments.charge_reserved_orders(gateway=gateway, batch_size=35, max_batches=1)
+        self.assertEqual(len(small), len(large))
+        self.assertFalse(Order.objects.exclude(status=Order.Status.PAID).exists())
+
+    def test_a_raising_charge_is_retried_alone(self):
+        broken = Order.objects.order_by('id').values_list('id', flat=True)[3]
+
+        class Flaky(payments.FakeGateway):
+            def charge(self, charge):
+                if charge.order_id == broken:
+                    raise ConnectionError('Connection reset by peer')
+                return super().charge(charge)
+
+        gateway = Flaky(latency=0, failure_rate=0)
+        with self.assertLogs('api.payments', 'ERROR'):
+            results = gateway.charge_many([payments.Charge(broken, 25, 'k'), payments.Charge(0, 25, 'j')], concurrency=2)
+        self.assertEqual(results, [
+            payments.ChargeResult(broken, False, True, 'ConnectionError: Connection reset by peer'),
+            payments.ChargeResult(0, True, False, ''),
+        ])
+
+        with self.assertLogs('api.payments', 'ERROR'):
+            totals = payments.charge_reserved_orders(gateway=gateway, batch_size=40, max_batches=1)
+        self.assertEqual(totals['retry'], [broken])
+        self.assertEqual(len(totals['paid']), 39)
+        self.assertEqual(Order.objects.get(pk=broken).status, Order.Status.STOCK_RESERVED)
+
+    def test_stale_claims_are_requeued(self):
+        Order.objects.update(status=Order.Status.CHARGING, charge_claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(payments.requeue_stale_claims(), 40)
+        self.assertEqual(Order.objects.filter(status=Order.Status.STOCK_RESERVED).count(), 40)
+
+
+@override_settings(MIDDLEWARE=TEST_MIDDLEWARE)
+class BulkOrderTests(TestCase):
+
+    def post(self, items):
+        return self.client.post('/api/orders/bulk/', {'items': items}, content_type='application/json')
+
+    def test_partial_failures_reported_per_item(self):
+        scarce = Product.objects.create(name='Scarce', price=5, stock=5)
+        plenty = Product.objects.create(name='Plenty', price=5, stock=100)
+        response = self.post([
+            {'product_id': scarce.id, 'quantity': 3},
+            {'product_id': plenty.id, 'quantity': 10},
+            {'product_id': scarce.id, 'quantity': 3},
+            {'product_id': scarce.id, 'quantity': 2},
+            {'product_id': 999999, 'quantity': 1},
+            {'product_id': plenty.id, 'quantity': 0},
+        ])
+        self.assertEqual(response.status_code, 200)
+        statuses = [(r['status'], r.get('reason')) for r in response.json()['results']]
+        self.assertEqual(statuses, [
+            ('created', None), ('created', None), ('rejected', 'out_of_stock'),
+            ('created', None), ('rejected', 'unknown_product'), ('rejected', 'invalid'),
+        ])
+        self.assertEqual(response.json()['created'], 3)
+        scarce.refresh_from_db()
+        plenty.refresh_from_db()
+        self.assertEqual((scarce.stock, plenty.stock), (0, 90))
+        self.assertEqual(Order.objects.filter(status=Order.Status.STOCK_RESERVED).count(), 3)
+
+    def test_large_batch_takes_a_handful_of_queries(self):
+        products = Product.objects.bulk_create([
+            Product(name=f'P{i}', price=1, stock=1000) for i in range(50)
+        ])
+        items = [{'product_id': products[i % 50].id, 'quantity': 1} for i in range(1000)]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(items)
+
+        self.assertEqual(response.json()['created'], 1000)
+        self.assertLessEqual(len(queries), get_query_budget(BulkCreateOrders))
+        # workflows go through the outbox, 500 orders per message
+        self.assertEqual(
+            [len(args[0]) for args in OutboxMessage.objects.values_list('args', flat=True)], [500, 500],
+        )
+        self.assertEqual(sum(p.stock for p in Product.objects.all()), 50 * 1000 - 1000)
+
+
+
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Monitor', price=100, stock=10)
+
+    def test_order_and_message_commit_together(self):
+        with patch.object(start_order_workflow, 'delay') as delay:
+            order = create_order(self.product.id, 2)
+        delay.assert_not_called()
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.task, message.args), (start_order_workflow.name, [order.id, self.product.id, 2]))
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            create_order(self.product.id, 1)
+            raise RuntimeError
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_relay_publishes_in_order_over_one_producer(self):
+        first = create_order(self.product.id, 1)
+        second = create_order(self.product.id, 1)
+        with patch.object(start_order_workflow, 'apply_async') as apply_async:
+            self.assertEqual(outbox.relay(batch_size=1), 2)
+        self.assertEqual([c.kwargs['args'][0] for c in apply_async.call_args_list], [first.id, second.id])
+        self.assertIsNotNone(apply_async.call_args.kwargs['producer'])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_failed_publish_keeps_messages(self):
+        create_order(self.product.id, 1)
+        with patch.object(start_order_workflow, 'apply_async', side_effect=ConnectionError), \
+                self.assertRaises(ConnectionError):
+            outbox.relay()
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+
+@skipIf(connection.vendor not in ('sqlite', 'postgresql'), 'needs FTS5 or tsvector')
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.course, = seed_catalog(1, modules=2, lessons=2, students=0)
+
+    def titles(self, query):
+        return [(hit['kind'], hit['title']) for hit in search.search(query, 50)]
+
+    def test_index_follows_saves_and_deletes(self):
+        self.course.title = 'Async Django Patterns'
+        self.course.save()
+        self.assertEqual(self.titles('patt'), [('course', 'Async Django Patterns')])
+        self.assertEqual(self.titles('course'), [])
+
+        lesson = Lesson.objects.filter(module__course=self.course).first()
+        lesson.title = 'Query Planning'
+        lesson.save(update_fields=['title'])
+        self.assertEqual(self.titles('planning'), [('lesson', 'Query Planning')])
+        lesson.delete()
+        self.assertEqual(self.titles('planning'), [])
+
+        # a module moved to another course takes its lessons and resources along
+        other, = seed_catalog(1, modules=0, students=0, prefix='o')
+        module = Module.objects.filter(course=self.course).first()
+        module.course = other
+        module.save()
+        lessons = SearchEntry.objects.filter(kind='lesson', object_id__in=Lesson.objects.filter(module=module).values('id'))
+        resources = SearchEntry.objects.filter(
+            kind='resource', object_id__in=Resource.objects.filter(lesson__module=module).values('id'),
+        )
+        self.assertEqual(set(lessons.values_list('course_id', flat=True)), {other.pk})
+        self.assertEqual(set(resources.values_list('course_id', flat=True)), {other.pk})
+
+        self.course.delete()
+        self.assertFalse(SearchEntry.objects.filter(course_id=self.course.pk).exists())
+
+    def test_rebuild_matches_incremental_index(self):
+        columns = ('kind', 'object_id', 'course_id', 'title')
+        incremental = set(SearchEntry.objects.values_list(*columns))
+        self.assertEqual(search.rebuild(), len(incremental))
+        self.assertEqual(set(SearchEntry.objects.values_list(*columns)), incremental)
+        self.assertEqual(len(self.titles('lesson')), 4)
+
+    def test_ranked_keyset_pages(self):
+        module = Module.objects.filter(course=self.course).first()
+        Lesson.objects.create(module=module, title='Redis Redis Redis', order=10)
+        for n in range(5):
+            Lesson.objects.create(module=module, title=f'Redis streams part {n}', order=20 + n)
+
+        response = self.client.get('/api/search/?q=redis&page_size=2')
+        first = response.data
+        self.assertEqual(first['results'][0]['title'], 'Redis Redis Redis')
+        self.assertEqual(first['results'][0]['course'], {
+            'id': self.course.pk, 'title': self.course.title, 'slug': self.course.slug,
+        })
+        self.assertIsNone(first['previous'])
+
+        seen, page = [], first
+        while True:
+            seen += [hit['id'] for hit in page['results']]
+            if not page['next']:
+                break
+            page = self.client.get(page['next']).data
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(back['results'], first['results'])
+
+    def test_ranks_and_pages_every_match(self):
+        # the best hit is the oldest entry, behind more than a thousand newer ones
+        best = SearchEntry.objects.create(kind='lesson', object_id=10_000, course_id=self.course.pk, title='Redis')
+        SearchEntry.objects.bulk_create([
+            SearchEntry(kind='lesson', object_id=10_001 + n, course_id=self.course.pk, title=f'Redis streams part {n}')
+            for n in range(1200)
+        ])
+        hits = search.search('redis', 5)
+        self.assertEqual(hits[0]['id'], best.pk)
+
+        seen, page = [], self.client.get('/api/search/?q=redis&page_size=100').data
+        while True:
+            seen += [hit['id'] for hit in page['results']]
+            if not page['next']:
+                break
+            page = self.client.get(page['next']).data
+        self.assertEqual(len(seen), 1201)
+        self.assertEqual(len(set(seen)), 1201)
+
+    def test_shorter_titles_rank_first(self):
+        for n, title in enumerate(['Redis streams in depth', 'Redis', 'Intro to Redis', 'Redis again']):
+            SearchEntry.objects.create(kind='lesson', object_id=10_000 + n, course_id=self.course.pk, title=title)
+        hits = search.search('redis', 10)
+        self.assertEqual([hit['title'] for hit in hits], ['Redis', 'Redis again', 'Intro to Redis', 'Redis streams in depth'])
+        self.assertEqual([hit['score'] for hit in hits], [5, 11, 14, 22])
+
+        # a renamed title moves to its new rank
+        SearchEntry.objects.filter(title='Redis streams in depth').update(title='Redis 101')
+        self.assertEqual(self.titles('redis')[:2], [('lesson', 'Redis'), ('lesson', 'Redis 101')])
+
+    def test_unavailable_on_other_databases(self):
+        with patch('api.search.connection') as other:
+            other.vendor = 'mysql'
+            response = self.client.get('/api/search/?q=redis')
+        self.assertEqual(response.status_code, 501)
+        self.assertEqual(response.data, {'detail': 'Search is not available on this database.'})
+
+    def test_needs_a_query(self):
+        self.assertEqual(self.client.get('/api/search/?q=%20-!').status_code, 400)
+
+
+@skipIf(fakeredis is None, 'needs fakeredis')
+@override_settings(CACHES=FAKE_REDIS_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class EnrollmentProgressTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='student')
+        self.courses = seed_catalog(2, modules=1, lessons=1, students=0)
+        for course in self.courses:
+            Enrollment.objects.create(user=self.user, course=course)
+        self.client.force_login(self.user)
+
+    def report(self, course, value):
+        return self.client.post('/api/progress/', {'course_id': course.pk, 'progress': value}, content_type='application/json')
+
+    def test_reports_are_buffered_not_written(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.report(self.courses[0], 41.666)
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE "api_enrollment"')])
+        self.assertEqual(Enrollment.objects.get(user=self.user, course=self.courses[0]).progress, 0)
+
+        # reads see the buffered value straight away
+        response = self.client.get('/api/progress/')
+        self.assertEqual(
+            [(row['course_id'], str(row['progress'])) for row in response.data['results']],
+            [(self.courses[0].pk, '41.67'), (self.courses[1].pk, '0.00')],
+        )
+
+    def test_flush_writes_latest_value_once(self):
+        for value in (10, 20, 30.5):
+            self.report(self.courses[0], value)
+        self.report(self.courses[1], 99)
+        self.client.post('/api/progress/', {'course_id': 999999, 'progress': 5}, content_type='application/json')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(progress.flush(), 2)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(
+            dict(Enrollment.objects.filter(user=self.user).values_list('course_id', 'progress')),
+            {self.courses[0].pk: Decimal('30.50'), self.courses[1].pk: Decimal('99.00')},
+        )
+        self.assertEqual(progress.flush(), 0)
+        self.assertEqual(progress.buffered(self.user.pk, [course.pk for course in self.courses]), {})
+
+    def test_flush_reads_only_the_reported_enrollments(self):
+        other = User.objects.create(username='other-student')
+        for course in self.courses:
+            Enrollment.objects.create(user=other, course=course)
+        progress.report(self.user.pk, self.courses[0].pk, 10)
+        progress.report(other.pk, self.courses[1].pk, 20)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(progress.flush(), 2)
+        # not the user x course cross product of the batch
+        selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT "api_enrollment"')]
+        with connection.cursor() as cursor:
+            self.assertEqual(sum(len(cursor.execute(sql).fetchall()) for sql in selects), 2)
+        self.assertEqual(
+            set(Enrollment.objects.exclude(progress=0).values_list('user_id', 'course_id', 'progress')),
+            {(self.user.pk, self.courses[0].pk, Decimal('10')), (other.pk, self.courses[1].pk, Decimal('20'))},
+        )
+
+    def test_one_flush_at_a_time(self):
+        self.report(self.courses[0], 10)
+        cache.add(progress.FLUSH_LOCK, 1)
+        self.assertEqual(progress.flush(), 0)
+        self.assertEqual(Enrollment.objects.get(user=self.user, course=self.courses[0]).progress, 0)
+
+        cache.delete(progress.FLUSH_LOCK)
+        self.assertEqual(progress.flush(), 1)
+        self.assertIsNone(cache.get(progress.FLUSH_LOCK))
+
+    def test_interrupted_flush_is_picked_up_and_newer_reports_win(self):
+        self.report(self.courses[0], 10)
+        with patch.object(Enrollment.objects, 'bulk_update', side_effect=ConnectionError), \
+                self.assertRaises(ConnectionError):
+            progress.flush()
+        # reported while the failed batch was still parked
+        self.report(self.courses[0], 15)
+        self.assertEqual(progress.buffered(self.user.pk, [self.courses[0].pk]), {self.courses[0].pk: Decimal('15')})
+
+        progress.flush()  # the parked batch
+        progress.flush()  # the newer report
+        self.assertEqual(Enrollment.objects.get(user=self.user, course=self.courses[0]).progress, Decimal('15'))
+
+    def test_rejects_invalid_reports(self):
+        self.assertEqual(self.report(self.courses[0], 101).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.report(self.courses[0], 50).status_code, 403)
+
+    def test_query_budget(self):
+        for method in (self.client.get, lambda url: self.report(self.courses[0], 1)):
+            with CaptureQueriesContext(connection) as queries:
+                method('/api/progress/')
+            self.assertLessEqual(len(queries), get_query_budget(EnrollmentProgress))
+
+
+@skipIf(fakeredis is None, 'needs fakeredis')
+@override_settings(CACHES=FAKE_REDIS_CACHES, MIDDLEWARE=TEST_MIDDLEWARE, TRENDING_WEIGHTS={'enrollment': 5, 'view': 1})
+class TrendingCoursesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.courses = seed_catalog(3, modules=1, lessons=1, students=0)
+
+    def enroll(self, course, count):
+        # only the trending callback: django_redis's incr needs EVAL, which fakeredis lacks
+        with patch('api.caching.bump_generation'), self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                Enrollment.objects.create(user=User.objects.create(username=f'u{User.objects.count()}'), course=course)
+
+    def ranking(self, window='24h'):
+        response = self.client.get(f'/api/courses/trending/?window={window}')
+        self.assertEqual(response.status_code, 200)
+        return [(row['id'], row['score']) for row in response.data['results']]
+
+    def test_events_rank_courses(self):
+        first, second, third = self.courses
+        self.enroll(second, 2)
+        for _ in range(3):
+            self.client.get(f'/api/courses/{first.pk}/curriculum/')
+        self.assertEqual(self.ranking(), [(second.pk, 10.0), (first.pk, 3.0)])
+
+        with CaptureQueriesContext(connection) as queries:
+            cache.delete(trending._top_key('24h'))
+            self.ranking()
+        self.assertLessEqual(len(queries), get_query_budget(TrendingCourses))
+
+    def test_older_buckets_decay_and_expire_from_the_window(self):
+        first, second, _ = self.courses
+        now = time.time()
+        trending.record(trending.VIEW, first.pk, now=now)
+        trending.record(trending.VIEW, second.pk, now=now - 30 * 60)   # 6 of 12 buckets ago
+        trending.record(trending.VIEW, second.pk, now=now - 2 * 60 * 60)  # outside 1h
+        ranked = dict(trending.top('1h', now=now))
+        self.assertEqual(ranked[first.pk], 1.0)
+        self.assertAlmostEqual(ranked[second.pk], 0.5, delta=1 / 12)
+        # both within 24h, each weighted by its age
+        self.assertGreater(dict(trending.top('24h', now=now))[second.pk], 1.8)
+
+    def test_reconcile_rebuilds_enrollments_from_the_table(self):
+        first, second, _ = self.courses
+        self.enroll(first, 1)
+        # committed without going through the signal, and an event for a row that is gone
+        Enrollment.objects.bulk_create([
+            Enrollment(user=User.objects.create(username=f'bulk{i}'), course=second) for i in range(3)
+        ])
+        trending.record_enrollment(self.courses[2].pk)
+
+        self.assertEqual(trending.reconcile(), 4)
+        self.assertEqual(self.ranking(), [(second.pk, 15.0), (first.pk, 5.0)])
+
+    def test_rejects_unknown_window(self):
+        self.assertEqual(self.client.get('/api/courses/trending/?window=1y').status_code, 400)
+
+
+@skipIf(fakeredis is None, 'needs fakeredis')
+@override_settings(CACHES=TIERED_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        self.assertTrue(cache.local.listening.wait(5), 'invalidation listener never subscribed')
+        cache.clear()
+        self.redis = cache.client.get_client(write=True)
+
+    def counter(self, name):
+        return cache.stats()[name]
+
+    def test_reads_are_served_from_process_memory(self):
+        cache.set('gen:catalog', 3)
+        self.redis.set(cache.make_key('gen:catalog'), 4)  # behind the backend's back: no invalidation
+        hits = self.counter('local_hits')
+        self.assertEqual(cache.get('gen:catalog'), 3)
+        self.assertEqual(cache.get_many(['gen:catalog']), {'gen:catalog': 3})
+        self.assertEqual(self.counter('local_hits'), hits + 2)
+
+    def test_writes_elsewhere_invalidate_the_local_copy(self):
+        cache.set('gen:catalog', 3)
+        # what another process's cache.set() leaves behind: the new value and a message
+        self.redis.set(cache.make_key('gen:catalog'), 4)
+        invalidations = self.counter('invalidations')
+        self.redis.publish(cache._channel, json.dumps({'origin': 'elsewhere', 'keys': [cache.make_key('gen:catalog')]}))
+        deadline = time.monotonic() + 5
+        while self.counter('invalidations') == invalidations and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(cache.get('gen:catalog'), 4)
+
+    def test_local_tier_is_bounded(self):
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        self.assertEqual(self.counter('local_entries'), 2)
+        redis_hits = self.counter('redis_hits')
+        self.assertEqual(cache.get('a'), 'a')  # evicted first, read back from Redis
+        self.assertEqual(self.counter('redis_hits'), redis_hits + 1)
+
+    def test_local_entries_expire_and_lose_races_with_invalidations(self):
+        tier = LocalTier(max_entries=10, timeout=30)
+        with patch('api.tiered_cache.time.monotonic', return_value=100.0):
+            tier.set('k', 1, timeout=5)  # never outlives the Redis timeout
+        with patch('api.tiered_cache.time.monotonic', return_value=106.0):
+            self.assertEqual(tier.get('k'), (False, None))
+
+        epoch = tier.epoch  # read from Redis starts...
+        tier.drop(['k'])    # ...a write lands meanwhile...
+        tier.set('k', 1, epoch=epoch)  # ...so the stale value is not kept
+        self.assertEqual(tier.get('k'), (False, None))
+
+    def test_async_reads(self):
+        cache.set('gen:catalog', 3)
+        self.redis.set(cache.make_key('gen:catalog'), 4)  # no invalidation: the local copy answers
+        self.redis.set(cache.make_key('remote'), cache.client.encode('only in redis'))
+        hits, redis_hits = self.counter('local_hits'), self.counter('redis_hits')
+        self.assertEqual(async_to_sync(cache.aget_many)(['gen:catalog', 'remote', 'missing']), {
+            'gen:catalog': 3, 'remote': 'only in redis',
+        })
+        self.assertEqual(async_to_sync(cache.aget)('missing', 'default'), 'default')
+        self.assertEqual(self.counter('local_hits'), hits + 1)
+        self.assertEqual(self.counter('redis_hits'), redis_hits + 1)
+
+    def test_async_client_connects_like_django_redis(self):
+        backend = TieredRedisCache('rediss://cache.internal:6380/2', {'OPTIONS': {
+            'PASSWORD': 's3cret',
+            'SOCKET_TIMEOUT': 2,
+            'CONNECTION_POOL_KWARGS': {'max_connections': 7, 'ssl_cert_reqs': 'none'},
+        }})
+
+        async def client():
+            return backend._async_redis()
+
+        pool = async_to_sync(client)().connection_pool
+        self.assertIs(pool.connection_class, redis.asyncio.SSLConnection)
+        self.assertEqual(pool.max_connections, 7)
+        self.assertEqual(
+            {key: pool.connection_kwargs[key] for key in ('host', 'port', 'db', 'password', 'socket_timeout', 'ssl_cert_reqs')},
+            {'host': 'cache.internal', 'port': 6380, 'db': 2, 'password': 's3cret', 'socket_timeout': 2,
+             'ssl_cert_reqs': 'none'},
+        )
+
+    def test_metrics_endpoint(self):
+        cache.get('missing')
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+        response = self.client.get('/api/metrics/cache/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['listening'])
+        self.assertGreaterEqual(response.data['redis_misses'], 1)
+
+
+# the async views query from worker threads, on their own connections: the
+# data has to be committed for them to see it
+@override_settings(CACHES=TEST_CACHES, MIDDLEWARE=TEST_MIDDLEWARE)
+class AsyncViewTests(TransactionTestCase):
+
+    def setUp(self):
+        # commits run on_commit hooks: keep curriculum rebuilds off the broker
+        for module in ('signals', 'views', 'async_views'):
+            patcher = patch(f'api.{module}.schedule_curriculum_rebuild')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cache.clear()
+        middleware.reset()
+        self.course = seed_catalog(2, modules=2, lessons=3)[-1]
+        self.lesson = Lesson.objects.filter(module__course=self.course).order_by('module__order', 'order')[2]
+        self.async_client = AsyncClient()
+
+    def async_get(self, url, **kwargs):
+        async def get():
+            return await self.async_client.get(url, **kwargs)
+        return async_to_sync(get)()
+
+    def get_both(self, path):
+        cache.clear()
+        sync = self.client.get(f'/api{path}', HTTP_ACCEPT='application/json')
+        cache.clear()
+        return sync, self.async_get(f'/api/async{path}')
+
+    def test_same_responses_as_the_sync_views(self):
+        for path in (
+            '/courses/', f'/courses/{self.course.pk}/curriculum/', f'/courses/{self.course.slug}/',
+            f'/lessons/{self.lesson.pk}/', f'/lessons/{self.lesson.pk}/?fields=id,title,next_lesson',
+            '/lessons/999999/', '/courses/missing/', f'/lessons/{self.lesson.pk}/?fields=nope',
+        ):
+            sync, async_ = self.get_both(path)
+            self.assertEqual((async_.status_code, async_.content), (sync.status_code, sync.content), path)
+            self.assertEqual(async_.get('ETag'), sync.get('ETag'), path)
+
+        build_curriculum_document(self.course.pk)
+        sync, async_ = self.get_both(f'/courses/{self.course.slug}/')
+        self.assertEqual((async_.content, async_['ETag']), (sync.content, sync['ETag']))
+
+    def test_conditional_get(self):
+        url = f'/api/async/lessons/{self.lesson.pk}/'
+        first = self.async_get(url)
+        second = self.async_get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+
+    def test_queries_on_worker_threads_are_counted(self):
+        for view_class, route, url in (
+            (AsyncLessonDetails, 'api/async/lessons/<int:id>/', f'/api/async/lessons/{self.lesson.pk}/'),
+            (AsyncCoursesDetails, 'api/async/courses/<slug:slug>/curriculum/',
+             f'/api/async/courses/{self.course.pk}/curriculum/'),
+            (AsyncCourseCurriculum, 'api/async/courses/<slug:slug>/', f'/api/async/courses/{self.course.slug}/'),
+        ):
+            self.assertEqual(self.async_get(url).status_code, 200)
+            stats = middleware.snapshot()['routes'][route]
+            self.assertGreater(stats['queries'], 1, route)
+            self.assertLessEqual(stats['queries'], get_query_budget(view_class), route)
+            self.assertEqual(stats['over_budget'], 0)
+
+    def test_independent_queries_run_at_the_same_time(self):
+        # each callable waits for the other: only passes if both run at once
+        barrier = threading.Barrier(2, timeout=5)
+
+        def lesson_count():
+            barrier.wait()
+            return Lesson.objects.count()
+
+        self.assertEqual(async_to_sync(concurrently)(lesson_count, lesson_count), [Lesson.objects.count()] * 2)
+
+
+@skipIf(connection.vendor == 'sqlite', 'SQLite serializes writers; needs a real concurrent database')
+class ConcurrentStockReservationTests(TransactionTestCase):
+
+    def test_no_oversell_under_contention(self):
+        for shards in (0, 4):
+            product = Product.objects.create(name='Flash sale', price=1, stock=50)
+            inventory.set_stock_shards(product.id, shards)
+            reserved = []
+
+            def buy():
+                try:
+                    for _ in range(10):
+                        if inventory.reserve(product.id, 1):
+                            reserved.append(1)
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=buy) for _ in range(16)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(reserved), 50)
+            self.assertEqual(inventory.available_stock(product.id), 0)
+
+
+class BenchmarkCompareTests(SimpleTestCase):
+
+    def report(self, **routes):
+        return {'results': {'1k': {'routes': routes}}}
+
+    def timing(self, p50, queries=1, p95=None):
+        return {'p50_ms': p50, 'p95_ms': p95 or p50, 'queries': queries}
+
+    def test_every_route_has_a_sample(self):
+        views = {view for pattern in get_resolver().url_patterns for _, view in _api_routes(pattern)}
+        self.assertLessEqual(views, set(REQUESTS))
+
+    def test_flags_query_and_median_regressions(self):
+        baseline = self.report(**{
+            'a [x]': {'cold': self.timing(10), 'warm': self.timing(2)},
+            'b [x]': {'cold': self.timing(10, queries=2)},
+        })
+        current = self.report(**{
+            'a [x]': {'cold': self.timing(16), 'warm': self.timing(2)},
+            'b [x]': {'cold': self.timing(10, queries=3)},
+        })
+        self.assertEqual(compare(baseline, current, 0.5), [
+            '[1k] a [x] cold: p50 10.0ms -> 16.0ms',
+            '[1k] b [x] cold: queries 2 -> 3',
+        ])
+
+    def test_ignores_noise(self):
+        baseline = self.report(**{
+            'a [x]': {'cold': self.timing(10, p95=12)},
+            'b [x]': {'cold': self.timing(0.5)},
+            'c': {'skipped': 'no sample request for c'},
+        })
+        current = self.report(**{
+            # one slow sample moves p95, not the median
+            'a [x]': {'cold': self.timing(11, p95=40)},
+            # sub-millisecond jitter
+            'b [x]': {'cold': self.timing(1.2)},
+            'c': {'skipped': 'no sample request for c'},
+            'd [x]': {'cold': self.timing(100)},
+        })
+        self.assertEqual(compare(baseline, current, 0.5), [])
@@ -0,0 +1,366 @@
+"""
+Two-tier cache backend: a per-process LRU in front of django_redis.
+
+    CACHES = {'default': {
+        'BACKEND': 'api.tiered_cache.TieredRedisCache',
+        'LOCATION': 'redis://redis:6379/1',
+        'OPTIONS': {..., 'LOCAL_MAX_ENTRIES': 500, 'LOCAL_TIMEOUT': 30},
+    }}
+
+Reads are answered from process memory when possible: no round trip, no
+decode. Every write (set/add/delete/incr/...) goes to Redis first, then
+publishes the keys on a pub/sub channel; a listener thread in every process
+drops them from its local tier, so a write is seen everywhere within
+milliseconds. Local entries also expire after LOCAL_TIMEOUT seconds (and
+never outlive the timeout they were written with), which bounds staleness if
+a message is lost.
+
+Until its listener is subscribed a process reads straight from Redis, and
+after a reconnect it starts with an empty local tier - it can't know what it
+missed.
+
+`LOCAL_KEY_PREFIXES` limits the local tier to the hot keys (e.g. `gen:` and
+`courses:list:`); by default every key is eligible. Values are shared between
+callers of the same process: treat them as read-only.
+
+`stats()` returns hit/miss counters per tier (see `/api/metrics/cache/`).
+
+`aget`/`aget_many` serve the async views (`api/async_views.py`) without a
+thread hop: local hits are answered on the event loop, misses go to Redis
+through a `redis.asyncio` client (one pool per event loop, with the same
+PASSWORD, timeouts and CONNECTION_POOL_KWARGS as django_redis; OPTIONS
+`ASYNC_CONNECTION_CLASS` swaps its connection class, e.g. for fakeredis).
+Async writes keep Django's default: the sync method in a thread.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+
+import redis.asyncio
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.utils.module_loading import import_string
+from django_redis.cache import RedisCache
+
+logger = logging.getLogger('api.cache')
+
+
+class LocalTier:
+    """Bounded LRU of key -> (expires_at, value), shared by the threads of one process."""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'local_hits': 0, 'local_misses': 0, 'redis_hits': 0, 'redis_misses': 0, 'invalidations': 0}
+        self.listening = threading.Event()
+        # bumped by every drop/clear: a value read from Redis before an
+        # invalidation landed must not be stored after it
+        self.epoch = 0
+
+    def get(self, key):
+        """(found, value)"""
+        with self.lock:
+            item = self.entries.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.counters['local_hits'] += 1
+                    return True, value
+                del self.entries[key]
+            self.counters['local_misses'] += 1
+            return False, None
+
+    def set(self, key, value, timeout=None, epoch=None):
+        ttl = self.timeout if timeout is None else min(self.timeout, timeout)
+        if ttl <= 0:
+            return
+        with self.lock:
+            if epoch is not None and epoch != self.epoch:
+                return
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def drop(self, keys):
+        with self.lock:
+            self.epoch += 1
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+
+# one local tier and listener per (process, cache location); Django creates a
+# backend instance per thread, these are shared between them
+_tiers = {}
+_tiers_lock = threading.Lock()
+# event loop -> {server: redis.asyncio.Redis}; a client can't outlive its loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class TieredRedisCache(RedisCache):
+
+    def __init__(self, server, params):
+        options = dict(params.get('OPTIONS', {}))
+        self._local_max_entries = options.pop('LOCAL_MAX_ENTRIES', 500)
+        self._local_timeout = options.pop('LOCAL_TIMEOUT', 30)
+        prefixes = options.pop('LOCAL_KEY_PREFIXES', None)
+        self._local_prefixes = tuple(prefixes) if prefixes else None
+        channel = options.pop('INVALIDATION_CHANNEL', None)
+        async_connection_class = options.pop('ASYNC_CONNECTION_CLASS', None)
+        if isinstance(async_connection_class, str):
+            async_connection_class = import_string(async_connection_class)
+        self._async_connection_class = async_connection_class
+        super().__init__(server, {**params, 'OPTIONS': options})
+        self._channel = channel or f'{self.key_prefix}cache-invalidate:{server}'
+        self._server_name = server
+
+    # ---------- local tier ----------
+
+    @property
+    def local(self):
+        key = (os.getpid(), self._server_name, self._channel)
+        tier = _tiers.get(key)
+        if tier is None:
+            with _tiers_lock:
+                tier = _tiers.get(key)
+                if tier is None:
+                    tier = _tiers[key] = LocalTier(self._local_max_entries, self._local_timeout)
+                    tier.origin = uuid.uuid4().hex
+                    thread = threading.Thread(target=self._listen, args=(tier,), daemon=True, name='cache-invalidate')
+                    thread.start()
+        return tier
+
+    def _eligible(self, key):
+        return self._local_prefixes is None or key.startswith(self._local_prefixes)
+
+    def _listen(self, tier):
+        while True:
+            try:
+                pubsub = self.client.get_client(write=False).pubsub()
+                pubsub.subscribe(self._channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'subscribe':
+                        # whatever was published while we weren't listening is lost
+                        tier.clear()
+                        tier.listening.set()
+                    elif message['type'] == 'message':
+                        self._apply(tier, message['data'])
+            except Exception:
+                logger.warning('Cache invalidation listener lost its connection; retrying', exc_info=True)
+            tier.listening.clear()
+            time.sleep(1)
+
+    def _apply(self, tier, data):
+        payload = json.loads(data)
+        if payload['origin'] == tier.origin:
+            return
+        if payload['keys'] is None:
+            tier.clear()
+        else:
+            tier.drop(payload['keys'])
+        tier.count('invalidations')
+
+    def _publish(self, keys):
+        """Tell the other processes to drop `keys` (None: everything)."""
+        tier = self.local
+        if keys is None:
+            tier.clear()
+        else:
+            tier.drop(keys)
+        message = json.dumps({'origin': tier.origin, 'keys': keys})
+        self.client.get_client(write=True).publish(self._channel, message)
+
+    def stats(self):
+        tier = self.local
+        with tier.lock:
+            counters = dict(tier.counters)
+            counters['local_entries'] = len(tier.entries)
+        counters['listening'] = tier.listening.is_set()
+        return counters
+
+    # ---------- reads ----------
+
+    def get(self, key, default=None, version=None, client=None):
+        full_key = self.make_and_validate_key(key, version=version)
+        tier = self.local
+        use_local = client is None and tier.listening.is_set() and self._eligible(key)
+        if use_local:
+            found, value = tier.get(full_key)
+            if found:
+                return value
+        epoch = tier.epoch
+        missing = object()
+        value = super().get(key, default=missing, version=version, client=client)
+        if value is missing:
+            tier.count('redis_misses')
+            return default
+        tier.count('redis_hits')
+        if use_local:
+            tier.set(full_key, value, epoch=epoch)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        tier = self.local
+        listening = client is None and tier.listening.is_set()
+        found, remote = {}, []
+        for key in keys:
+            if listening and self._eligible(key):
+                hit, value = tier.get(self.make_and_validate_key(key, version=version))
+                if hit:
+                    found[key] = value
+                    continue
+            remote.append(key)
+        if remote:
+            epoch = tier.epoch
+            fetched = super().get_many(remote, version=version, client=client)
+            tier.count('redis_hits', len(fetched))
+            tier.count('redis_misses', len(remote) - len(fetched))
+            for key, value in fetched.items():
+                if listening and self._eligible(key):
+                    tier.set(self.make_and_validate_key(key, version=version), value, epoch=epoch)
+            found.update(fetched)
+        return found
+
+    def has_key(self, key, version=None, client=None):
+        if client is None and self.local.listening.is_set():
+            hit, _ = self.local.get(self.make_and_validate_key(key, version=version))
+            if hit:
+                return True
+        return super().has_key(key, version=version, client=client)
+
+    # ---------- async reads ----------
+
+    def _async_redis(self):
+        clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+        client = clients.get(self._server_name)
+        if client is None:
+            # the first server is the primary, as for django_redis's writes
+            servers = self._server_name.split(',') if isinstance(self._server_name, str) else self._server_name
+            location = servers[0].strip()
+            client = clients[self._server_name] = redis.asyncio.Redis.from_url(
+                location, **self._async_connection_kwargs(location),
+            )
+        return client
+
+    def _async_connection_kwargs(self, location):
+        # what django_redis connects with: PASSWORD, the socket timeouts and
+        # CONNECTION_POOL_KWARGS (SSL options, max_connections, ...)
+        factory = self.client.connection_factory
+        kwargs = factory.make_connection_params(location)
+        del kwargs['url']
+        kwargs.pop('parser_class', None)  # a sync parser
+        kwargs.update(factory.pool_cls_kwargs)
+        kwargs.pop('connection_class', None)  # ditto; the URL scheme picks TCP, SSL or unix
+        if self._async_connection_class:
+            kwargs['connection_class'] = self._async_connection_class
+        return kwargs
+
+    async def aget(self, key, default=None, version=None):
+        found = await self.aget_many([key], version=version)
+        return found.get(key, default)
+
+    async def aget_many(self, keys, version=None):
+        tier = self.local
+        listening = tier.listening.is_set()
+        found, remote = {}, {}
+        for key in keys:
+            full_key = self.make_and_validate_key(key, version=version)
+            if listening and self._eligible(key):
+                hit, value = tier.get(full_key)
+                if hit:
+                    found[key] = value
+                    continue
+            remote[key] = full_key
+        if remote:
+            epoch = tier.epoch
+            values = await self._async_redis().mget(list(remote.values()))
+            for (key, full_key), raw in zip(remote.items(), values):
+                if raw is None:
+                    tier.count('redis_misses')
+                    continue
+                tier.count('redis_hits')
+                found[key] = value = self.client.decode(raw)
+                if listening and self._eligible(key):
+                    tier.set(full_key, value, epoch=epoch)
+        return found
+
+    # ---------- writes: Redis first, then invalidate everywhere ----------
+
+    def _written(self, key, version, value=None, timeout=None, keep=False):
+        full_key = self.make_and_validate_key(key, version=version)
+        self._publish([full_key])
+        if keep and self._eligible(key) and self.local.listening.is_set():
+            self.local.set(full_key, value, timeout)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None, nx=False, xx=False):
+        result = super().set(key, value, timeout=timeout, version=version, client=client, nx=nx, xx=xx)
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        self._written(key, version, value, timeout, keep=bool(result) and not (nx or xx))
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().add(key, value, timeout=timeout, version=version, client=client)
+        if result:
+            self._written(key, version)
+        return result
+
+    def delete(self, key, version=None, prefix=None, client=None):
+        result = super().delete(key, version=version, prefix=prefix, client=client)
+        self._written(key, version)
+        return result
+
+    def delete_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        result = super().delete_many(keys, version=version, client=client)
+        if keys:
+            self._publish([self.make_and_validate_key(key, version=version) for key in keys])
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().set_many(data, timeout=timeout, version=version, client=client)
+        if data:
+            self._publish([self.make_and_validate_key(key, version=version) for key in data])
+        return result
+
+    def incr(self, key, delta=1, version=None, client=None, ignore_key_check=False):
+        result = super().incr(key, delta=delta, version=version, client=client, ignore_key_check=ignore_key_check)
+        self._written(key, version)
+        return result
+
+    def decr(self, key, delta=1, version=None, client=None, ignore_key_check=False):
+        result = super().decr(key, delta=delta, version=version, client=client, ignore_key_check=ignore_key_check)
+        self._written(key, version)
+        return result
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().touch(key, timeout=timeout, version=version, client=client)
+        self._written(key, version)
+        return result
+
+    def delete_pattern(self, *args, **kwargs):
+        result = super().delete_pattern(*args, **kwargs)
+        self._publish(None)
+        return result
+
+    def clear(self):
+        result = super().clear()
+        self._publish(None)
+        return result
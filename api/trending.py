@@ -0,0 +1,141 @@
+"""
+Trending courses from Redis sorted sets.
+
+Ranking by `Count('enrollments')` means aggregating every enrollment per
+request. Instead each event bumps a course's score in time-bucketed sorted
+sets, one set per (event, bucket):
+
+    trending:enrollment:3600:<hour number>  ->  {course_id: count}
+
+Each window reads its own bucket size:
+
+    1h  -> 12 buckets of 5 minutes
+    24h -> 24 buckets of 1 hour
+    7d  -> 28 buckets of 6 hours
+
+`top(window, limit)` merges a window's buckets with ZUNIONSTORE. Each event
+counts TRENDING_WEIGHTS[event], and older buckets weigh linearly less, so
+courses fade out of a window instead of dropping off a cliff at its edge. The
+merged set is kept for TRENDING_REFRESH seconds. Buckets expire on their own.
+
+Views exist only here. Enrollments are in the DB, and `reconcile()` (hourly
+beat task) rebuilds their buckets from the Enrollment table. That repairs
+events lost to a Redis restart and drops deleted enrollments.
+
+Without the Redis cache backend (local/test caches) nothing is counted and
+`top()` is empty.
+"""
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from .models import Enrollment
+
+ENROLLMENT = 'enrollment'
+VIEW = 'view'
+
+# window -> (bucket seconds, buckets)
+WINDOWS = {
+    '1h': (5 * 60, 12),
+    '24h': (60 * 60, 24),
+    '7d': (6 * 60 * 60, 28),
+}
+
+
+def _redis():
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:  # not a django_redis cache
+        return None
+
+
+def _bucket_key(event, size, index):
+    return cache.make_key(f'trending:{event}:{size}:{index}')
+
+
+def _top_key(window):
+    return cache.make_key(f'trending:top:{window}')
+
+
+def record(event, course_id, now=None):
+    """Count one event for `course_id` in the current bucket of every window."""
+    redis = _redis()
+    if redis is None:
+        return
+    now = time.time() if now is None else now
+    pipe = redis.pipeline(transaction=False)
+    for size, count in WINDOWS.values():
+        key = _bucket_key(event, size, int(now // size))
+        pipe.zincrby(key, 1, course_id)
+        pipe.expire(key, size * (count + 1))
+    pipe.execute()
+
+
+def record_view(course_id):
+    record(VIEW, course_id)
+
+
+def record_enrollment(course_id):
+    record(ENROLLMENT, course_id)
+
+
+def _window_weights(window, now):
+    size, count = WINDOWS[window]
+    current = int(now // size)
+    weights = {}
+    for event, event_weight in settings.TRENDING_WEIGHTS.items():
+        for age in range(count):
+            weights[_bucket_key(event, size, current - age)] = event_weight * (count - age) / count
+    return weights
+
+
+def top(window='24h', limit=10, now=None):
+    """[(course_id, score), ...] best first."""
+    redis = _redis()
+    if redis is None:
+        return []
+    key = _top_key(window)
+    if not redis.exists(key):
+        pipe = redis.pipeline()
+        pipe.zunionstore(key, _window_weights(window, time.time() if now is None else now))
+        pipe.expire(key, settings.TRENDING_REFRESH)
+        pipe.execute()
+    return [(int(member), score) for member, score in redis.zrevrange(key, 0, limit - 1, withscores=True)]
+
+
+def reconcile(now=None):
+    """Rebuild the enrollment buckets of every window from the Enrollment table."""
+    redis = _redis()
+    if redis is None:
+        return 0
+    now = time.time() if now is None else now
+    span = max(size * count for size, count in WINDOWS.values())
+    since = datetime.fromtimestamp(now - span, tz=timezone.utc)
+
+    buckets = defaultdict(Counter)
+    enrollments = Enrollment.objects.filter(enrolled_at__gte=since).values_list('course_id', 'enrolled_at')
+    total = 0
+    for course_id, enrolled_at in enrollments.iterator(chunk_size=5000):
+        stamp = enrolled_at.timestamp()
+        for size, _ in WINDOWS.values():
+            buckets[size, int(stamp // size)][course_id] += 1
+        total += 1
+
+    # one MULTI: readers never see a half-rebuilt window
+    pipe = redis.pipeline()
+    for window, (size, count) in WINDOWS.items():
+        current = int(now // size)
+        for index in range(current - count + 1, current + 1):
+            key = _bucket_key(ENROLLMENT, size, index)
+            pipe.delete(key)
+            scores = buckets.get((size, index))
+            if scores:
+                pipe.zadd(key, scores)
+                pipe.expire(key, size * (count + 1))
+        pipe.delete(_top_key(window))
+    pipe.execute()
+    return total
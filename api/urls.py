@@ -2,13 +2,25 @@ from . import views
 
 
 from django.urls import path
-from .views import ListCourses, CoursesDetails, LessonDetails, ListLesson, CourseCurriculum
+from .async_views import AsyncCourseCurriculum, AsyncCoursesDetails, AsyncLessonDetails, AsyncListCourses
+from .views import ListCourses, CoursesDetails, LessonDetails, ListLesson, CourseCurriculum, QueryMetrics, CacheMetrics, BulkCreateOrders, EnrollmentProgress, TrendingCourses, Search
 urlpatterns = [
     path('courses/',ListCourses.as_view()),
+    path('courses/trending/',TrendingCourses.as_view()),
     path('courses/<slug:slug>/curriculum/',CoursesDetails.as_view()),
     path('courses/<slug:slug>/',CourseCurriculum.as_view()),
     path('lessons/',ListLesson.as_view()),
     path('lessons/<int:id>/',LessonDetails.as_view()),
+    path('metrics/queries/',QueryMetrics.as_view()),
+    path('metrics/cache/',CacheMetrics.as_view()),
+    path('orders/bulk/',BulkCreateOrders.as_view()),
+    path('progress/',EnrollmentProgress.as_view()),
+    path('search/',Search.as_view()),
+    # the same reads as coroutines, for ASGI servers (api/async_views.py)
+    path('async/courses/',AsyncListCourses.as_view()),
+    path('async/courses/<slug:slug>/curriculum/',AsyncCoursesDetails.as_view()),
+    path('async/courses/<slug:slug>/',AsyncCourseCurriculum.as_view()),
+    path('async/lessons/<int:id>/',AsyncLessonDetails.as_view()),
     path('', views.page, name='pages')
 
 
@@ -1,109 +1,334 @@
+from django.db import transaction
+from django.http import Http404, HttpResponse
 from django.shortcuts import render 
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import Course ,Category, Instructor, Lesson, Module
-from .serializers import CourseSerializer, LessonSerializer, CourseCurriculumSerializer
-from django.db.models import Count, Prefetch
+from .models import Course, Enrollment, Lesson
+from .serializers import CourseSerializer, LessonSerializer, CourseCurriculumSerializer, OrderItemSerializer, ProgressReportSerializer
+from .budgets import query_budget
+from .middleware import snapshot as query_telemetry
+from .projections import CourseProjection, LessonProjection
+from .pagination import CourseCursorPagination, LessonCursorPagination, SearchCursorPagination
+from .search import SearchUnavailable, terms as search_terms
+from .streaming import requested_stream_format, stream_queryset
+from .caching import CATALOG, course_scope, get_or_build
+from .conditional import course_stamp, curriculum_stamp, curriculum_stamps, etag, not_modified, stamped
+from .response_cache import cached_response
+from .navigation import get_navigation_index, lesson_with_navigation, navigation_index_enabled, neighbours
+from .curriculum import curriculum_queryset, schedule_curriculum_rebuild
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django.shortcuts import get_object_or_404
-import time
+from django.conf import settings
+from .services import create_orders
+from . import progress as progress_buffer, trending
 from django.core.cache import cache
+def requested_fields(request, default):
+    """`?fields=id,title` -> ['id', 'title'] (kept in serializer order)."""
+    value = request.query_params.get('fields')
+    if not value:
+        return list(default)
+    wanted = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = wanted - set(default)
+    if unknown:
+        raise ValidationError({'fields': [f'Unknown field: {name}' for name in sorted(unknown)]})
+    return [name for name in default if name in wanted]
+
+
+def fields_cache_key(key, fields, default):
+    if list(fields) == list(default):
+        return key
+    return f"{key}:fields={','.join(fields)}"
+
+
+@query_budget(1)
 class ListCourses(APIView):
+    pagination_class = CourseCursorPagination
 
     def get(self, request):
-        cache_key = "courses:list:v1"
-        cached_data = cache.get(cache_key)
-        if cached_data is not None:
-            return Response(cached_data)
-
-        queryset = Course.objects.select_related(
-            'category', 'instructor', 'instructor__user'
-        ).annotate(
-            number_of_modules=Count('modules', distinct=True),
-            number_of_lessons=Count('modules__lessons', distinct=True),
-            total_video_duration=Count('modules__lessons__resources', distinct=True),
-            number_of_students=Count('enrollments', distinct=True)
-        )
+        # values()-backed projection: same JSON as CourseSerializer, no model instances.
+        # ?fields= also drops the joins/columns of the fields that aren't asked for.
+        fields = requested_fields(request, CourseSerializer.Meta.fields)
+        projection = CourseProjection(fields)
+        queryset = projection.queryset(Course.objects.all(), extra_lookups=self.pagination_class.ordering)
 
-        serializer = CourseSerializer(queryset, many=True)
-        data = serializer.data   # ← هنا تعريف المتغير
+        stream = requested_stream_format(request)
+        if stream:
+            return stream_queryset(queryset.order_by(*self.pagination_class.ordering), projection, stream)
 
-        # 3) خزّن النتيجة
-        cache.set(cache_key, data, timeout=60 * 10)
+        # keyset pages are cheap to read, only the full list goes through the cache
+        paginator = self.pagination_class()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            return paginator.get_paginated_response(projection.many(page))
 
-        return Response(serializer.data)
+        # invalidated by generation bumps on every write to the catalog (api/signals.py);
+        # JSON clients get the stored, pre-compressed body (api/response_cache.py)
+        key = fields_cache_key("courses:list:v2", fields, CourseSerializer.Meta.fields)
+        response = cached_response(request, key, lambda: projection.many(queryset), timeout=60 * 10, scopes=[CATALOG])
+        if response is not None:
+            return response
+        data = get_or_build(key, lambda: projection.many(queryset), timeout=60 * 10, scopes=[CATALOG])
+        return Response(data)
 
+# version stamp, then the build on a cache miss; a 304 is the stamp alone
+@query_budget(2)
 class CoursesDetails(APIView):
 
     def get(self, request, slug):
-        queryset = Course.objects.filter(id=slug).select_related(
-        'category', 'instructor', 'instructor__user'
-        ).annotate(
-            number_of_modules=Count('modules', distinct=True),
-            number_of_lessons=Count('modules__lessons', distinct=True),
-            total_video_duration=Count('modules__lessons__resources', distinct=True),
-            number_of_students=Count('enrollments', distinct=True)
-        )  
-        serializer = CourseSerializer(queryset, many=True)
-        return Response(serializer.data)
+        fields = requested_fields(request, CourseSerializer.Meta.fields)
+        key = fields_cache_key(f"courses:details:{slug}", fields, CourseSerializer.Meta.fields)
+        stamp = course_stamp(slug)
+        if stamp is not None:
+            tag = etag(stamp, fields)
+            response = not_modified(request, stamp, tag)
+            if response is not None:
+                trending.record_view(slug)
+                return response
+            # the body under a version is never older than the version (api/conditional.py)
+            key = f"{key}:v{stamp.version}"
+        queryset = CourseSerializer.optimize_queryset(Course.objects.filter(id=slug), fields)
+        data = get_or_build(
+            key,
+            lambda: CourseSerializer(queryset, many=True, fields=fields).data,
+            scopes=[course_scope(slug)],
+        )
+        if data:
+            trending.record_view(slug)
+        response = Response(data)
+        return stamped(response, stamp, tag) if stamp is not None else response
     
     
+@query_budget(1)
 class ListLesson(APIView):
+    pagination_class = LessonCursorPagination
+    list_fields = ['id', 'title', 'video_url', 'course_title', 'module_name', 'duration_seconds']
+
     def get(self, request):
-        queryset = Lesson.objects.all().select_related('module', 'module__course')
-        serializer = LessonSerializer(
-            queryset,
-            many=True,
-            fields=['id', 'title', 'video_url', 'course_title', 'module_name', 'duration_seconds'],
-            )
-        return Response(serializer.data)
+        # values()-backed projection: same JSON as LessonSerializer, no model instances
+        fields = requested_fields(request, self.list_fields)
+        projection = LessonProjection(fields)
+        queryset = projection.queryset(Lesson.objects.all(), extra_lookups=self.pagination_class.ordering)
+
+        stream = requested_stream_format(request)
+        if stream:
+            # index order (module_id, order, id): rows flow without a full sort first
+            return stream_queryset(queryset.order_by(*self.pagination_class.ordering), projection, stream)
+
+        paginator = self.pagination_class()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            return paginator.get_paginated_response(projection.many(page))
+
+        return Response(projection.many(queryset))
     
     
+# version stamp + 1 with LAG/LEAD; + 2 when the navigation index has to be built
+@query_budget(3)
 class LessonDetails(APIView):
     def get(self, request, id):
-        lesson = get_object_or_404(Lesson.objects.select_related('module', 'module__course'), id=id)
-        previous_lesson = Lesson.objects.filter(
-            module=lesson.module,
-            order__lt=lesson.order
-        ).order_by('-order').first()
-
-        next_lesson = Lesson.objects.filter(
-            module=lesson.module,
-            order__gt=lesson.order
-        ).order_by('order').first()
-
-        serializer = LessonSerializer(
-            lesson,
-            context={
-                'previous_lesson': previous_lesson,
-                'next_lesson': next_lesson
-            }
-        )
+        fields = requested_fields(request, LessonSerializer.Meta.fields)
+        # the lesson shows its course's tree (titles, neighbours): that's its version
+        stamp = curriculum_stamp(course__modules__lessons=id)
+        if stamp is None:
+            raise Http404
+        tag = etag(stamp, fields)
+        response = not_modified(request, stamp, tag)
+        if response is None:
+            response = stamped(self.build(id, fields), stamp, tag)
+        return response
+
+    def build(self, id, fields):
+        queryset = LessonSerializer.optimize_queryset(Lesson.objects.all(), fields)
+        navigation = {'previous_lesson', 'next_lesson'} & set(fields)
+
+        if not navigation:
+            lesson = get_object_or_404(queryset, id=id)
+            return Response(LessonSerializer(lesson, fields=fields).data)
+
+        if navigation_index_enabled():
+            # lesson + cached per-course index: O(1) neighbour lookup
+            lesson = get_object_or_404(queryset.annotate(course_id=F('module__course_id')), id=id)
+            previous_lesson, next_lesson = neighbours(get_navigation_index(lesson.course_id), lesson.id)
+            serializer = LessonSerializer(
+                lesson,
+                fields=fields,
+                context={
+                    'previous_lesson': previous_lesson,
+                    'next_lesson': next_lesson
+                }
+            )
+            return Response(serializer.data)
+
+        # lesson + prev/next (LAG/LEAD over the whole course) in one query
+        lesson = get_object_or_404(lesson_with_navigation(id, queryset))
+        serializer = LessonSerializer(lesson, fields=fields)
         return Response(serializer.data)
         
         
+# 1 when the document exists or the client's copy is current; + live build otherwise
+@query_budget(5)
 class CourseCurriculum(APIView):
 
     def get(self, request, slug):
+        # version stamps and the stored document in one indexed lookup (api/conditional.py)
+        tree, document, body = curriculum_stamps(slug)
+        if tree is None:
+            # unknown slug, or a course whose stats row isn't there yet
+            course_id = get_object_or_404(Course.objects.values_list('id', flat=True), slug=slug)
+        else:
+            course_id = tree.course_id
+        trending.record_view(course_id)
 
-        lessons_qs = Lesson.objects.annotate(
-            resources_count=Count('resources', distinct=True)
-        )
+        # the document may lag the tree by the rebuild delay: it has its own version
+        stamp = document or tree
+        if stamp is not None:
+            tag = etag(stamp)
+            response = not_modified(request, stamp, tag)
+            if response is not None:
+                return response
 
-        modules_qs = Module.objects.prefetch_related(
-            Prefetch('lessons', queryset=lessons_qs)
-        )
+        if document is not None:
+            # pre-rendered by the build_curriculum task, served as stored bytes
+            return stamped(HttpResponse(body, content_type='application/json'), stamp, tag)
 
-        course = get_object_or_404(
-            Course.objects.prefetch_related(
-                Prefetch('modules', queryset=modules_qs)
-            ),
-            slug=slug
+        # no document yet: answer live and have one built for next time
+        transaction.on_commit(lambda: schedule_curriculum_rebuild(course_id))
+        key = f"courses:curriculum:{slug}"
+        data = get_or_build(
+            f"{key}:v{stamp.version}" if stamp is not None else key,
+            lambda: CourseCurriculumSerializer(
+                get_object_or_404(curriculum_queryset(), slug=slug)
+            ).data,
+            scopes=[course_scope(course_id)],
         )
-
-        serializer = CourseCurriculumSerializer(course)
-        return Response(serializer.data)
+        response = Response(data)
+        return stamped(response, stamp, tag) if stamp is not None else response
     
     
+@query_budget(1)
+class TrendingCourses(APIView):
+    # ranked ids from the Redis sorted sets (api/trending.py), rows hydrated in one query
+
+    def get(self, request):
+        window = request.query_params.get('window', '24h')
+        if window not in trending.WINDOWS:
+            raise ValidationError({'window': [f'One of: {", ".join(trending.WINDOWS)}.']})
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        limit = max(1, min(limit, settings.TRENDING_MAX_LIMIT))
+
+        ranked = trending.top(window, limit)
+        if not ranked:
+            return Response({'window': window, 'results': []})
+        fields = requested_fields(request, CourseSerializer.Meta.fields)
+        queryset = CourseSerializer.optimize_queryset(
+            Course.objects.filter(id__in=[course_id for course_id, _ in ranked]), fields,
+        )
+        courses = {course.pk: course for course in queryset}
+        results = []
+        for course_id, score in ranked:
+            # deleted since it was counted
+            if course_id in courses:
+                results.append({**CourseSerializer(courses[course_id], fields=fields).data, 'score': score})
+        return Response({'window': window, 'results': results})
+
+
+@query_budget(1)
+class Search(APIView):
+    # ranked hits from the text index (FTS5 / tsvector + GIN, api/search.py), keyset pages
+    pagination_class = SearchCursorPagination
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        if not search_terms(query):
+            raise ValidationError({'q': ['Expected at least one word to search for.']})
+        paginator = self.pagination_class()
+        try:
+            hits = paginator.paginate_search(query, request)
+        except SearchUnavailable:
+            # no text index on this database backend (only SQLite FTS5 and Postgres have one)
+            return Response({'detail': 'Search is not available on this database.'}, status=501)
+        return paginator.get_paginated_response([
+            {
+                'kind': hit['kind'],
+                'id': hit['object_id'],
+                'title': hit['title'],
+                'course': {'id': hit['course_id'], 'title': hit['course_title'], 'slug': hit['course_slug']},
+            }
+            for hit in hits
+        ])
+
+
+class QueryMetrics(APIView):
+    # per-route query count / DB time collected by QueryTelemetryMiddleware
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(query_telemetry())
+
+
+class CacheMetrics(APIView):
+    # hit/miss counters of this process's two-tier cache (api/tiered_cache.py)
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        stats = getattr(cache, 'stats', None)
+        return Response(stats() if stats else {})
+
+
+@query_budget(16)
+class BulkCreateOrders(APIView):
+    # {"items": [{"product_id": 1, "quantity": 2}, ...]} -> one result per item
+    # constant in the batch size; SQLite's parameter limit splits the orders and
+    # events INSERTs into a few statements each
+
+    def post(self, request):
+        items = request.data.get('items') if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            raise ValidationError({'items': ['Expected a non-empty list of order items.']})
+        if len(items) > settings.ORDER_BATCH_LIMIT:
+            raise ValidationError({'items': [f'At most {settings.ORDER_BATCH_LIMIT} items per request.']})
+
+        results = [None] * len(items)
+        valid, positions = [], []
+        for index, item in enumerate(items):
+            serializer = OrderItemSerializer(data=item)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+                positions.append(index)
+            else:
+                results[index] = {'status': 'rejected', 'reason': 'invalid', 'errors': serializer.errors}
+
+        if valid:
+            for index, result in zip(positions, create_orders(valid)):
+                results[index] = result
+
+        created = sum(result['status'] == 'created' for result in results)
+        return Response({'created': created, 'rejected': len(results) - created, 'results': results})
+
+
+@query_budget(3)
+class EnrollmentProgress(APIView):
+    # players report every few seconds: POST only touches the Redis buffer
+    # (api/progress.py), the DB catches up within PROGRESS_FLUSH_INTERVAL
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        rows = Enrollment.objects.filter(user=request.user).order_by('course_id').values('course_id', 'progress')
+        return Response({'results': progress_buffer.merge(request.user.pk, rows)})
+
+    def post(self, request):
+        serializer = ProgressReportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        report = serializer.validated_data
+        progress_buffer.report(request.user.pk, report['course_id'], report['progress'])
+        return Response(status=202)
+
+
 from .tasks import send
 
 
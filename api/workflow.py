@@ -0,0 +1,50 @@
+"""
+Order status transitions for the Celery workflow.
+
+A step moves an order with one guarded UPDATE:
+
+    UPDATE api_order SET status = 'paid' WHERE id = ? AND status = 'stock_reserved'
+
+There is no read first and no full-row save(), so a retried or late step can
+never drag an order back from a later state - its UPDATE matches no row.
+
+Every completed step also leaves an idempotency key in the cache (written on
+commit). A Celery retry or a redelivered message finds the key and returns
+at once without touching the database. If the key has been evicted, the
+status guard still turns the step into a no-op.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Order
+
+Status = Order.Status
+
+# the happy path; FAILED is terminal and reachable before shipping
+PATH = [Status.PENDING, Status.STOCK_RESERVED, Status.CHARGING, Status.PAID, Status.SHIPPED]
+
+IDEMPOTENCY_TIMEOUT = 60 * 60 * 24
+
+
+def transition(order_id, expected, new):
+    """True when this call moved the order from `expected` to `new`."""
+    return Order.objects.filter(id=order_id, status=expected).update(status=new) == 1
+
+
+def reached(order_id, status):
+    """After a transition that matched nothing: is the order already at or past `status`?"""
+    current = Order.objects.filter(id=order_id).values_list('status', flat=True).first()
+    return current in PATH and PATH.index(current) >= PATH.index(status)
+
+
+def _step_key(step, order_id):
+    return f'order:{order_id}:{step}'
+
+
+def already_done(step, order_id):
+    return cache.get(_step_key(step, order_id)) is not None
+
+
+def mark_done(step, order_id):
+    # on commit: a rolled back step must stay retryable
+    transaction.on_commit(lambda: cache.set(_step_key(step, order_id), 1, IDEMPOTENCY_TIMEOUT))